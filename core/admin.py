@@ -1,4 +1,7 @@
-from django.contrib import admin
+from io import StringIO
+
+from django.contrib import admin, messages
+from django.core.management import call_command
 
 from core.models import (
     Detail,
@@ -8,6 +11,8 @@ from core.models import (
     Plan,
     Report,
     ReportEntry,
+    ShiftException,
+    ShiftTemplate,
     Step,
     Table,
     User,
@@ -26,6 +31,43 @@ class MachineAdmin(admin.ModelAdmin):
     list_display = ["id", "name"]
 
 
+class ShiftTemplateAdmin(admin.ModelAdmin):
+    """The calendar is generated from the templates, a changed template rebuilds it in the same transaction"""
+
+    list_display = ["name", "start", "is_night"]
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        # the slots copy the start and the night flag
+        if not change or {"start", "is_night"} & set(form.changed_data):
+            self.rebuild_shift_calendar(request)
+
+    def has_delete_permission(self, request, obj=None):
+        if obj is not None and not ShiftTemplate.objects.exclude(pk=obj.pk).exists():
+            return False
+        return super().has_delete_permission(request, obj)
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        self.rebuild_shift_calendar(request)
+
+    def delete_queryset(self, request, queryset):
+        if not ShiftTemplate.objects.exclude(pk__in=queryset.values("pk")).exists():
+            self.message_user(request, "Календарь смен не может остаться без шаблонов", messages.ERROR)
+            return
+        super().delete_queryset(request, queryset)
+        self.rebuild_shift_calendar(request)
+
+    def rebuild_shift_calendar(self, request):
+        call_command("rebuild_shift_calendar", stdout=StringIO())
+        self.message_user(request, "Календарь смен и данные по сменам пересобраны")
+
+
+class ShiftExceptionAdmin(admin.ModelAdmin):
+    list_display = ["day", "template", "reason"]
+    ordering = ["-day"]
+
+
 # Register your models here.
 admin.site.register(User)
 admin.site.register(Machine, MachineAdmin)
@@ -37,3 +79,5 @@ admin.site.register(OrderEntry, OrderEntryAdmin)
 admin.site.register(Table)
 admin.site.register(Plan)
 admin.site.register(Step)
+admin.site.register(ShiftTemplate, ShiftTemplateAdmin)
+admin.site.register(ShiftException, ShiftExceptionAdmin)
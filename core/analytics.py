@@ -0,0 +1,189 @@
+"""
+Production analytics of a range of months over the daily production rollup (see core.rollup).
+
+Each month of the range is summed per key, the user, the step or the detail, in one grouped query: the quantity
+and the shifts with reported output. The shifts of the total row come from one query for all the months. Month
+sums are cached under the month's rollup version, so only the months changed since are queried again. The last
+two weeks are summed per (day, key). The rest is computed on whole columns with pandas: the month-over-month
+deltas, the last week of the range against the week before it and the average quantity per shift. A night shift
+over the end of a month is counted in both months.
+
+pandas is heavy to import, the views load this module when the analytics are requested.
+"""
+
+import numpy as np
+import pandas as pd
+from django.core.cache import cache
+from django.db.models import Count, Sum
+from django.utils.timezone import localdate
+
+from .models import Detail, ProductionRollup, Step, User
+from .rollup import get_rollup_month_versions
+from .scripts import filter_production_rollup
+
+# {group: (rollup field, column title)}
+ANALYTICS_GROUPS = {
+    "user": ("user_id", "Пользователь"),
+    "step": ("step_id", "Этап"),
+    "detail": ("detail_id", "Деталь"),
+}
+MAX_ANALYTICS_MONTHS = 36
+ANALYTICS_TIMEOUT = 60 * 60 * 24 * 7
+# keys of the rows without a user or a detail and of the total row, primary keys are positive
+NO_KEY = -1
+TOTAL_KEY = 0
+
+
+def get_analytics_months(month_from, month_to):
+    """Returns the datetime64[M] months from month_from to month_to, both "YYYY-MM" """
+    months = np.arange(np.datetime64(month_from, "M"), np.datetime64(month_to, "M") + 1)
+    if not 0 < len(months) <= MAX_ANALYTICS_MONTHS:
+        raise ValueError(f"The range must have 1 to {MAX_ANALYTICS_MONTHS} months")
+    return months
+
+
+def get_analytics_range_start(month_to, months_count=12):
+    """Returns the first "YYYY-MM" month of the months_count months up to month_to"""
+    return str(np.datetime64(month_to, "M") - (months_count - 1))
+
+
+def get_rollup(start, end, user_pk=None, step_pk=None):
+    """Rollup rows with output of the days [start, end), datetime64[D] both"""
+    return filter_production_rollup(
+        ProductionRollup.objects.filter(entries__gt=0, day__gte=start.item(), day__lt=end.item()),
+        user_pk=user_pk,
+        step_pk=step_pk,
+    )
+
+
+def get_month_sums(month, field, user_pk=None, step_pk=None):
+    """Returns [(key, quantity, shifts)] of the month"""
+    rollup = get_rollup(month.astype("datetime64[D]"), (month + 1).astype("datetime64[D]"), user_pk, step_pk)
+    sums = rollup.values_list(field).annotate(quantity=Sum("quantity"), shifts=Count("shift", distinct=True))
+    return [(NO_KEY if key is None else key, quantity, shifts) for key, quantity, shifts in sums.order_by()]
+
+
+def get_month_shifts(months, user_pk=None, step_pk=None):
+    """Returns {"YYYY-MM": shifts with output} of the months, in one query"""
+    rollup = get_rollup(months[0].astype("datetime64[D]"), (months[-1] + 1).astype("datetime64[D]"), user_pk, step_pk)
+    rows = list(rollup.values_list("day", "shift").distinct().order_by())
+    days, shifts = zip(*rows, strict=True) if rows else ((), ())
+    frame = pd.DataFrame({"month": np.array(days, dtype="datetime64[D]").astype("datetime64[M]"), "shift": shifts})
+    counts = frame.drop_duplicates().groupby("month").size()
+    return {str(month): int(counts.get(month, 0)) for month in months}
+
+
+def get_months_frame(months, group, user_pk=None, step_pk=None):
+    """Returns the month sums of the months with the total rows, months are numbered by their position"""
+    field, _ = ANALYTICS_GROUPS[group]
+    labels = [str(month) for month in months]
+    versions = get_rollup_month_versions(labels)
+    keys = [f"analytics:{label}:{group}:{user_pk or ''}:{step_pk or ''}:{versions[label]}" for label in labels]
+    sums = cache.get_many(keys)
+    missing = [(month, label, key) for month, label, key in zip(months, labels, keys, strict=True) if key not in sums]
+    if missing:
+        # every row has one key, the total quantity is theirs, the shifts of the keys overlap
+        shifts = get_month_shifts([month for month, _, _ in missing], user_pk, step_pk)
+        for month, label, key in missing:
+            rows = get_month_sums(month, field, user_pk, step_pk)
+            sums[key] = [*rows, (TOTAL_KEY, sum(quantity for _, quantity, _ in rows), shifts[label])]
+        cache.set_many({key: sums[key] for _, _, key in missing}, timeout=ANALYTICS_TIMEOUT)
+
+    rows = [(position, *row) for position, key in enumerate(keys) for row in sums[key]]
+    return pd.DataFrame(np.array(rows, dtype=np.int64), columns=["month", "key", "quantity", "shifts"])
+
+
+def get_days_frame(start, end, group, user_pk=None, step_pk=None):
+    """Returns the quantities of the days [start, end) per (day, key), datetime64[D] both"""
+    field, _ = ANALYTICS_GROUPS[group]
+    rows = list(get_rollup(start, end, user_pk, step_pk).values_list("day", field).annotate(Sum("quantity")).order_by())
+    days, keys, quantities = zip(*rows, strict=True) if rows else ((), (), ())
+    return pd.DataFrame(
+        {
+            "day": np.array(days, dtype="datetime64[D]"),
+            "key": np.array([NO_KEY if key is None else key for key in keys], dtype=np.int64),
+            "quantity": np.array(quantities, dtype=np.int64),
+        }
+    )
+
+
+def get_key_names(group, keys):
+    if group == "user":
+        names = {pk: user.username for pk, user in User.objects.in_bulk(keys).items()}
+        return {**names, NO_KEY: "Без пользователя"}
+    if group == "step":
+        return {pk: step.name for pk, step in Step.objects.in_bulk(keys).items()}
+    names = {pk: detail.name for pk, detail in Detail.objects.in_bulk(keys).items()}
+    return {**names, NO_KEY: "Без детали"}
+
+
+def get_number(value):
+    # NaN, when there is nothing to compare with, is shown as an empty cell
+    return None if pd.isna(value) else value.item() if isinstance(value, np.generic) else value
+
+
+def get_production_analytics(month_from, month_to, group="user", user_pk=None, step_pk=None, today=None):
+    """
+    Returns the production analytics of the months from month_from to month_to ("YYYY-MM"), grouped by "user",
+    "step" or "detail" and filtered like the reports results:
+
+        {"months": [date], "week": (first day, last day), "rows": [row], "total": row}
+
+    A row is {"name", "months": [{"quantity", "delta", "percent"}], "total", "shifts", "per_shift", "week",
+    "previous_week", "week_delta", "week_percent"}, rows are sorted by total descending. The week is the last
+    seven days of the range up to today. Raises ValueError on invalid months, KeyError on an unknown group.
+    """
+    months = get_analytics_months(month_from, month_to)
+    week_end = min((months[-1] + 1).astype("datetime64[D]") - 1, np.datetime64(today or localdate(), "D"))
+
+    # the month before the range gives the first month its delta
+    frame = get_months_frame(np.concatenate([[months[0] - 1], months]), group, user_pk, step_pk)
+    by_month = frame.pivot_table("quantity", index="key", columns="month", aggfunc="sum", fill_value=0)
+    by_month = by_month.reindex(columns=range(len(months) + 1), fill_value=0)
+    previous = by_month.iloc[:, :-1].to_numpy()
+    quantities = by_month.iloc[:, 1:].to_numpy()
+    deltas = quantities - previous
+    with np.errstate(divide="ignore", invalid="ignore"):
+        percents = np.where(previous > 0, deltas / previous * 100, np.nan)
+
+    days = get_days_frame(week_end - 13, week_end + 1, group, user_pk, step_pk)
+    # days before the end of the week, pandas keeps the days in seconds
+    age = (week_end - days["day"].to_numpy()).astype("timedelta64[D]").astype(np.int64)
+    days["week"] = days["quantity"].where(age < 7, 0)
+    days["previous_week"] = days["quantity"].where(age >= 7, 0)
+    weeks = days.groupby("key")[["week", "previous_week"]].sum()
+    weeks.loc[TOTAL_KEY] = weeks.sum()
+
+    in_range = frame[frame["month"] > 0]
+    by_key = pd.DataFrame(
+        {
+            "total": in_range.groupby("key")["quantity"].sum(),
+            "shifts": in_range.groupby("key")["shifts"].sum(),
+            "week": weeks["week"],
+            "previous_week": weeks["previous_week"],
+        }
+    )
+    by_key = by_key.reindex(by_month.index).fillna(0).astype(np.int64)
+    by_key["per_shift"] = by_key["total"] / by_key["shifts"].where(by_key["shifts"] > 0)
+    by_key["week_delta"] = by_key["week"] - by_key["previous_week"]
+    by_key["week_percent"] = by_key["week_delta"] / by_key["previous_week"].where(by_key["previous_week"] > 0) * 100
+
+    names = get_key_names(group, [key for key in by_month.index if key not in (NO_KEY, TOTAL_KEY)])
+    rows = {
+        key: {
+            "name": "ИТОГО" if key == TOTAL_KEY else names.get(key, key),
+            "months": [
+                {"quantity": get_number(quantity), "delta": get_number(delta), "percent": get_number(percent)}
+                for quantity, delta, percent in zip(quantities[i], deltas[i], percents[i], strict=True)
+            ],
+            **{column: get_number(value) for column, value in values.items()},
+        }
+        for i, (key, values) in enumerate(zip(by_key.index, by_key.to_dict("records"), strict=True))
+    }
+    total = rows.pop(TOTAL_KEY)
+    return {
+        "months": [month.astype("datetime64[D]").item() for month in months],
+        "week": ((week_end - 6).item(), week_end.item()),
+        "rows": sorted(rows.values(), key=lambda row: row["total"], reverse=True),
+        "total": total,
+    }
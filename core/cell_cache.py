@@ -0,0 +1,80 @@
+"""
+Cache of rendered shifts table rows.
+
+The cells of a row, a shift of a step, are cached together under the version of the row and the table version,
+see core.versions. The receivers in core.signals replace the version of a row after commit once per transaction
+whenever a plan, plan entry, report or report entry of one of its cells changes. The table version changes with
+the details, orders and machines shown in every cell.
+
+The versions are in the database, the rows in the "fragments" cache of each process, see settings.
+"""
+
+import datetime
+
+from django.core.cache import caches
+from django.db import transaction
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from .refreshes import schedule_refresh
+from .shifts import get_shifts
+from .versions import get_versions, replace_versions
+
+FRAGMENTS_CACHE_ALIAS = "fragments"
+TABLE_VERSION_KEY = "table_cells_version"
+ROW_TIMEOUT = 60 * 60 * 24
+
+
+def get_row_version_key(row):
+    step_id, shift = row
+    return f"row_version:{step_id}:{shift.astimezone(datetime.timezone.utc).isoformat()}"
+
+
+def replace_row_versions(cells):
+    cells = list(cells)
+    shifts = get_shifts([date for _, _, date in cells])
+    rows = {(step_id, shift) for (step_id, _, _), shift in zip(cells, shifts, strict=True)}
+    replace_versions(map(get_row_version_key, rows))
+
+
+def invalidate_cells(cells):
+    """Replaces after commit the versions of the rows of (step_id, machine_id, date) cells, any time of the shift"""
+    schedule_refresh(replace_row_versions, {cell for cell in cells if None not in cell})
+
+
+def invalidate_table_cells():
+    transaction.on_commit(lambda: replace_versions([TABLE_VERSION_KEY]))
+
+
+def get_row_versions(rows):
+    """Returns {(step_id, shift): version} of the rows"""
+    return get_versions({row: [get_row_version_key(row), TABLE_VERSION_KEY] for row in rows})
+
+
+def get_row_html_key(row, version, cells):
+    # the overload warnings come from the throughput table, which has no versions
+    overloaded = "".join(str(int(cell.overloaded)) for cell in cells)
+    return f"row_html:{get_row_version_key(row)}:{version}:{overloaded}"
+
+
+def render_table_cells(rows, versions):
+    """
+    Renders the html of the content TableCells of {(step_id, shift): cells} rows of a shifts table, rows of
+    unchanged versions come from cache
+    """
+    cache = caches[FRAGMENTS_CACHE_ALIAS]
+    html_keys = {row: get_row_html_key(row, versions[row], cells) for row, cells in rows.items()}
+    cached = cache.get_many(html_keys.values()) if html_keys else {}
+
+    rendered = {}
+    for row, cells in rows.items():
+        html_key = html_keys[row]
+        if html_key in cached and len(cached[html_key]) == len(cells):
+            for cell, html in zip(cells, cached[html_key], strict=True):
+                cell.html = mark_safe(html)  # noqa: S308
+            continue
+        for cell in cells:
+            cell.html = render_to_string("core/stats.html#content_cell", {"cell": cell})
+        rendered[html_key] = [str(cell.html) for cell in cells]
+    if rendered:
+        cache.set_many(rendered, timeout=ROW_TIMEOUT)
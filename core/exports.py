@@ -0,0 +1,68 @@
+"""
+File exports of report tables.
+
+Rows are written one by one as they come from the iterator: XLSX through a write-only openpyxl workbook
+saved to a temporary file and streamed back in chunks, CSV straight into a StreamingHttpResponse.
+"""
+
+import csv
+import itertools
+import tempfile
+
+from django.http import FileResponse, StreamingHttpResponse
+from openpyxl import Workbook
+from openpyxl.utils import get_column_letter
+
+XLSX_CONTENT_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+# a write-only sheet needs its column widths before the first row, they are measured on the first rows
+WIDTH_SAMPLE_ROWS = 1000
+
+
+def get_column_widths(rows):
+    widths = {}
+    for row in rows:
+        for i, value in enumerate(row, start=1):
+            widths[i] = max(widths.get(i, 0), len(str(value if value is not None else "")))
+    return {i: width + 2 for i, width in widths.items()}
+
+
+def xlsx_response(filename, sheet_title, header, rows):
+    rows = iter(rows)
+    sample = list(itertools.islice(rows, WIDTH_SAMPLE_ROWS))
+
+    workbook = Workbook(write_only=True)
+    worksheet = workbook.create_sheet(sheet_title)
+    for i, width in get_column_widths([header, *sample]).items():
+        worksheet.column_dimensions[get_column_letter(i)].width = width
+
+    worksheet.append(header)
+    for row in itertools.chain(sample, rows):
+        worksheet.append(row)
+
+    # the file is closed by the response once it is sent
+    file = tempfile.TemporaryFile()
+    workbook.save(file)
+    file.seek(0)
+    return FileResponse(file, as_attachment=True, filename=filename, content_type=XLSX_CONTENT_TYPE)
+
+
+class Echo:
+    def write(self, value):
+        return value
+
+
+def csv_response(filename, header, rows):
+    # ";" and BOM, so Excel with the russian locale opens it as is
+    writer = csv.writer(Echo(), delimiter=";")
+    lines = itertools.chain(["\ufeff"], (writer.writerow(row) for row in itertools.chain([header], rows)))
+    response = StreamingHttpResponse(lines, content_type="text/csv; charset=utf-8")
+    response["Content-Disposition"] = f"attachment; filename={filename}"
+    return response
+
+
+def export_response(export_format, filename, sheet_title, header, rows):
+    """Returns the rows as a CSV file if export_format is "csv", as XLSX otherwise"""
+    if export_format == "csv":
+        return csv_response(f"{filename}.csv", header, rows)
+    return xlsx_response(f"{filename}.xlsx", sheet_title, header, rows)
@@ -220,10 +220,11 @@ class MachineForm(forms.ModelForm):
 
     class Meta:
         model = Machine
-        fields = ["name", "step"]
+        fields = ["name", "step", "shift_capacity"]
         labels = {
             "name": "Название",
             "step": "Этап",
+            "shift_capacity": "Мощность за смену",
         }
 
 
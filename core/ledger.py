@@ -0,0 +1,172 @@
+"""
+Ledger of reported and planned quantities per order entry and step (OrderLedger).
+
+get_orders_display reads leftovers from the ledger instead of walking every report and plan entry.
+The receivers in core.signals refresh the ledger of the orders touched by a save or delete once per transaction,
+rebuild_order_ledger rebuilds it from scratch.
+
+A plan is not counted when its cell (step, machine, shift) already has a report of an order
+with the same activity as the plan's order, the report supersedes it.
+"""
+
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Q, Sum
+from django.utils.timezone import now
+
+from .models import Order, OrderEntry, OrderLedger, PlanEntry, ReportEntry
+from .refreshes import schedule_refresh
+from .scripts import PLAN_EXPIRY
+from .shifts import MAX_SHIFT_DURATION, get_shift_ends, get_shifts
+
+
+def get_reported_cells(cells):
+    """Returns {cell: {is_active of the reported orders}} for the given cells (step_id, machine_id, shift)"""
+    reported_cells = defaultdict(set)
+    if not cells:
+        return reported_cells
+    shifts = [shift for _, _, shift in cells]
+    ends = get_shift_ends(shifts)
+    report_entries = list(
+        ReportEntry.objects.filter(
+            report__order__isnull=False,
+            report__step_id__in={step_id for step_id, _, _ in cells},
+            machine_id__in={machine_id for _, machine_id, _ in cells},
+            report__date__gte=min(shifts),
+            report__date__lt=max(ends.values()),
+        ).values_list("report__step_id", "machine_id", "report__date", "report__order__is_active")
+    )
+    entry_shifts = get_shifts([date for _, _, date, _ in report_entries])
+    for (step_id, machine_id, _, is_active), shift in zip(report_entries, entry_shifts, strict=True):
+        cell = (step_id, machine_id, shift)
+        if cell in cells:
+            reported_cells[cell].add(is_active)
+    return reported_cells
+
+
+def get_planned_order_ids(cells):
+    """Returns ids of orders planned on the given cells (step_id, machine_id, shift)"""
+    if not cells:
+        return set()
+    ends = get_shift_ends([shift for _, _, shift in cells])
+    query = Q()
+    for step_id, machine_id, shift in cells:
+        query |= Q(
+            plan__step_id=step_id,
+            plan__machine_id=machine_id,
+            plan__date__gte=shift,
+            plan__date__lt=ends[shift],
+        )
+    return set(PlanEntry.objects.filter(query).values_list("order_id", flat=True))
+
+
+def get_order_cells_order_ids(order_id):
+    """Returns ids of orders planned on the cells reported by the order, they depend on the order activity"""
+    report_entries = list(
+        ReportEntry.objects.filter(
+            report__order_id=order_id, report__date__gt=now() - PLAN_EXPIRY - MAX_SHIFT_DURATION
+        ).values_list("report__step_id", "machine_id", "report__date")
+    )
+    shifts = get_shifts([date for _, _, date in report_entries])
+    return get_planned_order_ids(
+        {(step_id, machine_id, shift) for (step_id, machine_id, _), shift in zip(report_entries, shifts, strict=True)}
+    )
+
+
+def compute_order_ledger(order_ids):
+    """Returns unsaved OrderLedger rows of the given orders"""
+    order_entries = defaultdict(list)
+    for pk, order_id, detail_id in OrderEntry.objects.filter(order_id__in=order_ids).values_list(
+        "pk", "order_id", "detail_id"
+    ):
+        order_entries[(order_id, detail_id)].append(pk)
+
+    ledger = []
+    reported = (
+        ReportEntry.objects.filter(report__order_id__in=order_ids)
+        .values("report__order_id", "report__step_id", "detail_id")
+        .annotate(quantity=Sum("quantity"))
+    )
+    for row in reported:
+        for order_entry_id in order_entries[(row["report__order_id"], row["detail_id"])]:
+            ledger.append(
+                OrderLedger(order_entry_id=order_entry_id, step_id=row["report__step_id"], reported=row["quantity"])
+            )
+
+    # expired plans never count again, they are not stored
+    planned = list(
+        PlanEntry.objects.filter(order_id__in=order_ids, plan__date__gt=now() - PLAN_EXPIRY)
+        .values("order_id", "detail_id", "plan__step_id", "plan__machine_id", "plan__date")
+        .annotate(quantity=Sum("quantity"))
+    )
+    cells = [
+        (row["plan__step_id"], row["plan__machine_id"], shift)
+        for row, shift in zip(planned, get_shifts([row["plan__date"] for row in planned]), strict=True)
+    ]
+    reported_cells = get_reported_cells(set(cells))
+    for row, cell in zip(planned, cells, strict=True):
+        if not row["quantity"]:
+            continue
+        reported_by = reported_cells.get(cell, set())
+        for order_entry_id in order_entries[(row["order_id"], row["detail_id"])]:
+            ledger.append(
+                OrderLedger(
+                    order_entry_id=order_entry_id,
+                    step_id=row["plan__step_id"],
+                    date=row["plan__date"],
+                    planned=row["quantity"],
+                    reported_by_active=True in reported_by,
+                    reported_by_inactive=False in reported_by,
+                )
+            )
+    return ledger
+
+
+def refresh_order_ledger(order_ids):
+    order_ids = {order_id for order_id in order_ids if order_id is not None}
+    if not order_ids:
+        return
+    with transaction.atomic():
+        # locking the orders serializes concurrent refreshes of the same order
+        list(Order.objects.select_for_update().filter(pk__in=order_ids).values_list("pk", flat=True))
+        OrderLedger.objects.filter(order_entry__order_id__in=order_ids).delete()
+        OrderLedger.objects.bulk_create(compute_order_ledger(order_ids))
+
+
+def refresh_report_entries_ledger(report_entries):
+    """
+    Refreshes the ledger of the orders of (order_id, step_id, machine_id, date) report entries
+    and of the orders planned on their cells
+    """
+    order_ids = {order_id for order_id, _, _, _ in report_entries}
+    report_entries = [
+        (step_id, machine_id, date)
+        for _, step_id, machine_id, date in report_entries
+        if None not in (step_id, machine_id, date)
+    ]
+    shifts = get_shifts([date for _, _, date in report_entries])
+    cells = {
+        (step_id, machine_id, shift) for (step_id, machine_id, _), shift in zip(report_entries, shifts, strict=True)
+    }
+    refresh_order_ledger(order_ids | get_planned_order_ids(cells))
+
+
+def schedule_report_entries_ledger_refresh(report_entries):
+    """Refreshes after commit the ledger of (order_id, step_id, machine_id, date) report entries"""
+    schedule_refresh(refresh_report_entries_ledger, report_entries)
+
+
+def schedule_order_ledger_refresh(order_ids):
+    # an order alone is a report entry without a cell
+    schedule_report_entries_ledger_refresh(
+        {(order_id, None, None, None) for order_id in order_ids if order_id is not None}
+    )
+
+
+def rebuild_order_ledger(batch_size=500):
+    order_ids = list(Order.objects.order_by("pk").values_list("pk", flat=True))
+    with transaction.atomic():
+        OrderLedger.objects.all().delete()
+        for i in range(0, len(order_ids), batch_size):
+            OrderLedger.objects.bulk_create(compute_order_ledger(order_ids[i : i + batch_size]), batch_size=1000)
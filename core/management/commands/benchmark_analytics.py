@@ -0,0 +1,128 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Sum
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from core.analytics import ANALYTICS_GROUPS, get_analytics_range_start, get_production_analytics
+from core.management.seeding import Rollback, seed_production_data
+from core.models import Report, ReportEntry
+from core.rollup import (
+    get_report_partition,
+    invalidate_production_rollup,
+    rebuild_production_rollup,
+    refresh_production_rollup,
+)
+from core.scripts import get_month_range
+
+# report entry fields of the analytics groups
+REPORT_ENTRY_FIELDS = {"user": "report__user_id", "step": "report__step_id", "detail": "detail_id"}
+# time a range may take, cached or not, by database vendor: SQLite sorts the rows of each month sum in a
+# temporary b-tree, the cold detail range takes 200-310 ms there
+BUDGETS_MS = {
+    "postgresql": 200,
+    "sqlite": 400,
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure the production analytics of the last months on a generated year of reports "
+        "(runs in a rolled back transaction)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--orders", type=int, default=3000)
+        parser.add_argument("--report-entries", type=int, default=200_000)
+        parser.add_argument("--months", type=int, default=12)
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument(
+            "--budget-ms", type=float, help="Time a range may take, cached or not, by default the database's budget"
+        )
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        budget = options["budget_ms"] or BUDGETS_MS.get(connection.vendor)
+        if budget is None:
+            raise CommandError(f"No budget for {connection.vendor}, set --budget-ms")
+
+        random.seed(options["seed"])
+        month_to = timezone.localtime().strftime("%Y-%m")
+        month_from = get_analytics_range_start(month_to, options["months"])
+        slow = []
+        try:
+            with transaction.atomic():
+                seed_production_data(options["orders"], options["report_entries"], 0, history_days=365)
+                self.measure("rebuild_production_rollup", rebuild_production_rollup)
+                self.stdout.write(f"Generated {options['report_entries']} report entries, analytics {month_from} - {month_to}")
+
+                for group in ANALYTICS_GROUPS:
+                    # nothing cached, all months cached, and the current month changed by a new report entry
+                    for name, before in [
+                        ("cold", invalidate_production_rollup),
+                        ("cached", None),
+                        ("current month changed", self.add_report_entry),
+                    ]:
+                        median = self.measure_analytics(group, name, month_from, month_to, options["repeat"], before)
+                        if median > budget:
+                            slow.append(f"{group}, {name}: {median:.1f} ms")
+                    analytics = get_production_analytics(month_from, month_to, group)
+                    self.check_totals(group, month_from, month_to, analytics)
+                raise Rollback
+        except Rollback:
+            pass
+        finally:
+            # the analytics of the generated data are cached under the current versions
+            invalidate_production_rollup()
+
+        if slow:
+            raise CommandError(f"Over the {budget:.0f} ms budget of {connection.vendor}: {', '.join(slow)}")
+        self.stdout.write(self.style.SUCCESS(f"All groups within the {budget:.0f} ms budget of {connection.vendor}"))
+
+    def measure_analytics(self, group, name, month_from, month_to, repeat, before=None):
+        """Returns the median time of the analytics in ms, before is called ahead of each run"""
+        times = []
+        for _ in range(repeat):
+            if before is not None:
+                before()
+            with CaptureQueriesContext(connection) as queries:
+                start = time.perf_counter()
+                get_production_analytics(month_from, month_to, group)
+                times.append((time.perf_counter() - start) * 1000)
+        self.stdout.write(
+            f"{group}, {name}: median {statistics.median(times):.1f} ms, min {min(times):.1f} ms, "
+            f"{len(queries)} queries"
+        )
+        return statistics.median(times)
+
+    def add_report_entry(self):
+        report = Report.objects.filter(reportentry__isnull=False).latest("date")
+        entry = report.reportentry_set.first()
+        ReportEntry.objects.create(report=report, machine=entry.machine, detail=entry.detail, quantity=1)
+        # the receivers refresh the rollup after commit, the benchmark never commits
+        refresh_production_rollup({get_report_partition(report.date, report.step_id)})
+
+    def measure(self, name, function):
+        start = time.perf_counter()
+        result = function()
+        self.stdout.write(f"{name}: {time.perf_counter() - start:.3f} s")
+        return result
+
+    def check_totals(self, group, month_from, month_to, analytics):
+        # the totals of the rollup against the report entries
+        start, _ = get_month_range(month_from)
+        _, end = get_month_range(month_to)
+        expected = sorted(
+            ReportEntry.objects.filter(report__date__gte=start, report__date__lt=end)
+            .values(REPORT_ENTRY_FIELDS[group])
+            .annotate(total=Sum("quantity"))
+            .order_by()
+            .values_list("total", flat=True)
+        )
+        found = sorted(row["total"] for row in analytics["rows"])
+        if found != expected:
+            raise CommandError(f"{group}: the totals differ from the report entries")
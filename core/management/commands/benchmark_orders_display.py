@@ -0,0 +1,76 @@
+import json
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from core.ledger import rebuild_order_ledger
+from core.management.seeding import Rollback, seed_production_data
+from core.models import Step
+from core.scripts import (
+    get_leftovers,
+    get_orders_display,
+    get_orders_queryset,
+    get_orders_totals,
+    get_orders_totals_recomputed,
+)
+
+
+class Command(BaseCommand):
+    help = "Measure orders leftovers on generated data (runs in a rolled back transaction)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--orders", type=int, default=300)
+        parser.add_argument("--report-entries", type=int, default=100_000)
+        parser.add_argument("--plan-entries", type=int, default=20_000)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        random.seed(options["seed"])
+        try:
+            with transaction.atomic():
+                seed_production_data(options["orders"], options["report_entries"], options["plan_entries"])
+                self.stdout.write(
+                    f"Generated {options['orders']} orders, {options['report_entries']} report entries, "
+                    f"{options['plan_entries']} plan entries"
+                )
+                self.measure("rebuild_order_ledger", rebuild_order_ledger)
+                self.measure("get_orders_display", lambda: get_orders_display(is_active=True))
+                self.compare()
+                self.compare_order()
+                raise Rollback
+        except Rollback:
+            pass
+
+    def measure(self, name, function):
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            result = function()
+            elapsed = time.perf_counter() - start
+        self.stdout.write(f"{name}: {elapsed:.3f} s, {len(queries)} queries")
+        return result
+
+    def compare(self):
+        steps = Step.objects.all().order_by("id")
+        orders = get_orders_queryset(is_active=True)
+        ledger = self.measure("get_orders_totals (ledger)", lambda: get_orders_totals(orders))
+        recomputed = self.measure("get_orders_totals_recomputed", lambda: get_orders_totals_recomputed(orders))
+        if json.dumps(get_leftovers(steps, orders, ledger), sort_keys=True) != json.dumps(
+            get_leftovers(steps, orders, recomputed), sort_keys=True
+        ):
+            raise CommandError("Leftovers from the ledger differ from the recomputation")
+
+    def compare_order(self):
+        steps, orders, leftovers, orders_stats = get_orders_display(is_active=True)
+        order = random.choice(list(orders))
+        _, _, order_leftovers, order_stats = self.measure(
+            "get_orders_display (order_id)", lambda: get_orders_display(order_id=order.pk)
+        )
+        for order_entry in order.orderentry_set.all():
+            for step in steps:
+                if order_leftovers[step.pk][order_entry.pk] != leftovers[step.pk][order_entry.pk]:
+                    raise CommandError(f"Leftovers of order {order.pk} differ from the ones of all orders")
+        if json.dumps(order_stats[order.pk], sort_keys=True) != json.dumps(orders_stats[order.pk], sort_keys=True):
+            raise CommandError(f"Stats of order {order.pk} differ from the ones of all orders")
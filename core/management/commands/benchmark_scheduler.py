@@ -0,0 +1,87 @@
+import random
+import time
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils.timezone import now
+
+from core.management.seeding import Rollback, seed_production_data
+from core.models import Machine, PlanEntry
+from core.planning import apply_plan_operations
+from core.scheduler import get_schedule, get_schedule_operations
+from core.scripts import get_orders_display
+from core.shifts import ShiftStart, get_shift, get_shifts
+from core.throughput import get_shift_rate, get_throughput, rebuild_throughput
+
+
+class Command(BaseCommand):
+    help = "Measure the automatic planning of a step on generated data (runs in a rolled back transaction)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--orders", type=int, default=300)
+        parser.add_argument("--machines", type=int, default=20, help="Machines per step")
+        parser.add_argument("--shifts", type=int, default=28)
+        parser.add_argument("--report-entries", type=int, default=20_000)
+        parser.add_argument("--plan-entries", type=int, default=5_000)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        random.seed(options["seed"])
+        try:
+            with transaction.atomic():
+                seed_production_data(
+                    options["orders"],
+                    options["report_entries"],
+                    options["plan_entries"],
+                    machines_count=options["machines"],
+                )
+                self.measure("rebuild_throughput", rebuild_throughput)
+                step_id = Machine.objects.order_by("-id").values_list("step_id", flat=True).first()
+                start = get_shift(now())
+                self.stdout.write(
+                    f"Generated {options['orders']} orders, {options['machines']} machines per step, "
+                    f"planning {options['shifts']} shifts"
+                )
+
+                entries = self.measure("get_schedule", lambda: get_schedule(step_id, start, options["shifts"]))
+                self.stdout.write(f"Proposed {len(entries)} plan entries")
+                self.check_schedule(step_id, entries)
+                operations = get_schedule_operations(entries)
+                self.measure("apply_plan_operations", lambda: apply_plan_operations(operations))
+                raise Rollback
+        except Rollback:
+            pass
+
+    def measure(self, name, function):
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            result = function()
+            elapsed = time.perf_counter() - start
+        self.stdout.write(f"{name}: {elapsed:.3f} s, {len(queries)} queries")
+        return result
+
+    def check_schedule(self, step_id, entries):
+        machines = {machine.pk: machine for machine in Machine.objects.filter(step_id=step_id)}
+        throughput = get_throughput(machines, step_id)
+        load = defaultdict(float)
+        for machine_id, shift, detail_id, quantity in PlanEntry.objects.filter(plan__step_id=step_id).values_list(
+            "plan__machine_id", ShiftStart("plan__date"), "detail_id", "quantity"
+        ):
+            load[(machine_id, shift)] += (quantity or 0) / get_shift_rate(throughput, machines[machine_id], detail_id)
+        scheduled = defaultdict(int)
+        proposed_cells = set()
+        for entry, shift in zip(entries, get_shifts([entry["date"] for entry in entries]), strict=True):
+            machine, detail_id = entry["machine"], entry["order_entry"].detail_id
+            load[(machine.pk, shift)] += entry["quantity"] / get_shift_rate(throughput, machine, detail_id)
+            scheduled[entry["order_entry"].pk] += entry["quantity"]
+            proposed_cells.add((machine.pk, shift))
+
+        for machine_id, shift in proposed_cells:
+            if load[(machine_id, shift)] > 1 + 1e-9:
+                raise CommandError(f"Machine {machine_id} is planned over a shift at {shift}")
+        _, _, leftovers, _ = get_orders_display(is_active=True)
+        for order_entry_pk, quantity in scheduled.items():
+            if quantity > -leftovers[step_id][order_entry_pk]["reports_and_plans"]:
+                raise CommandError(f"Order entry {order_entry_pk} is planned over its leftover")
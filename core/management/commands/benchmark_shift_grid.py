@@ -0,0 +1,77 @@
+import datetime
+import statistics
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import Machine, ShiftSlot
+from core.scripts import ShiftGrid, TableCell
+
+
+def build_grid(slots, machines):
+    grid = ShiftGrid(slots, machines, 1)
+    return grid, grid.get_rows()
+
+
+def build_display_dicts(slots, machines):
+    # the former table: cells in a dict keyed by (shift, machine pk) and a display dict per cell
+    cells = {
+        (slot.start, machine.pk): TableCell(date=slot.start, machine=machine, step_id=1)
+        for slot in slots
+        for machine in machines
+    }
+    rows = [
+        [TableCell(slot=slot).get_display(), *(cells[(slot.start, machine.pk)].get_display() for machine in machines)]
+        for slot in slots
+    ]
+    return cells, rows
+
+
+def measure(build, slots, machines, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        build(slots, machines)
+        times.append((time.perf_counter() - start) * 1000)
+    tracemalloc.start()
+    table = build(slots, machines)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del table
+    return statistics.median(times), size
+
+
+class Command(BaseCommand):
+    help = "Measure the time and memory of the shifts table grid against a display dict per cell (no database access)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--machines", type=int, default=40)
+        parser.add_argument("--shifts", type=int, default=90)
+        parser.add_argument("--repeat", type=int, default=20)
+        parser.add_argument("--budget-ms", type=float, default=20, help="Time the grid may take")
+
+    def handle(self, *args, **options):
+        machines = [Machine(pk=pk, name=f"Станок №{pk}") for pk in range(1, options["machines"] + 1)]
+        first = datetime.datetime(2024, 1, 1, 3, tzinfo=datetime.timezone.utc)
+        starts = [first + datetime.timedelta(hours=12 * i) for i in range(options["shifts"] + 1)]
+        slots = [
+            ShiftSlot(start=start, end=end, day=start.date(), number=i % 2, is_night=i % 2 == 1, is_working=True)
+            for i, (start, end) in enumerate(zip(starts, starts[1:], strict=False))
+        ]
+
+        self.stdout.write(f"{options['shifts']} shifts x {options['machines']} machines")
+        results = {}
+        for name, build in [("grid", build_grid), ("display dicts", build_display_dicts)]:
+            results[name] = measure(build, slots, machines, options["repeat"])
+            median, size = results[name]
+            self.stdout.write(f"  {name}: median {median:.1f} ms, {size / 1024:.0f} KiB")
+
+        median, size = results["grid"]
+        self.stdout.write(
+            f"The grid takes {median / results['display dicts'][0]:.0%} of the time "
+            f"and {size / results['display dicts'][1]:.0%} of the memory"
+        )
+        if median > options["budget_ms"]:
+            raise CommandError(f"Over the {options['budget_ms']:.0f} ms budget")
+        self.stdout.write(self.style.SUCCESS(f"Within {options['budget_ms']:.0f} ms"))
@@ -0,0 +1,42 @@
+import datetime
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import Machine
+from core.scripts import TableCell
+
+
+class Command(BaseCommand):
+    help = "Measure the display of the cells of a shifts table grid, ids included (no database access)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--machines", type=int, default=50)
+        parser.add_argument("--shifts", type=int, default=56)
+        parser.add_argument("--repeat", type=int, default=20)
+        parser.add_argument("--budget-ms", type=float, default=50, help="Time the grid may take")
+
+    def handle(self, *args, **options):
+        machines = [Machine(pk=pk, name=f"Станок ЧПУ №{pk}") for pk in range(1, options["machines"] + 1)]
+        first = datetime.datetime(2024, 1, 1, 3, tzinfo=datetime.timezone.utc)
+        shifts = [first + datetime.timedelta(hours=12 * i) for i in range(options["shifts"])]
+        cells = [TableCell(date=shift, machine=machine, step_id=1) for shift in shifts for machine in machines]
+
+        times = []
+        for _ in range(options["repeat"]):
+            start = time.perf_counter()
+            displays = [cell.get_display() for cell in cells]
+            times.append((time.perf_counter() - start) * 1000)
+        ids = {display["id"] for display in displays}
+        if len(ids) != len(cells):
+            raise CommandError(f"{len(cells) - len(ids)} cells share their ids")
+
+        median = statistics.median(times)
+        self.stdout.write(
+            f"{options['shifts']} shifts x {options['machines']} machines: median {median:.1f} ms, "
+            f"min {min(times):.1f} ms, {median * 1000 / len(cells):.2f} µs per cell"
+        )
+        if median > options["budget_ms"]:
+            raise CommandError(f"Over the {options['budget_ms']:.0f} ms budget")
+        self.stdout.write(self.style.SUCCESS(f"Within {options['budget_ms']:.0f} ms"))
@@ -0,0 +1,81 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from core.management.seeding import Rollback
+from core.models import Machine, Plan, Step
+from core.scripts import get_shifts_grids, get_shifts_table
+from core.shifts import get_shift, get_shift_range, get_window_slots
+
+# shift table: slots + machines + row versions + plans with 3 prefetches + report entries + throughput of the
+# planned machines
+SHIFTS_TABLE_MAX_QUERIES = 9
+# shift grids of several steps: the same queries without the slots, whatever the number of steps
+SHIFTS_GRIDS_MAX_QUERIES = 8
+
+
+class Command(BaseCommand):
+    help = "Check that hot pages stay within their query budget (runs in a rolled back transaction)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--machines", type=int, default=12)
+        parser.add_argument("--shifts", type=int, default=28)
+        parser.add_argument("--steps", type=int, default=4, help="Steps of the shift grids")
+
+    def handle(self, *args, **options):
+        failures = []
+        try:
+            with transaction.atomic():
+                failures += self.check_shifts_table(options["machines"], options["shifts"])
+                failures += self.check_shifts_grids(options["machines"], options["steps"])
+                raise Rollback
+        except Rollback:
+            pass
+
+        if failures:
+            raise CommandError("\n".join(failures))
+        self.stdout.write(self.style.SUCCESS("All query budgets are met"))
+
+    def check_shifts_table(self, machines_count, shifts_count):
+        step = Step.objects.create(name="query budget")
+        Machine.objects.bulk_create([Machine(name=f"Станок {i}", step=step) for i in range(machines_count)])
+        # far future window, so no cell is filled yet
+        cold_date = get_shift(timezone.now() + datetime.timedelta(days=3650))
+        # the slots of the window are generated by its first reader only
+        get_shift_range(cold_date, shifts_count)
+
+        failures = []
+        for window in ["cold", "warm"]:
+            with CaptureQueriesContext(connection) as queries:
+                get_shifts_table(cold_date, step.pk, shifts_count=shifts_count)
+            self.stdout.write(f"get_shifts_table ({window} window): {len(queries)} queries")
+            if len(queries) > SHIFTS_TABLE_MAX_QUERIES:
+                failures.append(
+                    f"get_shifts_table ({window} window) made {len(queries)} queries, "
+                    f"budget is {SHIFTS_TABLE_MAX_QUERIES}"
+                )
+
+        # empty cells are virtual, reading the table must not write
+        plans_count = Plan.objects.filter(step=step).count()
+        if plans_count:
+            failures.append(f"get_shifts_table created {plans_count} plans, expected none")
+        return failures
+
+    def check_shifts_grids(self, machines_count, steps_count):
+        steps = Step.objects.bulk_create([Step(name=f"query budget {i}") for i in range(steps_count)])
+        Machine.objects.bulk_create(
+            [Machine(name=f"Станок {i}", step=step) for step in steps for i in range(machines_count)]
+        )
+        # a month of a far future window
+        start = timezone.now() + datetime.timedelta(days=3650)
+        slots = get_window_slots(start, start + datetime.timedelta(days=31))
+
+        with CaptureQueriesContext(connection) as queries:
+            get_shifts_grids(slots, [step.pk for step in steps])
+        self.stdout.write(f"get_shifts_grids ({steps_count} steps, {len(slots)} shifts): {len(queries)} queries")
+        if len(queries) > SHIFTS_GRIDS_MAX_QUERIES:
+            return [f"get_shifts_grids made {len(queries)} queries, budget is {SHIFTS_GRIDS_MAX_QUERIES}"]
+        return []
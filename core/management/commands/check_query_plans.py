@@ -0,0 +1,115 @@
+import datetime
+import random
+import re
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from core.management.seeding import Rollback, seed_production_data
+from core.models import Order, Plan, Report, ShiftSlot, Step, User
+from core.scripts import filter_reports, get_orders_queryset
+from core.shifts import ShiftStart
+
+# full table scans in EXPLAIN output, by database vendor
+SEQUENTIAL_SCAN = {
+    "postgresql": re.compile(r"Seq Scan on (\w+)"),
+    "sqlite": re.compile(r"\bSCAN (\w+)(?! USING (?:COVERING )?INDEX)(?:\s|$)"),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Check that the hot time window queries use indexes instead of sequential scans "
+        "(EXPLAIN on generated data in a rolled back transaction)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--orders", type=int, default=3000)
+        parser.add_argument("--report-entries", type=int, default=200_000)
+        parser.add_argument("--plan-entries", type=int, default=30_000)
+        parser.add_argument("--verbose-plans", action="store_true", help="Print the query plans")
+
+    def handle(self, *args, **options):
+        pattern = SEQUENTIAL_SCAN.get(connection.vendor)
+        if pattern is None:
+            raise CommandError(f"Query plans of {connection.vendor} are not supported")
+
+        random.seed(0)
+        failures = []
+        try:
+            with transaction.atomic():
+                # a year of history with few active orders, like a plant after some time in production
+                seed_production_data(
+                    options["orders"],
+                    options["report_entries"],
+                    options["plan_entries"],
+                    history_days=365,
+                    plan_history_days=365,
+                    active_share=0.05,
+                )
+                with connection.cursor() as cursor:
+                    cursor.execute("ANALYZE")
+
+                for name, queryset, table, vendors in self.get_hot_queries():
+                    if connection.vendor not in vendors:
+                        self.stdout.write(f"{name}: skipped on {connection.vendor}")
+                        continue
+                    plan = queryset.explain()
+                    if options["verbose_plans"]:
+                        self.stdout.write(f"{name}:\n{plan}\n")
+                    if table in pattern.findall(plan):
+                        failures.append(f"{name}: sequential scan on {table}\n{plan}")
+                    else:
+                        self.stdout.write(f"{name}: ok")
+                raise Rollback
+        except Rollback:
+            pass
+
+        if failures:
+            raise CommandError("\n\n".join(failures))
+        self.stdout.write(self.style.SUCCESS("All hot queries use indexes"))
+
+    def get_hot_queries(self):
+        # the generated step and user, created last
+        step = Step.objects.order_by("-id").first()
+        user = User.objects.filter(username__startswith="benchmark_user_").order_by("-id").first()
+        month = timezone.localtime().strftime("%Y-%m")
+        shifts_start = timezone.now() - datetime.timedelta(days=3)
+        all_vendors = SEQUENTIAL_SCAN.keys()
+        return [
+            (
+                "shift table plans",
+                Plan.objects.filter(step=step, date__range=(shifts_start, shifts_start + datetime.timedelta(days=14))),
+                Plan._meta.db_table,
+                all_vendors,
+            ),
+            (
+                "shifts of the shift table plans",
+                Plan.objects.filter(
+                    step=step, date__range=(shifts_start, shifts_start + datetime.timedelta(days=14))
+                ).annotate(shift=ShiftStart("date")),
+                ShiftSlot._meta.db_table,
+                all_vendors,
+            ),
+            (
+                "reports of a month",
+                filter_reports(Report.objects.all(), month=month).order_by("-date", "-id"),
+                Report._meta.db_table,
+                all_vendors,
+            ),
+            (
+                "reports of a month and step",
+                filter_reports(Report.objects.all(), month=month, step_pk=str(step.pk)),
+                Report._meta.db_table,
+                all_vendors,
+            ),
+            (
+                "reports of a month and user",
+                filter_reports(Report.objects.all(), month=month, user_pk=str(user.pk)),
+                Report._meta.db_table,
+                all_vendors,
+            ),
+            # sqlite gets a bare boolean column in WHERE, which it can not match to an index
+            ("active orders", get_orders_queryset(is_active=True), Order._meta.db_table, ["postgresql"]),
+        ]
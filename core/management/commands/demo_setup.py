@@ -18,6 +18,7 @@ from core.models import (
     Table,
     User,
 )
+from core.shifts import get_shift
 
 
 # needs fixes
@@ -112,8 +113,9 @@ class Command(BaseCommand):
                     datetime_start=datetime.now() - timedelta(days=1),
                     datetime_end=datetime.now() + timedelta(days=4)
                 )
-                plan = Plan.objects.create(
-                    date=timezone.make_aware(plan_date),
+                # plans are dated at the start of the shift, a shift of a machine has one plan
+                plan, _ = Plan.objects.get_or_create(
+                    date=get_shift(timezone.make_aware(plan_date)),
                     machine=Machine.objects.filter(step=step).order_by("?").first(),
                     step=step,
                 )
@@ -1,6 +1,8 @@
 from django.core.management.base import BaseCommand
 
+from core.ledger import rebuild_order_ledger
 from core.models import Detail
+from core.rollup import rebuild_production_rollup
 
 
 class Command(BaseCommand):
@@ -27,3 +29,7 @@ class Command(BaseCommand):
                     detail.reportentry_set.update(detail=value[0])
                     detail.planentry_set.update(detail=value[0])
                     detail.delete()
+
+        # updates above bypass the signals maintaining the ledger and the production rollup
+        rebuild_order_ledger()
+        rebuild_production_rollup()
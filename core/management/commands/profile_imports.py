@@ -0,0 +1,60 @@
+import os
+import re
+import resource
+import subprocess
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+# what a worker imports before serving the first request
+WORKER_IMPORTS = "import django; django.setup(); import core.urls"
+
+IMPORT_TIME_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+
+class Command(BaseCommand):
+    help = "Profile the imports of a worker start (python -X importtime) and list the slowest ones"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--limit", type=int, default=25, help="Number of imports to list")
+        parser.add_argument(
+            "--sort", choices=["cumulative", "self"], default="cumulative", help="Time to sort the imports by"
+        )
+        parser.add_argument(
+            "--prefix",
+            action="append",
+            default=[],
+            help="Only list imports of these packages, e.g. --prefix core --prefix industrial",
+        )
+
+    def handle(self, *args, **options):
+        env = {**os.environ, "DJANGO_SETTINGS_MODULE": os.environ.get("DJANGO_SETTINGS_MODULE", "industrial.settings")}
+        process = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", WORKER_IMPORTS], env=env, capture_output=True, text=True
+        )
+        if process.returncode:
+            raise CommandError(process.stderr)
+        max_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+
+        imports = []
+        for line in process.stderr.splitlines():
+            match = IMPORT_TIME_LINE.match(line)
+            if match:
+                self_us, cumulative_us, indent, name = match.groups()
+                imports.append((name, int(self_us), int(cumulative_us), len(indent) // 2))
+
+        # top level imports do not overlap, their sum is the whole import time
+        total_us = sum(cumulative_us for _, _, cumulative_us, depth in imports if depth == 0)
+        self.stdout.write(f"Worker imports: {total_us / 1000:.1f} ms, {len(imports)} modules, max RSS {max_rss / 1024:.1f} MB")
+
+        if options["prefix"]:
+            imports = [
+                item
+                for item in imports
+                if any(item[0] == prefix or item[0].startswith(f"{prefix}.") for prefix in options["prefix"])
+            ]
+        imports.sort(key=lambda item: item[1] if options["sort"] == "self" else item[2], reverse=True)
+
+        self.stdout.write(f"{'self, ms':>10} {'cumulative, ms':>15}  module")
+        for name, self_us, cumulative_us, _ in imports[: options["limit"]]:
+            self.stdout.write(f"{self_us / 1000:>10.1f} {cumulative_us / 1000:>15.1f}  {name}")
@@ -0,0 +1,50 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.ledger import rebuild_order_ledger
+from core.models import OrderEntry, OrderLedger, Step
+from core.scripts import get_leftovers, get_orders_queryset, get_orders_totals, get_orders_totals_recomputed
+
+
+class Command(BaseCommand):
+    help = "Rebuild the order ledger from reports and plans, optionally verify it against the full recomputation"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--verify", action="store_true", help="Compare the rebuilt ledger with the recomputation")
+        parser.add_argument("--if-empty", action="store_true", help="Only rebuild an empty order ledger, on deploy")
+        parser.add_argument("--verify-only", action="store_true", help="Only compare the ledger, do not rebuild it")
+
+    def handle(self, *args, **options):
+        if options["if_empty"] and (OrderLedger.objects.exists() or not OrderEntry.objects.exists()):
+            self.stdout.write("Order ledger is not empty or there are no order entries, not rebuilt")
+            return
+        if not options["verify_only"]:
+            rebuild_order_ledger()
+            self.stdout.write("Order ledger rebuilt")
+        if options["verify"] or options["verify_only"]:
+            self.verify()
+
+    def verify(self):
+        steps = Step.objects.all().order_by("id")
+        mismatches = 0
+        for is_active in [True, False]:
+            orders = get_orders_queryset(is_active=is_active)
+            ledger_leftovers, ledger_stats = get_leftovers(steps, orders, get_orders_totals(orders, is_active=is_active))
+            leftovers, stats = get_leftovers(steps, orders, get_orders_totals_recomputed(orders))
+            for step_pk, step_leftovers in leftovers.items():
+                for order_entry_pk, expected in step_leftovers.items():
+                    found = ledger_leftovers[step_pk][order_entry_pk]
+                    if found != expected:
+                        mismatches += 1
+                        self.stdout.write(
+                            f"Step {step_pk}, order entry {order_entry_pk}: "
+                            f"ledger {json.dumps(found)}, recomputed {json.dumps(expected)}"
+                        )
+            if json.dumps(ledger_stats, sort_keys=True) != json.dumps(stats, sort_keys=True):
+                mismatches += 1
+                self.stdout.write(f"Order stats differ for {'active' if is_active else 'inactive'} orders")
+
+        if mismatches:
+            raise CommandError(f"Order ledger differs from the recomputation in {mismatches} places")
+        self.stdout.write(self.style.SUCCESS("Order ledger matches the recomputation"))
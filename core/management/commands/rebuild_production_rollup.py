@@ -0,0 +1,41 @@
+from collections import Counter
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import ProductionRollup, Report
+from core.rollup import compute_production_rollup, rebuild_production_rollup
+
+FIELDS = ["day", "shift", "step_id", "user_id", "machine_id", "detail_id", "order_id", "quantity", "entries", "last_date"]
+
+
+class Command(BaseCommand):
+    help = "Rebuild the daily production rollup from the reports, optionally verify it against the recomputation"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--verify", action="store_true", help="Compare the rebuilt rollup with the recomputation")
+        parser.add_argument("--if-empty", action="store_true", help="Only rebuild an empty production rollup, on deploy")
+        parser.add_argument("--verify-only", action="store_true", help="Only compare the rollup, do not rebuild it")
+
+    def handle(self, *args, **options):
+        if options["if_empty"] and (ProductionRollup.objects.exists() or not Report.objects.exists()):
+            self.stdout.write("Production rollup is not empty or there are no reports, not rebuilt")
+            return
+        if not options["verify_only"]:
+            rebuild_production_rollup()
+            self.stdout.write(f"Production rollup rebuilt: {ProductionRollup.objects.count()} rows")
+        if options["verify"] or options["verify_only"]:
+            self.verify()
+
+    def verify(self):
+        stored = Counter(ProductionRollup.objects.values_list(*FIELDS))
+        expected = Counter(
+            tuple(getattr(row, field) for field in FIELDS) for row in compute_production_rollup(Report.objects.all())
+        )
+        mismatches = 0
+        for row in sorted((stored - expected) + (expected - stored), key=str):
+            mismatches += 1
+            self.stdout.write(f"{'stored' if row in stored else 'recomputed'} only: {row}")
+
+        if mismatches:
+            raise CommandError(f"Production rollup differs from the recomputation in {mismatches} rows")
+        self.stdout.write(self.style.SUCCESS("Production rollup matches the recomputation"))
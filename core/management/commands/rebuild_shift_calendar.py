@@ -0,0 +1,52 @@
+import datetime
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max, Min
+from django.utils.timezone import now
+
+from core.cell_cache import invalidate_table_cells
+from core.ledger import rebuild_order_ledger
+from core.models import Plan, Report, ShiftSlot
+from core.planning import align_plan_dates
+from core.rollup import rebuild_production_rollup
+from core.shifts import generate_shift_slots, get_utc_day, rebuild_shift_calendar
+from core.throughput import rebuild_throughput
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate the shift calendar again from the shift templates, move the plans to their shifts and rebuild "
+        "the production rollup, the order ledger and the throughput, which are keyed by shift"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days-ahead", type=int, default=365, help="Days of the calendar after today")
+        parser.add_argument(
+            "--extend", action="store_true", help="Only generate the missing shifts of the calendar, on deploy"
+        )
+
+    def handle(self, *args, **options):
+        dates = [now(), now() + datetime.timedelta(days=options["days_ahead"])]
+        for model in [Report, Plan]:
+            bounds = model.objects.aggregate(first=Min("date"), last=Max("date"))
+            dates += [date for date in bounds.values() if date is not None]
+        # the first shift of a day may start on the day before
+        first_day = get_utc_day(min(dates)) - datetime.timedelta(days=1)
+        last_day = get_utc_day(max(dates))
+
+        if options["extend"]:
+            # pages read the shifts without generating them
+            generate_shift_slots(first_day, last_day)
+            self.stdout.write(f"Shift calendar extended: {ShiftSlot.objects.count()} shifts")
+            return
+
+        with transaction.atomic():
+            rebuild_shift_calendar(first_day, last_day)
+            self.stdout.write(f"Shift calendar rebuilt: {ShiftSlot.objects.count()} shifts from {first_day} to {last_day}")
+            self.stdout.write(f"Plans moved to their shifts: {align_plan_dates()}")
+            rebuild_production_rollup()
+            rebuild_order_ledger()
+            rebuild_throughput()
+            invalidate_table_cells()
+        self.stdout.write("Production rollup, order ledger and throughput rebuilt")
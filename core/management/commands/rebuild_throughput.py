@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from core.models import Throughput
+from core.throughput import rebuild_throughput
+
+
+class Command(BaseCommand):
+    help = "Rebuild the machines throughput from the report history"
+
+    def handle(self, *args, **options):
+        rebuild_throughput()
+        self.stdout.write(f"Throughput rebuilt: {Throughput.objects.count()} machine, detail and step rows")
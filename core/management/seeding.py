@@ -0,0 +1,102 @@
+"""
+Generated production data for the benchmark and check commands, meant to be created in a rolled back transaction.
+"""
+
+import datetime
+import random
+
+from django.utils import timezone
+
+from core.models import Detail, Machine, Order, OrderEntry, Plan, PlanEntry, Report, ReportEntry, Step, User
+from core.shifts import get_shift_slots
+
+
+class Rollback(Exception):
+    pass
+
+
+def seed_production_data(
+    orders_count,
+    report_entries_count,
+    plan_entries_count,
+    history_days=60,
+    plan_history_days=3,
+    active_share=0.8,
+    users_count=10,
+    machines_count=6,
+):
+    now = timezone.now()
+    users = User.objects.bulk_create([User(username=f"benchmark_user_{i}") for i in range(users_count)])
+    steps = Step.objects.bulk_create([Step(name=f"Этап {i}") for i in range(5)])
+    machines = Machine.objects.bulk_create(
+        [Machine(name=f"Станок {i}", step=step) for step in steps for i in range(machines_count)]
+    )
+    details = Detail.objects.bulk_create([Detail(name=f"benchmark detail {i}") for i in range(200)])
+    orders = Order.objects.bulk_create(
+        [
+            Order(name=f"Заказ {i}", number=i, date=now, is_active=random.random() < active_share)
+            for i in range(orders_count)
+        ]
+    )
+    order_entries = OrderEntry.objects.bulk_create(
+        [
+            OrderEntry(order=order, detail=detail, quantity=random.randint(100, 5000))
+            for order in orders
+            for detail in random.sample(details, 4)
+        ]
+    )
+
+    # reports of the last history_days days
+    reports = Report.objects.bulk_create(
+        [
+            Report(
+                user=random.choice(users) if users else None,
+                order=order,
+                step=random.choice(steps),
+                date=now - datetime.timedelta(days=random.randint(0, history_days), hours=random.randint(0, 23)),
+            )
+            for order in orders
+            for _ in range(report_entries_count // orders_count // 5 or 1)
+        ],
+        batch_size=5000,
+    )
+    order_details = {}
+    for order_entry in order_entries:
+        order_details.setdefault(order_entry.order_id, []).append(order_entry.detail_id)
+    step_machines = {}
+    for machine in machines:
+        step_machines.setdefault(machine.step_id, []).append(machine)
+    ReportEntry.objects.bulk_create(
+        [
+            ReportEntry(
+                report=report,
+                machine=random.choice(step_machines[report.step_id]),
+                detail_id=random.choice(order_details[report.order_id]),
+                quantity=random.randint(1, 50),
+            )
+            for report in random.choices(reports, k=report_entries_count)
+        ],
+        batch_size=5000,
+    )
+
+    # plans of the last plan_history_days days and the next two weeks, some of them expired or superseded by reports
+    slots = get_shift_slots(now - datetime.timedelta(days=plan_history_days), now + datetime.timedelta(days=14))
+    shifts = [slot.start for slot in slots]
+    plans = Plan.objects.bulk_create(
+        [Plan(date=date, machine=machine, step=machine.step) for date in shifts for machine in machines],
+        batch_size=5000,
+    )
+    PlanEntry.objects.bulk_create(
+        [
+            PlanEntry(
+                plan=plan,
+                order=order_entry.order,
+                detail_id=order_entry.detail_id,
+                quantity=random.randint(1, 200),
+            )
+            for plan, order_entry in zip(
+                random.choices(plans, k=plan_entries_count), random.choices(order_entries, k=plan_entries_count)
+            )
+        ],
+        batch_size=5000,
+    )
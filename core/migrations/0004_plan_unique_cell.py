@@ -0,0 +1,37 @@
+# Generated by Django 4.2.9 on 2024-11-02 10:12
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def unite_plan_duplicates(apps, schema_editor):
+    Plan = apps.get_model("core", "Plan")
+    PlanEntry = apps.get_model("core", "PlanEntry")
+
+    duplicated_cells = (
+        Plan.objects.values("date", "machine", "step")
+        .annotate(plans_count=Count("id"), first_id=Min("id"))
+        .filter(plans_count__gt=1)
+    )
+
+    for cell in duplicated_cells:
+        duplicates = Plan.objects.filter(date=cell["date"], machine=cell["machine"], step=cell["step"]).exclude(
+            id=cell["first_id"]
+        )
+        # entries are moved to the first plan of the cell
+        PlanEntry.objects.filter(plan__in=duplicates).update(plan_id=cell["first_id"])
+        duplicates.delete()
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0003_planentry_order"),
+    ]
+
+    operations = [
+        migrations.RunPython(unite_plan_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="plan",
+            constraint=models.UniqueConstraint(fields=("date", "machine", "step"), name="unique_plan_cell"),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 4.2.9 on 2024-11-09 09:40
+
+from django.db import migrations
+
+
+def delete_empty_plans(apps, schema_editor):
+    # empty cells of the shift table are virtual now, only plans with entries are stored
+    Plan = apps.get_model("core", "Plan")
+    Plan.objects.filter(planentry__isnull=True).delete()
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0004_plan_unique_cell"),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_empty_plans, migrations.RunPython.noop),
+    ]
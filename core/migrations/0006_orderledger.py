@@ -0,0 +1,26 @@
+# Generated by Django 4.2.9 on 2024-11-16 11:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0005_delete_empty_plans"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="OrderLedger",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("date", models.DateTimeField(blank=True, null=True)),
+                ("reported", models.PositiveIntegerField(default=0)),
+                ("planned", models.PositiveIntegerField(default=0)),
+                ("reported_by_active", models.BooleanField(default=False)),
+                ("reported_by_inactive", models.BooleanField(default=False)),
+                ("order_entry", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to="core.orderentry")),
+                ("step", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to="core.step")),
+            ],
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.9 on 2024-11-23 10:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0006_orderledger"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="order",
+            index=models.Index(fields=["is_active", "-id"], name="order_active_id_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="plan",
+            index=models.Index(fields=["step", "date"], name="plan_step_date_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="report",
+            index=models.Index(fields=["date", "id"], name="report_date_id_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="report",
+            index=models.Index(fields=["step", "date"], name="report_step_date_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="report",
+            index=models.Index(fields=["user", "date"], name="report_user_date_idx"),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.9 on 2024-11-24 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0007_time_window_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="machine",
+            name="shift_capacity",
+            field=models.PositiveIntegerField(default=400),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.9 on 2024-11-26 14:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0008_machine_shift_capacity"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Throughput",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("median", models.PositiveIntegerField()),
+                ("p90", models.PositiveIntegerField()),
+                ("shifts", models.PositiveIntegerField()),
+                ("detail", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to="core.detail")),
+                ("machine", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to="core.machine")),
+                ("step", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to="core.step")),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="throughput",
+            constraint=models.UniqueConstraint(fields=("machine", "detail", "step"), name="unique_throughput"),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 4.2.9 on 2024-11-28 11:47
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0009_throughput"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ProductionRollup",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("day", models.DateField()),
+                ("quantity", models.PositiveIntegerField(default=0)),
+                ("entries", models.PositiveIntegerField(default=0)),
+                ("last_date", models.DateTimeField()),
+                ("detail", models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to="core.detail")),
+                (
+                    "machine",
+                    models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to="core.machine"),
+                ),
+                ("order", models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to="core.order")),
+                ("step", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to="core.step")),
+                (
+                    "user",
+                    models.ForeignKey(
+                        null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(fields=["day"], name="rollup_day_idx"),
+                    models.Index(fields=["step", "day"], name="rollup_step_day_idx"),
+                    models.Index(fields=["user", "day"], name="rollup_user_day_idx"),
+                ],
+            },
+        ),
+    ]
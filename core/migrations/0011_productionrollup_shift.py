@@ -0,0 +1,27 @@
+# Generated by Django 4.2.9 on 2024-12-01 10:18
+
+import datetime
+
+from django.db import migrations, models
+
+
+def delete_production_rollup(apps, schema_editor):
+    # the rows have no shift, rebuild_production_rollup fills the table again
+    ProductionRollup = apps.get_model("core", "ProductionRollup")
+    ProductionRollup.objects.all().delete()
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0010_productionrollup"),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_production_rollup, migrations.RunPython.noop),
+        migrations.AddField(
+            model_name="productionrollup",
+            name="shift",
+            field=models.DateTimeField(default=datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)),
+            preserve_default=False,
+        ),
+    ]
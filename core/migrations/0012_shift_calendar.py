@@ -0,0 +1,72 @@
+# Generated by Django 4.2.9 on 2024-12-03 09:41
+
+import datetime
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def create_shift_templates(apps, schema_editor):
+    # the two 12 hour shifts the plant worked before the calendar
+    ShiftTemplate = apps.get_model("core", "ShiftTemplate")
+    ShiftTemplate.objects.bulk_create(
+        [
+            ShiftTemplate(name="Дневная", start=datetime.time(3), is_night=False),
+            ShiftTemplate(name="Ночная", start=datetime.time(15), is_night=True),
+        ]
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0011_productionrollup_shift"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ShiftTemplate",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("name", models.CharField(max_length=50)),
+                ("start", models.TimeField(unique=True)),
+                ("is_night", models.BooleanField(default=False)),
+            ],
+            options={
+                "ordering": ["start"],
+            },
+        ),
+        migrations.CreateModel(
+            name="ShiftException",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("day", models.DateField()),
+                ("reason", models.CharField(blank=True, max_length=200)),
+                (
+                    "template",
+                    models.ForeignKey(
+                        blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to="core.shifttemplate"
+                    ),
+                ),
+            ],
+        ),
+        migrations.CreateModel(
+            name="ShiftSlot",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("start", models.DateTimeField(unique=True)),
+                ("end", models.DateTimeField()),
+                ("day", models.DateField()),
+                ("number", models.PositiveSmallIntegerField()),
+                ("is_night", models.BooleanField(default=False)),
+                ("is_working", models.BooleanField(default=True)),
+                (
+                    "template",
+                    models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to="core.shifttemplate"),
+                ),
+            ],
+            options={
+                "indexes": [models.Index(fields=["day"], name="shift_slot_day_idx")],
+            },
+        ),
+        migrations.RunPython(create_shift_templates, migrations.RunPython.noop),
+    ]
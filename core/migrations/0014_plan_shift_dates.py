@@ -0,0 +1,56 @@
+# Generated by Django 4.2.9 on 2024-12-06 09:15
+
+import datetime
+from collections import defaultdict
+
+from django.db import migrations
+
+
+def get_shift_start(starts, date):
+    # the shifts of a UTC day start at the template times, a shift lasts until the next one
+    date = date.astimezone(datetime.timezone.utc)
+    candidates = [
+        datetime.datetime.combine(date.date() + datetime.timedelta(days=offset), start, datetime.timezone.utc)
+        for offset in (-1, 0)
+        for start in starts
+    ]
+    return max(candidate for candidate in candidates if candidate <= date)
+
+
+def align_plan_dates(apps, schema_editor):
+    ShiftTemplate = apps.get_model("core", "ShiftTemplate")
+    Plan = apps.get_model("core", "Plan")
+    PlanEntry = apps.get_model("core", "PlanEntry")
+    OrderLedger = apps.get_model("core", "OrderLedger")
+
+    starts = list(ShiftTemplate.objects.order_by("start").values_list("start", flat=True))
+    if not starts:
+        return
+    cells = defaultdict(list)
+    for plan in Plan.objects.order_by("id"):
+        cells[(get_shift_start(starts, plan.date), plan.machine_id, plan.step_id)].append(plan)
+
+    changed = False
+    for (shift, _, _), (plan, *duplicates) in cells.items():
+        if duplicates:
+            # entries are moved to the first plan of the cell
+            PlanEntry.objects.filter(plan__in=duplicates).update(plan_id=plan.id)
+            Plan.objects.filter(id__in=[duplicate.id for duplicate in duplicates]).delete()
+            changed = True
+        if plan.date != shift:
+            Plan.objects.filter(id=plan.id).update(date=shift)
+            changed = True
+
+    # planned ledger rows keep the plan dates, rebuild_order_ledger --if-empty rebuilds them
+    if changed:
+        OrderLedger.objects.all().delete()
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0013_cache_version"),
+    ]
+
+    operations = [
+        migrations.RunPython(align_plan_dates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 4.2.9 on 2024-12-07 11:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0014_plan_shift_dates"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="productionrollup",
+            name="rollup_day_idx",
+        ),
+        migrations.AddIndex(
+            model_name="productionrollup",
+            index=models.Index(
+                fields=["day", "shift", "entries", "user", "step", "detail", "quantity"], name="rollup_analytics_idx"
+            ),
+        ),
+    ]
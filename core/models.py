@@ -79,6 +79,8 @@ class Step(models.Model):
 class Machine(models.Model):
     name = models.CharField(max_length=200)
     step = models.ForeignKey(Step, null=True, on_delete=models.SET_NULL)
+    # details a shift can make, the limit of automatic planning
+    shift_capacity = models.PositiveIntegerField(default=400)
 
     def __str__(self):
         return self.name
@@ -98,11 +100,19 @@ class Order(models.Model):
     date = models.DateTimeField()
     is_active = models.BooleanField(default=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["is_active", "-id"], name="order_active_id_idx"),
+        ]
+
     def __str__(self):
         return str(self.number)
 
     @property
     def in_progress(self):
+        # get_orders_display annotates has_reports to avoid a query per order
+        if hasattr(self, "has_reports"):
+            return self.has_reports
         return self.report_set.exists()
 
 
@@ -119,6 +129,13 @@ class Report(models.Model):
     order = models.ForeignKey(Order, null=True, blank=False, on_delete=models.SET_NULL)
     step = models.ForeignKey(Step, null=False, blank=False, on_delete=models.CASCADE)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["date", "id"], name="report_date_id_idx"),
+            models.Index(fields=["step", "date"], name="report_step_date_idx"),
+            models.Index(fields=["user", "date"], name="report_user_date_idx"),
+        ]
+
     def __str__(self):
         return "ОТЧЕТ " + str(self.user) + ": " + str(self.date)
 
@@ -131,11 +148,53 @@ class ReportEntry(models.Model):
     quantity = models.PositiveIntegerField()
 
 
+class ProductionRollup(models.Model):
+    """
+    Reported quantities summed per day, step, user, machine, detail and order, maintained by core.rollup.
+
+    Days are in the current timezone, so month filters select the same reports as on Report.date, the shift is
+    the start of the report's shift (see get_shift), a night shift has rows on two days.
+    Reports without entries have a row with no entries, so their users are still listed in the results.
+    """
+
+    day = models.DateField()
+    shift = models.DateTimeField()
+    step = models.ForeignKey(Step, on_delete=models.CASCADE)
+    user = models.ForeignKey(User, null=True, on_delete=models.SET_NULL)
+    machine = models.ForeignKey(Machine, null=True, on_delete=models.CASCADE)
+    detail = models.ForeignKey(Detail, null=True, on_delete=models.CASCADE)
+    order = models.ForeignKey(Order, null=True, on_delete=models.SET_NULL)
+    quantity = models.PositiveIntegerField(default=0)
+    entries = models.PositiveIntegerField(default=0)
+    # date of the latest report of the row
+    last_date = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            # covers the month sums of the analytics, see core.analytics
+            models.Index(
+                fields=["day", "shift", "entries", "user", "step", "detail", "quantity"], name="rollup_analytics_idx"
+            ),
+            models.Index(fields=["step", "day"], name="rollup_step_day_idx"),
+            models.Index(fields=["user", "day"], name="rollup_user_day_idx"),
+        ]
+
+
 class Plan(models.Model):
+    """Plan of a cell of the shifts table, dated at the start of the shift, see core.shifts"""
+
     date = models.DateTimeField()
     machine = models.ForeignKey(Machine, on_delete=models.CASCADE)
     step = models.ForeignKey(Step, null=False, blank=False, on_delete=models.CASCADE)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["date", "machine", "step"], name="unique_plan_cell"),
+        ]
+        indexes = [
+            models.Index(fields=["step", "date"], name="plan_step_date_idx"),
+        ]
+
     def __str__(self):
         return str(self.date) + " " + str(self.step) + " " + str(self.machine)
 
@@ -147,6 +206,108 @@ class PlanEntry(models.Model):
     quantity = models.PositiveIntegerField(null=True, blank=True)
 
 
+class OrderLedger(models.Model):
+    """
+    Reported and planned quantities of an order entry at a step, maintained by core.ledger.
+
+    Reported rows have no date. Planned rows keep the plan date, so plans older than a day drop out on read,
+    and whether the plan cell has reports of active or inactive orders, such plans are not counted.
+    """
+
+    order_entry = models.ForeignKey(OrderEntry, on_delete=models.CASCADE)
+    step = models.ForeignKey(Step, on_delete=models.CASCADE)
+    date = models.DateTimeField(null=True, blank=True)
+    reported = models.PositiveIntegerField(default=0)
+    planned = models.PositiveIntegerField(default=0)
+    reported_by_active = models.BooleanField(default=False)
+    reported_by_inactive = models.BooleanField(default=False)
+
+
+class Throughput(models.Model):
+    """
+    Quantity of a detail a machine makes at a step per shift, maintained by core.throughput.
+
+    The median and the 90th percentile of the quantities reported per shift over the last months.
+    """
+
+    machine = models.ForeignKey(Machine, on_delete=models.CASCADE)
+    detail = models.ForeignKey(Detail, on_delete=models.CASCADE)
+    step = models.ForeignKey(Step, on_delete=models.CASCADE)
+    median = models.PositiveIntegerField()
+    p90 = models.PositiveIntegerField()
+    shifts = models.PositiveIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["machine", "detail", "step"], name="unique_throughput"),
+        ]
+
+
+class CacheVersion(models.Model):
+    """
+    Version of cached data, see core.versions.
+
+    Kept in the database so it is never evicted: a missing version is one that was never written.
+    """
+
+    key = models.CharField(max_length=200, unique=True)
+    version = models.BigIntegerField()
+
+
 class Table(models.Model):
     current_date = models.DateTimeField(default=now)
     current_step = models.ForeignKey(Step, null=True, on_delete=models.SET_NULL)
+
+
+class ShiftTemplate(models.Model):
+    """
+    Shift of every day of the calendar, it lasts until the start of the next template.
+
+    The start is in UTC. Changed templates apply to the calendar with rebuild_shift_calendar, the admin runs it on
+    save, see core.shifts.
+    """
+
+    name = models.CharField(max_length=50)
+    start = models.TimeField(unique=True)
+    is_night = models.BooleanField(default=False)
+
+    class Meta:
+        ordering = ["start"]
+
+    def __str__(self):
+        return f"{self.name} ({self.start:%H:%M} UTC)"
+
+
+class ShiftException(models.Model):
+    """Holiday of the calendar: the template's shift of the day, all shifts of the day without a template"""
+
+    day = models.DateField()
+    template = models.ForeignKey(ShiftTemplate, null=True, blank=True, on_delete=models.CASCADE)
+    reason = models.CharField(max_length=200, blank=True)
+
+    def __str__(self):
+        return f"{self.day} {self.template or 'все смены'}"
+
+
+class ShiftSlot(models.Model):
+    """
+    Shift of the calendar generated from the templates and exceptions, maintained by core.shifts.
+
+    Slots follow each other without gaps, a timestamp belongs to the slot with start <= timestamp < end.
+    The day is the UTC day of the template the slot was generated from. Shifts of holidays are slots too,
+    they are not working: reports still belong to them, the scheduler leaves them empty.
+    """
+
+    start = models.DateTimeField(unique=True)
+    end = models.DateTimeField()
+    day = models.DateField()
+    # position of the shift in the day
+    number = models.PositiveSmallIntegerField()
+    template = models.ForeignKey(ShiftTemplate, null=True, on_delete=models.SET_NULL)
+    is_night = models.BooleanField(default=False)
+    is_working = models.BooleanField(default=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["day"], name="shift_slot_day_idx"),
+        ]
@@ -0,0 +1,222 @@
+"""
+Batch edits of the shifts table plans.
+
+apply_plan_operations applies a list of operations in one transaction with bulk queries:
+
+    {"op": "create", "cell": <cell key>, "order_id": 1, "detail_id": 2, "quantity": 100}
+    {"op": "move", "plan_entry_id": 3, "cell": <cell key>}
+    {"op": "update", "plan_entry_id": 3, "quantity": 50}
+
+The cell key is the plan_key the table sends (see TableCell), only its date, machine_id and step_id are used:
+any time of a shift is the cell of the shift, new plans are dated at the start of the shift.
+Bulk queries bypass the receivers of core.signals, the ledger of the touched orders and the cached cells
+are refreshed here.
+"""
+
+import datetime
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Max, Min
+
+from .cell_cache import invalidate_cells
+from .ledger import schedule_order_ledger_refresh
+from .models import Detail, Machine, Order, Plan, PlanEntry, Step
+from .scripts import TableCell
+from .shifts import ShiftStart, cover_shift_slots, get_shift_ends, get_shifts
+from .throughput import mark_overloaded_cells
+
+MAX_OPERATIONS = 10_000
+BATCH_SIZE = 1000
+
+
+def parse_cell(data):
+    return (datetime.datetime.fromisoformat(data["date"]), int(data["machine_id"]), int(data["step_id"]))
+
+
+def parse_quantity(value):
+    quantity = int(value)
+    if quantity < 0:
+        raise ValueError(f"Negative quantity {quantity}")
+    return quantity
+
+
+def parse_operation(data):
+    op = data["op"]
+    if op == "create":
+        return {
+            "op": op,
+            "cell": parse_cell(data["cell"]),
+            "order_id": int(data["order_id"]),
+            "detail_id": int(data["detail_id"]),
+            "quantity": parse_quantity(data["quantity"]),
+        }
+    if op == "move":
+        return {"op": op, "plan_entry_id": int(data["plan_entry_id"]), "cell": parse_cell(data["cell"])}
+    if op == "update":
+        return {"op": op, "plan_entry_id": int(data["plan_entry_id"]), "quantity": parse_quantity(data["quantity"])}
+    raise ValueError(f"Unknown operation {op}")
+
+
+def get_cell_plans(cells):
+    """Returns {(shift, machine_id, step_id): plan} of the saved plans of the cells, the first one of a cell"""
+    shifts = {shift for shift, _, _ in cells}
+    candidates = (
+        Plan.objects.filter(
+            date__gte=min(shifts),
+            date__lt=max(get_shift_ends(shifts).values()),
+            machine_id__in={machine_id for _, machine_id, _ in cells},
+            step_id__in={step_id for _, _, step_id in cells},
+        )
+        .annotate(shift=ShiftStart("date"))
+        .order_by("pk")
+    )
+    plans = {}
+    for plan in candidates:
+        cell = (plan.shift, plan.machine_id, plan.step_id)
+        if cell in cells:
+            plans.setdefault(cell, plan)
+    return plans
+
+
+def get_or_create_cell_plans(cells):
+    """Returns {(shift, machine_id, step_id): plan} of the cells, missing plans are created in one query"""
+    if not cells:
+        return {}
+    plans = get_cell_plans(cells)
+    missing = cells - set(plans)
+    if missing:
+        # a concurrent request may have created some of them, they are read back with the created ones
+        Plan.objects.bulk_create(
+            [Plan(date=shift, machine_id=machine_id, step_id=step_id) for shift, machine_id, step_id in missing],
+            batch_size=BATCH_SIZE,
+            ignore_conflicts=True,
+        )
+        plans.update(get_cell_plans(missing))
+    return plans
+
+
+def check_references(operations):
+    """Raises ValueError if an operation refers to an order, detail, machine or step that does not exist"""
+    references = {
+        Order: {operation["order_id"] for operation in operations if "order_id" in operation},
+        Detail: {operation["detail_id"] for operation in operations if "detail_id" in operation},
+        Machine: {operation["cell"][1] for operation in operations if "cell" in operation},
+        Step: {operation["cell"][2] for operation in operations if "cell" in operation},
+    }
+    for model, ids in references.items():
+        unknown = ids - set(model.objects.filter(pk__in=ids).values_list("pk", flat=True)) if ids else set()
+        if unknown:
+            raise ValueError(f"Unknown {model._meta.verbose_name} ids {sorted(unknown)}")
+
+
+def apply_plan_operations(operations):
+    """
+    Applies the operations in one transaction, returns the TableCells of the touched cells and the ids
+    of the orders whose leftovers changed. Raises ValueError on malformed operations or unknown plan entries,
+    orders, details, machines or steps.
+    """
+    if not isinstance(operations, list):
+        raise ValueError("Operations must be a list")
+    if len(operations) > MAX_OPERATIONS:
+        raise ValueError(f"More than {MAX_OPERATIONS} operations")
+    operations = [parse_operation(data) for data in operations]
+    cells = {operation["cell"] for operation in operations if "cell" in operation}
+    shifts = dict(zip(cells, get_shifts([date for date, _, _ in cells]), strict=True))
+    for operation in operations:
+        if "cell" in operation:
+            _, machine_id, step_id = operation["cell"]
+            operation["cell"] = (shifts[operation["cell"]], machine_id, step_id)
+    check_references(operations)
+
+    with transaction.atomic():
+        entry_ids = {operation["plan_entry_id"] for operation in operations if "plan_entry_id" in operation}
+        entries = PlanEntry.objects.select_related("plan__machine").in_bulk(entry_ids)
+        if len(entries) != len(entry_ids):
+            raise ValueError(f"Unknown plan entries {sorted(entry_ids - set(entries))}")
+        plans = get_or_create_cell_plans({operation["cell"] for operation in operations if "cell" in operation})
+
+        old_plans = {entry.plan_id: entry.plan for entry in entries.values()}
+        new_entries = []
+        for operation in operations:
+            if operation["op"] == "create":
+                new_entries.append(
+                    PlanEntry(
+                        plan=plans[operation["cell"]],
+                        order_id=operation["order_id"],
+                        detail_id=operation["detail_id"],
+                        quantity=operation["quantity"],
+                    )
+                )
+            elif operation["op"] == "move":
+                entries[operation["plan_entry_id"]].plan = plans[operation["cell"]]
+            else:
+                entries[operation["plan_entry_id"]].quantity = operation["quantity"]
+        PlanEntry.objects.bulk_update(entries.values(), ["plan", "quantity"], batch_size=BATCH_SIZE)
+        PlanEntry.objects.bulk_create(new_entries, batch_size=BATCH_SIZE)
+
+        # empty plans are not stored, the cells left by the moved entries become virtual again
+        Plan.objects.filter(pk__in=old_plans, planentry__isnull=True).delete()
+
+        touched_plans = {plan.pk: plan for plan in [*old_plans.values(), *plans.values()]}
+        shifts = dict(zip(touched_plans, get_shifts([plan.date for plan in touched_plans.values()]), strict=True))
+        invalidate_cells({(plan.step_id, plan.machine_id, shifts[pk]) for pk, plan in touched_plans.items()})
+        order_ids = {entry.order_id for entry in [*entries.values(), *new_entries]}
+        schedule_order_ledger_refresh(order_ids)
+
+    saved_plans = (
+        Plan.objects.filter(pk__in=touched_plans)
+        .select_related("machine")
+        .prefetch_related("planentry_set", "planentry_set__order", "planentry_set__detail")
+        .in_bulk()
+    )
+    cells = [
+        TableCell(date=shifts[pk], plan=saved_plans[pk])
+        if pk in saved_plans
+        else TableCell(date=shifts[pk], machine=plan.machine, step_id=plan.step_id)
+        for pk, plan in touched_plans.items()
+    ]
+    mark_overloaded_cells(cells)
+    return cells, order_ids
+
+
+def align_plan_dates():
+    """
+    Moves every plan to the start of its shift, the entries of plans sharing a cell go to the first plan of the cell.
+    Returns the number of plans moved or merged. Plans are dated at the start of their shift, this realigns them
+    after the shift calendar changed, see rebuild_shift_calendar.
+    """
+    dates = Plan.objects.aggregate(first=Min("date"), last=Max("date"))
+    if dates["first"] is None:
+        return 0
+    cover_shift_slots(dates["first"], dates["last"])
+
+    with transaction.atomic():
+        cells = defaultdict(list)
+        for plan in Plan.objects.annotate(shift=ShiftStart("date")).only("date", "machine", "step").order_by("pk"):
+            cells[(plan.shift, plan.machine_id, plan.step_id)].append(plan)
+        moved = []
+        # {duplicate plan id: first plan of the cell}
+        first_plans = {}
+        for (shift, _, _), (plan, *duplicates) in cells.items():
+            first_plans.update((duplicate.pk, plan) for duplicate in duplicates)
+            if plan.date != shift:
+                plan.date = shift
+                moved.append(plan)
+        if not moved and not first_plans:
+            return 0
+
+        entries = list(PlanEntry.objects.filter(plan__in=first_plans).only("plan"))
+        for entry in entries:
+            entry.plan = first_plans[entry.plan_id]
+        PlanEntry.objects.bulk_update(entries, ["plan"], batch_size=BATCH_SIZE)
+        # the duplicates go first, the moved plans take their dates
+        Plan.objects.filter(pk__in=first_plans).delete()
+        Plan.objects.bulk_update(moved, ["date"], batch_size=BATCH_SIZE)
+
+        touched = {plan.pk: plan for plan in [*moved, *first_plans.values()]}
+        invalidate_cells({(plan.step_id, plan.machine_id, plan.date) for plan in touched.values()})
+        schedule_order_ledger_refresh(
+            set(PlanEntry.objects.filter(plan__in=touched).values_list("order_id", flat=True))
+        )
+    return len(moved) + len(first_plans)
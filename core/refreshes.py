@@ -0,0 +1,45 @@
+"""
+Refreshes of derived data after commit, collected per transaction.
+
+The receivers in core.signals and the bulk edits add the keys they touch with schedule_refresh. Each refresh
+function runs once after the commit of the transaction with the keys of all its calls, however many saves and
+deletes of the transaction touched them, and it computes them from the saved state.
+"""
+
+from django.db import transaction
+
+
+class PendingRefresh:
+    """Keys of a refresh function collected during a transaction, the on_commit callback of the transaction"""
+
+    def __init__(self, refresh):
+        self.refresh = refresh
+        self.keys = set()
+        self.ran = False
+
+    def __call__(self):
+        self.ran = True
+        self.refresh(self.keys)
+
+
+def schedule_refresh(refresh, keys, using=None):
+    """Runs refresh(keys) after commit, once per transaction with the keys of all the calls of the transaction"""
+    keys = set(keys)
+    if not keys:
+        return
+    connection = transaction.get_connection(using)
+    if not hasattr(connection, "pending_refreshes"):
+        connection.pending_refreshes = {}
+    pending = connection.pending_refreshes.get(refresh)
+    # callbacks already run or dropped with a rolled back transaction or savepoint are left behind
+    if (
+        pending is not None
+        and not pending.ran
+        and any(callback is pending for _, callback, *_ in connection.run_on_commit)
+    ):
+        pending.keys |= keys
+        return
+    pending = connection.pending_refreshes[refresh] = PendingRefresh(refresh)
+    pending.keys |= keys
+    # outside of a transaction the refresh runs right away
+    transaction.on_commit(pending, using=using)
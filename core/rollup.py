@@ -0,0 +1,135 @@
+"""
+Daily production rollup (ProductionRollup): reported quantities summed per day, shift, step, user, machine, detail
+and order, the reports summary, results, surplus and analytics read it instead of every report entry.
+
+The receivers in core.signals refresh the (day, step_id) partitions touched by a report save or delete,
+rebuild_production_rollup rebuilds the table from all reports. Each month of the rollup has a version, see
+core.versions, replaced whenever a partition of the month is refreshed, the analytics of a month are cached
+under it (see core.analytics).
+"""
+
+import datetime
+
+from django.db import transaction
+from django.db.models import Count, Max, Min, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils.timezone import localdate, make_aware
+
+from .models import ProductionRollup, Report, ReportEntry
+from .refreshes import schedule_refresh
+from .shifts import ShiftStart, cover_shift_slots
+from .versions import get_versions, replace_versions
+
+
+def get_day_range(day):
+    """Returns the half-open range [start, end) of a day in the current timezone"""
+    start = make_aware(datetime.datetime.combine(day, datetime.time()))
+    return start, make_aware(datetime.datetime.combine(day + datetime.timedelta(days=1), datetime.time()))
+
+
+ROLLUP_VERSION_KEY = "production_rollup_version"
+
+
+def get_month_version_key(month):
+    return f"production_rollup_version:{month}"
+
+
+def invalidate_rollup_months(days):
+    replace_versions({get_month_version_key(day.strftime("%Y-%m")) for day in days})
+
+
+def invalidate_production_rollup():
+    replace_versions([ROLLUP_VERSION_KEY])
+
+
+def get_rollup_month_versions(months):
+    """Returns {month: version} of the "YYYY-MM" months"""
+    return get_versions({month: [get_month_version_key(month), ROLLUP_VERSION_KEY] for month in months})
+
+
+def get_report_partition(date, step_id):
+    return localdate(date), step_id
+
+
+def compute_production_rollup(reports):
+    """Returns unsaved ProductionRollup rows of the reports"""
+    dates = reports.aggregate(first=Min("date"), last=Max("date"))
+    if dates["first"] is None:
+        return []
+    cover_shift_slots(dates["first"], dates["last"])
+
+    rows = {}
+
+    def add(day, shift, step_id, user_id, machine_id, detail_id, order_id, quantity, entries, last_date):
+        key = (day, shift, step_id, user_id, machine_id, detail_id, order_id)
+        row = rows.get(key)
+        if row is None:
+            row = rows[key] = ProductionRollup(
+                day=day,
+                shift=shift,
+                step_id=step_id,
+                user_id=user_id,
+                machine_id=machine_id,
+                detail_id=detail_id,
+                order_id=order_id,
+                last_date=last_date,
+            )
+        row.quantity += quantity
+        row.entries += entries
+        row.last_date = max(row.last_date, last_date)
+
+    # summed per local day and shift in the database
+    report_entries = (
+        ReportEntry.objects.filter(report__in=reports)
+        .values_list(
+            TruncDate("report__date"),
+            ShiftStart("report__date"),
+            "report__step_id",
+            "report__user_id",
+            "machine_id",
+            "detail_id",
+            "report__order_id",
+        )
+        .annotate(Sum("quantity"), Count("pk"), Max("report__date"))
+        .order_by()
+    )
+    for row in report_entries.iterator(chunk_size=5000):
+        add(*row)
+
+    empty_reports = (
+        reports.filter(reportentry__isnull=True)
+        .values_list(TruncDate("date"), ShiftStart("date"), "step_id", "user_id", "order_id")
+        .annotate(Max("date"))
+        .order_by()
+    )
+    for day, shift, step_id, user_id, order_id, last_date in empty_reports:
+        add(day, shift, step_id, user_id, None, None, order_id, 0, 0, last_date)
+
+    return list(rows.values())
+
+
+def refresh_production_rollup(partitions):
+    partitions = {partition for partition in partitions if None not in partition}
+    if not partitions:
+        return
+    rows = Q()
+    reports = Q()
+    for day, step_id in partitions:
+        start, end = get_day_range(day)
+        rows |= Q(day=day, step_id=step_id)
+        reports |= Q(date__gte=start, date__lt=end, step_id=step_id)
+    with transaction.atomic():
+        ProductionRollup.objects.filter(rows).delete()
+        ProductionRollup.objects.bulk_create(compute_production_rollup(Report.objects.filter(reports)))
+        invalidate_rollup_months({day for day, _ in partitions})
+
+
+def schedule_production_rollup_refresh(partitions):
+    schedule_refresh(refresh_production_rollup, {partition for partition in partitions if None not in partition})
+
+
+def rebuild_production_rollup():
+    with transaction.atomic():
+        ProductionRollup.objects.all().delete()
+        ProductionRollup.objects.bulk_create(compute_production_rollup(Report.objects.all()), batch_size=1000)
+        invalidate_production_rollup()
@@ -0,0 +1,122 @@
+"""
+Automatic planning of the shifts table.
+
+get_schedule proposes plan entries for the leftovers of the active orders at a step: orders are served by date,
+each order entry takes the free time of the step's cells in shift order, from the current shift to the end of
+the shown window. Quantities are measured in shifts of the machine's median throughput of the detail
+(see core.throughput), a cell is free for what is left of its shift after the entries already planned there,
+cells with reports and the shifts of holidays are skipped, plans there are superseded. Nothing is saved,
+accepting sends the proposal to plan_batch as create operations (see core.planning).
+"""
+
+from collections import defaultdict
+
+from django.utils.timezone import now
+
+from .models import Machine, Order, PlanEntry, ReportEntry
+from .scripts import get_orders_totals
+from .shifts import ShiftStart, get_shift, get_shift_range
+from .throughput import get_shift_rate, get_throughput
+
+
+class ScheduleCell:
+    def __init__(self, date, machine, free):
+        self.date = date
+        self.machine = machine
+        # part of the shift left
+        self.free = free
+
+
+def get_free_cells(step_id, slots, machines, throughput):
+    """Returns the cells of the working shifts of the slots with free time, in shift and machine order"""
+    window = (slots[0].start, slots[-1].end)
+    machines_by_id = {machine.pk: machine for machine in machines}
+
+    load = defaultdict(float)
+    # plans are dated at the start of the shift, plans on machines since moved to another step are not in the table
+    plan_entries = PlanEntry.objects.filter(
+        plan__step_id=step_id, plan__machine__in=machines, plan__date__gte=window[0], plan__date__lt=window[1]
+    ).values_list("plan__machine_id", "plan__date", "detail_id", "quantity")
+    for machine_id, shift, detail_id, quantity in plan_entries:
+        load[(machine_id, shift)] += (quantity or 0) / get_shift_rate(throughput, machines_by_id[machine_id], detail_id)
+
+    reported = set(
+        ReportEntry.objects.filter(
+            report__step_id=step_id, report__date__gte=window[0], report__date__lt=window[1]
+        ).values_list("machine_id", ShiftStart("report__date"))
+    )
+
+    cells = []
+    for slot in slots:
+        if not slot.is_working:
+            # holidays are not planned
+            continue
+        for machine in machines:
+            cell = (machine.pk, slot.start)
+            if load[cell] < 1 and cell not in reported:
+                cells.append(ScheduleCell(slot.start, machine, 1 - load[cell]))
+    return cells
+
+
+def get_schedule(step_id, from_date, shifts_count):
+    """
+    Returns the proposed entries [{"date", "machine", "order", "order_entry", "quantity"}] for the step's cells
+    of shifts_count shifts from from_date, past shifts are not planned.
+    """
+    first_shift = get_shift(now())
+    slots = [slot for slot in get_shift_range(from_date, shifts_count) if slot.start >= first_shift]
+    if step_id is None or not slots:
+        return []
+
+    machines = list(Machine.objects.filter(step_id=step_id).order_by("id"))
+    throughput = get_throughput([machine.pk for machine in machines], step_id)
+    cells = get_free_cells(step_id, slots, machines, throughput)
+    orders = list(Order.objects.filter(is_active=True).order_by("date", "pk").prefetch_related("orderentry_set"))
+    # the leftovers of the step only, see get_leftovers
+    totals = get_orders_totals(orders, step_id=step_id)
+
+    entries = []
+    # cells before position are full, every entry continues where the previous one stopped
+    position = 0
+    for order in orders:
+        for order_entry in order.orderentry_set.all():
+            reported, planned = totals.get((order_entry.pk, step_id), (0, 0))
+            remaining = order_entry.quantity - reported - planned
+            while remaining > 0 and position < len(cells):
+                cell = cells[position]
+                rate = get_shift_rate(throughput, cell.machine, order_entry.detail_id)
+                quantity = min(remaining, int(cell.free * rate))
+                if quantity <= 0:
+                    # not even one detail fits in what is left of the shift
+                    position += 1
+                    continue
+                entries.append(
+                    {
+                        "date": cell.date,
+                        "machine": cell.machine,
+                        "order": order,
+                        "order_entry": order_entry,
+                        "quantity": quantity,
+                    }
+                )
+                remaining -= quantity
+                cell.free -= quantity / rate
+    return entries
+
+
+def get_schedule_operations(entries):
+    """Returns the plan_batch create operations of the proposed entries"""
+    return [
+        {
+            "op": "create",
+            "cell": {
+                "date": entry["date"].isoformat(),
+                "machine_id": entry["machine"].pk,
+                "step_id": entry["machine"].step_id,
+            },
+            "order_id": entry["order"].pk,
+            "detail_id": entry["order_entry"].detail_id,
+            "quantity": entry["quantity"],
+        }
+        for entry in entries
+    ]
@@ -1,179 +1,305 @@
 import datetime
-import logging
-import re
+import json
 from collections import defaultdict
 
-from django.db.models import F, Prefetch
-from transliterate import translit
+from django.db.models import Exists, Max, OuterRef, Q, Sum
+from django.utils.timezone import make_aware, now
 
-from .models import Machine, Order, Plan, PlanEntry, Report, ReportEntry, Step, Table
+from .cell_cache import get_row_versions, render_table_cells
+from .models import (
+    Detail,
+    Machine,
+    Order,
+    OrderLedger,
+    Plan,
+    PlanEntry,
+    ProductionRollup,
+    Report,
+    ReportEntry,
+    Step,
+    User,
+)
+from .shifts import ShiftStart, get_shift, get_shift_range, get_shifts
+from .throughput import mark_overloaded_cells
 
-logger = logging.getLogger(__name__)
+# plans older than this are not counted in leftovers anymore
+PLAN_EXPIRY = datetime.timedelta(days=1)
 
+# days of reports loaded at once in the reports journal
+REPORTS_PAGE_DAYS = 3
 
-def get_shift(timestamp: datetime.datetime):
-    shift_start = 3  # should be in UTC
-    shift_end = shift_start + 12
-    hour = timestamp.hour
-    if hour < shift_start:
-        timestamp -= datetime.timedelta(hours=12)
-        return timestamp.replace(hour=shift_end, minute=0, second=0, microsecond=0)
-    elif shift_start <= hour < shift_end:
-        return timestamp.replace(hour=shift_start, minute=0, second=0, microsecond=0)
-    elif hour >= shift_end:
-        return timestamp.replace(hour=shift_end, minute=0, second=0, microsecond=0)
 
-
-def get_html_id(date, machine) -> str:
-    return re.sub(
-        "[^(a-z)(A-Z)(0-9)._-]",
-        "",
-        date.strftime("shift-%Y-%m-%d-%H-%M-%S-") + translit(str(machine), "ru", reversed=True),
-    )
+def get_html_id(date, machine_id) -> str:
+    # unique per cell and computed without transforming the machine name
+    return f"shift-{int(date.timestamp())}-m{machine_id}"
 
 
 class TableCell:
-    def __init__(self, date=None, plan=None, report_entries=None):
-        self.report_entries = report_entries
-        if not report_entries:
-            self.report_entries = list()
-        self.plan = plan
+    """Cell of the shift table.
+
+    A cell without a saved plan is virtual: it only knows its (shift, machine, step) coordinates
+    and the plan is created on the first edit, see get_cell_plan. Cells of a slot are the shift cells
+    of the first column. Tables hold thousands of cells, the attributes are slots. The content cell partials
+    read a cell directly or its get_display.
+    """
+
+    __slots__ = ("date", "plan", "report_entries", "machine", "step_id", "slot", "overloaded", "html")
+
+    def __init__(self, date=None, plan=None, report_entries=None, machine=None, step_id=None, slot=None):
+        # most cells have no reports, they share the empty tuple
+        self.report_entries = report_entries or ()
         self.date = date
+        self.machine = machine
+        self.step_id = step_id
+        self.slot = slot
+        if slot is not None:
+            self.date = slot.start
+        if plan is not None:
+            if date is None:
+                self.date = get_shift(plan.date)
+            self.machine = plan.machine
+            self.step_id = plan.step_id
+            # unsaved or deleted plans leave a virtual cell behind
+            if plan.pk is None:
+                plan = None
+        self.plan = plan
+        # the plan takes more than a shift of the machine, see core.throughput
+        self.overloaded = False
+        # rendered by core.cell_cache
+        self.html = None
+
+    def add_report_entry(self, report_entry):
+        if not self.report_entries:
+            self.report_entries = []
+        self.report_entries.append(report_entry)
+
+    @property
+    def id(self):
+        return get_html_id(self.date, self.machine.pk)
+
+    @property
+    def plan_key(self):
+        return json.dumps(
+            {
+                "plan_id": self.plan.pk if self.plan else "",
+                "date": self.date.isoformat(),
+                "machine_id": self.machine.pk,
+                "step_id": self.step_id,
+            }
+        )
 
     def get_display(self):
-        if self.report_entries or self.plan:
+        if self.machine is not None:
             return {
-                "id": get_html_id(get_shift(self.plan.date), self.plan.machine),
+                "id": self.id,
                 "class": "done-plan",
                 "report_entries": self.report_entries,
                 "plan": self.plan,
+                "overloaded": self.overloaded,
+                "plan_key": self.plan_key,
             }
         else:
-            return {"class": "day" if self.date.hour == 3 else "night", "text": str(self.date.strftime("%d.%m"))}
+            return {
+                "class": "night" if self.slot.is_night else "day",
+                "text": str(self.date.strftime("%d.%m")),
+                "holiday": not self.slot.is_working,
+            }
 
 
-def get_shifts_table(shifts_count=28):
-    # prep and fetching
-    tbl = Table.objects.all().first()
-    from_date, step = tbl.current_date, tbl.current_step
+class ShiftGrid:
+    """
+    Content cells of a shifts table, a dense grid of TableCells indexed by (shift index, machine index).
 
-    timestamps = [from_date + datetime.timedelta(hours=12 * i) for i in range(0, shifts_count)]
-    shifts = [get_shift(timestamp) for timestamp in timestamps]
-    machines = Machine.objects.filter(step=step)
+    The cells are one flat list in row order, cells[shift_index * len(machines) + machine_index], and cells
+    are found by the start of their shift and the pk of their machine.
+    """
+
+    __slots__ = ("slots", "machines", "cells", "shift_indexes", "machine_indexes")
+
+    def __init__(self, slots, machines, step_id):
+        self.slots = slots
+        self.machines = machines
+        self.shift_indexes = {slot.start: i for i, slot in enumerate(slots)}
+        self.machine_indexes = {machine.pk: i for i, machine in enumerate(machines)}
+        self.cells = [
+            TableCell(date=slot.start, machine=machine, step_id=step_id) for slot in slots for machine in machines
+        ]
+
+    def get(self, shift, machine_id):
+        """Returns the cell of a shift start and a machine pk, None outside of the grid"""
+        shift_index = self.shift_indexes.get(shift)
+        machine_index = self.machine_indexes.get(machine_id)
+        if shift_index is None or machine_index is None:
+            return None
+        return self.cells[shift_index * len(self.machines) + machine_index]
+
+    def get_cell_rows(self):
+        """Returns the cells of each slot"""
+        width = len(self.machines)
+        return [self.cells[i * width : (i + 1) * width] for i in range(len(self.slots))]
+
+    def get_rows(self):
+        """Returns the table rows, the shift cell of the slot followed by the row's cells"""
+        return [
+            [TableCell(slot=slot).get_display(), *cells]
+            for slot, cells in zip(self.slots, self.get_cell_rows(), strict=True)
+        ]
+
+
+def get_cell_plan(data, create=False):
+    """
+    Find the plan of a shift table cell from the request data sent by the table (see TableCell plan_key).
+
+    Virtual cells return an unsaved Plan unless create is set, so reading a cell never writes.
+    """
+    plan = Plan.objects.filter(pk=data["plan_id"]).first() if data.get("plan_id") else None
+    if plan is not None:
+        return plan
+
+    # virtual cell or a plan deleted in the meantime, any time of the shift is the cell of the shift
+    cell = {
+        "date": get_shift(datetime.datetime.fromisoformat(data["date"])),
+        "machine_id": int(data["machine_id"]),
+        "step_id": int(data["step_id"]),
+    }
+    if create:
+        plan, _ = Plan.objects.get_or_create(**cell)
+        return plan
+    return Plan(**cell)
+
+
+def delete_plan_if_empty(plan):
+    # empty plans are not stored, the cell becomes virtual again
+    if plan.pk is not None and not plan.planentry_set.exists():
+        plan.delete()
 
-    table_empty_cells = {(shift, machine) for machine in machines for shift in shifts}
-    cell_dict = defaultdict(lambda: defaultdict(lambda: TableCell()))
 
-    # fetching and inserting plans
+def get_shifts_grids(slots, step_ids):
+    """
+    Returns {step_id: ShiftGrid} of the steps over the slots with rendered cells. The plans and the report entries
+    of all the steps are loaded with one query each and grouped by step in memory.
+    """
+    machines = defaultdict(list)
+    for machine in Machine.objects.filter(step_id__in=step_ids):
+        machines[machine.step_id].append(machine)
+    # cells without a plan stay virtual, nothing is written on read
+    grids = {step_id: ShiftGrid(slots, machines[step_id], step_id) for step_id in step_ids}
+    cells = [cell for grid in grids.values() for cell in grid.cells]
+    rows = {
+        (step_id, slot.start): row_cells
+        for step_id, grid in grids.items()
+        for slot, row_cells in zip(slots, grid.get_cell_rows(), strict=True)
+    }
+    # read before the plans and reports, see core.versions
+    versions = get_row_versions(rows)
+
+    # plans and reports of the shown shifts
+    window = (slots[0].start, slots[-1].end)
+
+    # fetching and inserting plans, the database finds their shifts
     plans = (
-        Plan.objects.filter(date__range=(timestamps[0], timestamps[-1]), step=step)
+        Plan.objects.filter(date__gte=window[0], date__lt=window[1], step_id__in=step_ids)
         .select_related("machine")
-        .prefetch_related("planentry_set")
-        .prefetch_related("planentry_set__detail")
+        .prefetch_related("planentry_set", "planentry_set__order", "planentry_set__detail")
+        .annotate(shift=ShiftStart("date"))
     )
     for plan in plans:
-        shift = get_shift(plan.date)
-        table_empty_cells.discard((shift, plan.machine))
-        cell_dict[shift][plan.machine].plan = plan
-
-    # --should rewrite to bulk_create
-    # filling empty cells with new Plans
-    for table_empty_cell in table_empty_cells.copy():
-        plan, created = Plan.objects.prefetch_related("planentry_set").get_or_create(
-            date=table_empty_cell[0], machine=table_empty_cell[1], step=step
-        )
-        shift = get_shift(plan.date)
-        table_empty_cells.discard((shift, plan.machine))
-        cell_dict[shift][table_empty_cell[1]].plan = plan
+        cell = grids[plan.step_id].get(plan.shift, plan.machine_id)
+        if cell is not None:
+            cell.plan = plan
 
     # fetching and inserting report_entries
     report_entries = (
-        ReportEntry.objects.filter(report__date__range=(timestamps[0], timestamps[-1]), report__step=step)
-        .select_related("detail")
-        .select_related("report__order")
-        .prefetch_related("machine")
-        .annotate(timestamp=F("report__date"))
+        ReportEntry.objects.filter(
+            report__date__gte=window[0], report__date__lt=window[1], report__step_id__in=step_ids
+        )
+        .select_related("detail", "machine", "report__order")
+        .annotate(shift=ShiftStart("report__date"))
     )
     for report_entry in report_entries:
-        shift = get_shift(report_entry.timestamp)
-        cell_dict[shift][report_entry.machine].report_entries.append(report_entry)
+        cell = grids[report_entry.report.step_id].get(report_entry.shift, report_entry.machine_id)
+        if cell is not None:
+            cell.add_report_entry(report_entry)
 
-    # preparing table for template
-    table = []
-    for shift in shifts:
-        row = [TableCell(date=shift).get_display()]
-        for machine in machines:
-            try:
-                row.append(cell_dict[shift][machine].get_display())
-            except Exception as e:
-                logger.error(f"Error processing cell for shift {shift} and machine {machine}: {str(e)}", exc_info=True)
-        table.append(row)
+    mark_overloaded_cells(cells)
+    render_table_cells(rows, versions)
+    return grids
 
-    return step.id, machines, table
 
+def get_shifts_table(from_date, step_id, shifts_count=28):
+    slots = get_shift_range(from_date, shifts_count)
+    if not step_id:
+        return step_id, [], ShiftGrid(slots, [], step_id).get_rows()
+    grid = get_shifts_grids(slots, [step_id])[step_id]
+    return step_id, grid.machines, grid.get_rows()
 
-def get_orders_display(is_active=True, order_id=None):
-    steps = Step.objects.all().order_by("id")
 
-    query = Order.objects
-
-    # TODO: remove it causes bug
-    # if order_id:
-    #     query = query.filter(id=order_id)
-
-    orders = (
-        query.filter(is_active=is_active)
-        .order_by("-id")
-        .prefetch_related(
-            "orderentry_set",
-            "orderentry_set__detail",
-            "report_set",
-            Prefetch(
-                "report_set",
-                queryset=Report.objects.prefetch_related("reportentry_set").select_related("step"),
-                to_attr="prefetched_reports",
-            ),
-            "planentry_set",
-            Prefetch(
-                "planentry_set",
-                queryset=PlanEntry.objects.prefetch_related("plan").select_related("plan__step"),
-                to_attr="prefetched_planentries",
-            ),
+def get_orders_totals(orders, is_active=True, step_id=None):
+    """
+    Returns {(order_entry_pk, step_pk): (reported, planned)} of the orders read from OrderLedger, of all steps or
+    of step_id only
+    """
+    # plans are superseded by reports of orders with the same activity
+    reported_cell = Q(reported_by_active=True) if is_active else Q(reported_by_inactive=True)
+    ledger = OrderLedger.objects.filter(order_entry__order__in=[order.pk for order in orders])
+    if step_id is not None:
+        ledger = ledger.filter(step_id=step_id)
+    ledger = (
+        ledger.filter(Q(date__isnull=True) | (Q(date__gt=now() - PLAN_EXPIRY) & ~reported_cell))
+        .values("order_entry_id", "step_id")
+        .annotate(total_reported=Sum("reported"), total_planned=Sum("planned"))
+    )
+    return {(row["order_entry_id"], row["step_id"]): (row["total_reported"], row["total_planned"]) for row in ledger}
+
+
+def get_orders_totals_recomputed(orders):
+    """Same as get_orders_totals but computed from all reports and plans of the orders, used to verify the ledger"""
+    order_ids = [order.pk for order in orders]
+
+    reported = defaultdict(int)
+    blocked_cells = set()
+    report_entries = list(
+        ReportEntry.objects.filter(report__order__in=order_ids).values_list(
+            "report__order_id", "report__step_id", "machine_id", "report__date", "detail_id", "quantity"
         )
     )
+    shifts = get_shifts([date for _, _, _, date, _, _ in report_entries])
+    for (order_id, step_id, machine_id, _, detail_id, quantity), shift in zip(report_entries, shifts, strict=True):
+        reported[(order_id, step_id, detail_id)] += quantity
+        blocked_cells.add((step_id, machine_id, shift))
+
+    planned = defaultdict(int)
+    plan_entries = list(
+        PlanEntry.objects.filter(
+            order__in=order_ids, plan__date__gt=now() - PLAN_EXPIRY, quantity__isnull=False
+        ).values_list("order_id", "plan__step_id", "plan__machine_id", "plan__date", "detail_id", "quantity")
+    )
+    shifts = get_shifts([date for _, _, _, date, _, _ in plan_entries])
+    for (order_id, step_id, machine_id, _, detail_id, quantity), shift in zip(plan_entries, shifts, strict=True):
+        if (step_id, machine_id, shift) not in blocked_cells:
+            planned[(order_id, step_id, detail_id)] += quantity
 
+    steps_by_detail = defaultdict(set)
+    for order_id, step_id, detail_id in reported.keys() | planned.keys():
+        steps_by_detail[(order_id, detail_id)].add(step_id)
+
+    totals = {}
+    for order in orders:
+        for order_entry in order.orderentry_set.all():
+            for step_id in steps_by_detail[(order.pk, order_entry.detail_id)]:
+                key = (order.pk, step_id, order_entry.detail_id)
+                totals[(order_entry.pk, step_id)] = (reported.get(key, 0), planned.get(key, 0))
+    return totals
+
+
+def get_leftovers(steps, orders, totals):
     leftovers = defaultdict(lambda: defaultdict(lambda: defaultdict(int)))
     orders_stats = defaultdict(lambda: defaultdict(lambda: defaultdict(int)))
     for step in steps:
-        blocked_cells = {
-            (get_shift(report.date), report_entry.machine)
-            for order in orders
-            for report in order.prefetched_reports
-            for report_entry in report.reportentry_set.all()
-            if report.step.pk == step.pk
-        }
         for order in orders:
             for order_entry in order.orderentry_set.all():
-                total_quantity_reported = sum(
-                    report_entry.quantity
-                    for report in order.prefetched_reports
-                    if report.step_id == step.pk
-                    for report_entry in report.reportentry_set.all()
-                    if report_entry.detail_id == order_entry.detail_id
-                )
+                total_quantity_reported, total_quantity_planned = totals.get((order_entry.pk, step.pk), (0, 0))
                 leftovers[step.pk][order_entry.pk]["reports"] = -order_entry.quantity + total_quantity_reported
-                total_quantity_planned = sum(
-                    plan_entry.quantity
-                    if (get_shift(plan_entry.plan.date), plan_entry.plan.machine) not in blocked_cells
-                    else 0
-                    for plan_entry in order.prefetched_planentries
-                    if plan_entry.detail_id == order_entry.detail_id
-                    and (
-                        plan_entry.plan.date
-                        > datetime.datetime.now(tz=datetime.timezone.utc) - datetime.timedelta(days=1)
-                    )
-                    and plan_entry.plan.step_id == step.pk
-                )
                 leftovers[step.pk][order_entry.pk]["reports_and_plans"] = (
                     -order_entry.quantity + total_quantity_reported + total_quantity_planned
                 )
@@ -186,24 +312,49 @@ def get_orders_display(is_active=True, order_id=None):
         for stats in step_stats.values():
             stats["reported_and_planned_p"] = int(stats["reported_and_planned"] / stats["total"] * 100)
             stats["reported_p"] = int(stats["reported"] / stats["total"] * 100)
-    # TODO: redo
-    if order_id:
-        return steps, orders.filter(id=order_id).first(), leftovers, orders_stats
-    return steps, orders, leftovers, orders_stats
+    return leftovers, orders_stats
 
 
-# COMPLETE REFACTOR NEEDED
-# 100+ SIMILAR QUERIES
-# REWORK PAGINATION
-def get_reports_view(user_pk=None, month=None, step_pk=None):
-    # Get reports query with all related data in one query
-    reports = (
-        Report.objects.all()
-        .select_related("user", "order", "step")
-        .prefetch_related("reportentry_set", "reportentry_set__detail", "reportentry_set__machine")
-        .order_by("-date")
+def get_orders_queryset(is_active=True):
+    orders = Order.objects.all() if is_active is None else Order.objects.filter(is_active=is_active)
+    return (
+        orders.order_by("-id")
+        .annotate(has_reports=Exists(Report.objects.filter(order=OuterRef("pk"))))
+        .prefetch_related("orderentry_set", "orderentry_set__detail")
     )
 
+
+def get_orders_display(is_active=True, order_id=None):
+    """
+    Returns steps, orders, leftovers and orders_stats of the active or inactive orders.
+
+    With order_id only that order (None if there is no such order) is loaded and computed, whatever its activity,
+    in a fixed number of queries. Plans superseded by reports of other orders are already left out in the ledger.
+    """
+    steps = Step.objects.all().order_by("id")
+
+    if order_id is not None:
+        order = get_orders_queryset(is_active=None).filter(pk=order_id).first()
+        if order is None:
+            return steps, None, {}, {}
+        totals = get_orders_totals([order], is_active=order.is_active)
+        leftovers, orders_stats = get_leftovers(steps, [order], totals)
+        return steps, order, leftovers, orders_stats
+
+    orders = get_orders_queryset(is_active=is_active)
+    leftovers, orders_stats = get_leftovers(steps, orders, get_orders_totals(orders, is_active=is_active))
+    return steps, orders, leftovers, orders_stats
+
+
+def get_month_range(month):
+    """Returns the half-open range [start, end) of a "YYYY-MM" month in the current timezone"""
+    year, month = map(int, month.split("-"))
+    start = make_aware(datetime.datetime(year, month, 1))
+    end = make_aware(datetime.datetime(year + month // 12, month % 12 + 1, 1))
+    return start, end
+
+
+def filter_reports(reports, user_pk=None, month=None, step_pk=None):
     # Filter by user if specified
     if user_pk:
         if user_pk == "-1":
@@ -211,61 +362,94 @@ def get_reports_view(user_pk=None, month=None, step_pk=None):
         else:
             reports = reports.filter(user_id=user_pk)
 
-    # Filter by month if specified
+    # Filter by month if specified, as a date range so the date indexes are used
     if month:
-        year, month = map(int, month.split("-"))
-        reports = reports.filter(date__year=year, date__month=month)
+        month_start, month_end = get_month_range(month)
+        reports = reports.filter(date__gte=month_start, date__lt=month_end)
 
     # Filter by step if specified
     if step_pk:
         reports = reports.filter(step_id=step_pk)
 
+    return reports
+
+
+def filter_production_rollup(rollup, user_pk=None, month=None, step_pk=None):
+    """filter_reports of the ProductionRollup rows, the month is a range of local days"""
+    if user_pk:
+        if user_pk == "-1":
+            rollup = rollup.filter(user__isnull=True)
+        else:
+            rollup = rollup.filter(user_id=user_pk)
+
+    if month:
+        month_start, month_end = get_month_range(month)
+        rollup = rollup.filter(day__gte=month_start.date(), day__lt=month_end.date())
+
+    if step_pk:
+        rollup = rollup.filter(step_id=step_pk)
+
+    return rollup
+
+
+def get_reports_view(user_pk=None, month=None, step_pk=None, cursor=None, days=REPORTS_PAGE_DAYS):
+    """
+    Returns the next page cursor (None on the last page) and the reports of the next `days` days grouped by day.
+    The cursor "<date>,<id>" is the last report of the previous page, reports are ordered by (date, id) descending.
+    """
+    reports = filter_reports(Report.objects.all(), user_pk=user_pk, month=month, step_pk=step_pk)
+    if cursor:
+        date, pk = cursor.split(",")
+        date = datetime.datetime.fromisoformat(date)
+        reports = reports.filter(Q(date__lt=date) | Q(date=date, pk__lt=int(pk)))
+
+    # pages hold whole days, the day after the page tells if there is a next one
+    page_days = list(reports.datetimes("date", "day", order="DESC", tzinfo=datetime.timezone.utc)[: days + 1])
+    if len(page_days) > days:
+        reports = reports.filter(date__gte=page_days[days - 1])
+
+    page = list(
+        reports.select_related("user", "order", "step")
+        .prefetch_related("reportentry_set", "reportentry_set__detail", "reportentry_set__machine")
+        .order_by("-date", "-id")
+    )
+
     # Group reports by day
     reports_by_day = {}
-    for report in reports:
+    for report in page:
         day_key = report.date.strftime("%d.%m")
         if day_key not in reports_by_day:
             reports_by_day[day_key] = []
         reports_by_day[day_key].append(report)
 
-    return None, reports_by_day
+    next_cursor = None
+    if len(page_days) > days:
+        last = page[-1]
+        next_cursor = f"{last.date.isoformat()},{last.pk}"
+    return next_cursor, reports_by_day
 
 
 def get_reports_summary(user_pk=None, month=None, step_pk=None):
-    # Get reports query with all related data in one query
-    reports = (
-        Report.objects.all()
-        .select_related("user", "step")
-        .prefetch_related("reportentry_set", "reportentry_set__detail")
-        .order_by("-date")
+    rollup = filter_production_rollup(
+        ProductionRollup.objects.filter(entries__gt=0), user_pk=user_pk, month=month, step_pk=step_pk
     )
 
-    # Apply filters
-    if user_pk:
-        if user_pk == "-1":
-            reports = reports.filter(user__isnull=True)
-        else:
-            reports = reports.filter(user_id=user_pk)
-
-    if month:
-        year, month = map(int, month.split("-"))
-        reports = reports.filter(date__year=year, date__month=month)
-
-    if step_pk:
-        reports = reports.filter(step_id=step_pk)
-
-    # Create summary dictionary
-    summary = {}
-    for report in reports:
-        for entry in report.reportentry_set.all():
-            key = (report.user, report.step, entry.detail)
-            if key not in summary:
-                summary[key] = 0
-            summary[key] += entry.quantity
+    # Sum the daily rollup per (user, step, detail) in the database
+    summary = rollup.values("user", "step", "detail").annotate(total_quantity=Sum("quantity")).order_by()
+    summary = list(summary)
+    users = User.objects.in_bulk({item["user"] for item in summary if item["user"] is not None})
+    steps = Step.objects.in_bulk({item["step"] for item in summary})
+    details = Detail.objects.in_bulk({item["detail"] for item in summary if item["detail"] is not None})
 
     # Convert to list of dicts for easier template handling
     summary_list = [
-        {"user": key[0], "step": key[1], "detail": key[2], "total_quantity": value} for key, value in summary.items()
+        {
+            "user": users.get(item["user"]),
+            "step": steps[item["step"]],
+            "detail": details.get(item["detail"]),
+            "total_quantity": item["total_quantity"],
+        }
+        for item in summary
     ]
 
     # Sort by user's name (None users last), then step ID, then detail name
@@ -281,35 +465,17 @@ def get_reports_summary(user_pk=None, month=None, step_pk=None):
 
 
 def get_reports_results(user_pk=None, month=None, step_pk=None):
-    # Get reports query with all related data in one query
-    reports = Report.objects.all().select_related("user", "step").prefetch_related("reportentry_set").order_by("-date")
-
-    # Apply filters
-    if user_pk:
-        if user_pk == "-1":
-            reports = reports.filter(user__isnull=True)
-        else:
-            reports = reports.filter(user_id=user_pk)
-
-    if month:
-        year, month = map(int, month.split("-"))
-        reports = reports.filter(date__year=year, date__month=month)
-
-    if step_pk:
-        reports = reports.filter(step_id=step_pk)
-
-    # Create summary dictionary
-    user_totals = {}
-    total_quantity = 0
-
-    for report in reports:
-        user_key = report.user.username if report.user else None
-        if user_key not in user_totals:
-            user_totals[user_key] = 0
-
-        report_total = sum(entry.quantity for entry in report.reportentry_set.all())
-        user_totals[user_key] += report_total
-        total_quantity += report_total
+    rollup = filter_production_rollup(ProductionRollup.objects.all(), user_pk=user_pk, month=month, step_pk=step_pk)
+
+    # Sum the daily rollup per user in the database, users with the latest reports first as equal totals keep
+    # this order
+    user_totals = (
+        rollup.values("user__username")
+        .annotate(total_quantity=Sum("quantity"), last_date=Max("last_date"))
+        .order_by("-last_date")
+    )
+    user_totals = {item["user__username"]: item["total_quantity"] for item in user_totals}
+    total_quantity = sum(user_totals.values())
 
     # Convert to list of dicts with percentages
     results_list = [
@@ -338,68 +504,74 @@ def get_surplus_data():
     A positive value means more details were processed in the previous step than the next one.
     A negative value means more details were processed in the next step than the previous one.
 
-    Returns:
-        - steps: List of all steps
-        - surplus_data: Dictionary with key = (previous_step, next_step), value = {detail_id: surplus}
-        - detail_names: Dictionary with key = detail_id, value = detail name
-        - detail_orders: Dictionary with key = detail_id, value = set of order information strings
+    Returns a list of step pairs: {"prev_step", "next_step", "orders"}, each order being
+    {"order_id", "order_info", "number", "details"} with details {"detail_id", "name", "surplus", "status"}
+    of non-zero surplus. Orders are sorted by number descending, details by id.
     """
     # Get all steps in order
-    steps = Step.objects.all().order_by("id")
-
-    # Get all active orders with related data
-    orders = Order.objects.filter(is_active=True).prefetch_related(
-        "report_set",
-        Prefetch(
-            "report_set",
-            queryset=Report.objects.prefetch_related("reportentry_set__detail").select_related("step"),
-            to_attr="prefetched_reports",
-        ),
+    steps = list(Step.objects.all().order_by("id"))
+
+    # Reported quantities of active orders in one grouped query of the daily rollup
+    rows = (
+        ProductionRollup.objects.filter(order__is_active=True, detail__isnull=False)
+        .values(
+            "order_id",
+            "order__name",
+            "order__number",
+            "step_id",
+            "detail_id",
+            "detail__name",
+        )
+        .annotate(quantity=Sum("quantity"))
+        .order_by()
     )
 
-    # Initialize data structures
-    surplus_data = defaultdict(lambda: defaultdict(int))
+    # {(order_id, detail_id): {step_id: quantity}}
+    quantities = defaultdict(dict)
+    orders = {}
     detail_names = {}
-    detail_orders = defaultdict(set)  # Use defaultdict(set) to store multiple orders per detail
-
-    # For each pair of consecutive steps
-    for i in range(len(steps) - 1):
-        prev_step = steps[i]
-        next_step = steps[i + 1]
-        step_pair = (prev_step, next_step)
+    for row in rows:
+        quantities[(row["order_id"], row["detail_id"])][row["step_id"]] = row["quantity"]
+        orders[row["order_id"]] = (row["order__name"], row["order__number"])
+        detail_names[row["detail_id"]] = row["detail__name"]
+
+    # {(prev_step_id, next_step_id): {order_id: [detail]}}
+    step_pairs = [(steps[i], steps[i + 1]) for i in range(len(steps) - 1)]
+    step_pair_orders = defaultdict(lambda: defaultdict(list))
+    for (order_id, detail_id), step_quantities in quantities.items():
+        for prev_step, next_step in step_pairs:
+            surplus = step_quantities.get(prev_step.id, 0) - step_quantities.get(next_step.id, 0)
+            if surplus != 0:  # Only include non-zero surplus
+                step_pair_orders[(prev_step.id, next_step.id)][order_id].append(
+                    {
+                        "detail_id": detail_id,
+                        "name": detail_names[detail_id],
+                        "surplus": surplus,
+                        "status": "positive" if surplus > 0 else "negative",
+                    }
+                )
 
-        # For each order
-        for order in orders:
-            # Format order information like "Терра № 2305"
-            order_info = f"{order.name} № {order.number}"
-
-            # Group report entries by detail_id for the previous step
-            prev_step_quantities = defaultdict(int)
-            for report in order.prefetched_reports:
-                if report.step_id == prev_step.id:
-                    for entry in report.reportentry_set.all():
-                        prev_step_quantities[entry.detail_id] += entry.quantity
-                        detail_names[entry.detail_id] = entry.detail.name
-                        # Add order information to the set for this detail
-                        detail_orders[entry.detail_id].add(order_info)
-
-            # Group report entries by detail_id for the next step
-            next_step_quantities = defaultdict(int)
-            for report in order.prefetched_reports:
-                if report.step_id == next_step.id:
-                    for entry in report.reportentry_set.all():
-                        next_step_quantities[entry.detail_id] += entry.quantity
-                        detail_names[entry.detail_id] = entry.detail.name
-                        # Add order information to the set for this detail
-                        detail_orders[entry.detail_id].add(order_info)
-
-            # Calculate surplus for each detail
-            all_detail_ids = set(prev_step_quantities.keys()) | set(next_step_quantities.keys())
-            for detail_id in all_detail_ids:
-                prev_qty = prev_step_quantities[detail_id]
-                next_qty = next_step_quantities[detail_id]
-                # Calculate surplus as prev_qty - next_qty
-                surplus_data[step_pair][detail_id] = prev_qty - next_qty
-
-    # Return the calculated data
-    return steps, surplus_data, detail_names, detail_orders
+    def order_sort_key(order_id):
+        number = orders[order_id][1]
+        return int(number) if number.isdigit() else 0, order_id
+
+    step_pairs_data = []
+    for prev_step, next_step in step_pairs:
+        pair_orders = step_pair_orders.get((prev_step.id, next_step.id), {})
+        orders_data = []
+        # Sort orders by number (descending)
+        for order_id in sorted(pair_orders, key=order_sort_key, reverse=True):
+            name, number = orders[order_id]
+            orders_data.append(
+                {
+                    "order_id": order_id,
+                    # Format order information like "Терра № 2305"
+                    "order_info": f"{name} № {number}",
+                    "number": number,
+                    # Sort details by detail_id to match order entry sequence
+                    "details": sorted(pair_orders[order_id], key=lambda detail: detail["detail_id"]),
+                }
+            )
+        step_pairs_data.append({"prev_step": prev_step, "next_step": next_step, "orders": orders_data})
+
+    return step_pairs_data
@@ -0,0 +1,187 @@
+"""
+Shift calendar of the plant.
+
+The calendar is a table of consecutive shifts (ShiftSlot) generated per UTC day from the shift templates
+(ShiftTemplate), each template's shift lasts until the start of the next one. Holidays (ShiftException) keep their
+slots, the slots are marked as not working. A shift is identified by the start of its slot, an aware datetime.
+
+Slots are generated a year ahead on deploy (rebuild_shift_calendar --extend) and on demand for a range past it.
+The receivers in core.signals update the working flag of the days of changed exceptions. Changed templates apply
+with rebuild_shift_calendar, run by the admin on save, which generates the calendar again, moves the plans to their
+shifts and rebuilds everything keyed by shift.
+
+get_shift finds the shift of one timestamp, get_shifts the shifts of a whole list against the slots of its range
+at once with numpy, and ShiftStart the shift of a datetime field in the database, an indexed range lookup on the
+slots, so queries can group by shift. numpy is imported by get_shifts on its first call, not at worker start.
+"""
+
+import datetime
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.db.models import DateTimeField, OuterRef, Subquery
+
+from .models import ShiftException, ShiftSlot, ShiftTemplate
+from .refreshes import schedule_refresh
+
+# a template's shift lasts a day at most
+MAX_SHIFT_DURATION = datetime.timedelta(days=1)
+
+
+def get_utc_day(timestamp):
+    return timestamp.astimezone(datetime.timezone.utc).date()
+
+
+def get_holidays(days):
+    """Returns {(day, template_id)} of the exceptions of the days, the template is None for whole days"""
+    return set(ShiftException.objects.filter(day__in=days).values_list("day", "template_id"))
+
+
+def is_working(holidays, day, template_id):
+    return (day, None) not in holidays and (day, template_id) not in holidays
+
+
+def generate_shift_slots(first_day, last_day):
+    """Creates the missing slots of the UTC days from first_day to last_day"""
+    templates = list(ShiftTemplate.objects.order_by("start"))
+    if not templates:
+        raise ImproperlyConfigured("The shift calendar has no shift templates")
+    days = [first_day + datetime.timedelta(days=i) for i in range((last_day - first_day).days + 1)]
+    holidays = get_holidays(days)
+
+    slots = []
+    for day in days:
+        starts = [datetime.datetime.combine(day, template.start, datetime.timezone.utc) for template in templates]
+        ends = [*starts[1:], starts[0] + datetime.timedelta(days=1)]
+        for number, (template, start, end) in enumerate(zip(templates, starts, ends, strict=True)):
+            slots.append(
+                ShiftSlot(
+                    start=start,
+                    end=end,
+                    day=day,
+                    number=number,
+                    template=template,
+                    is_night=template.is_night,
+                    is_working=is_working(holidays, day, template.pk),
+                )
+            )
+    # requests showing the same days generate them at the same time
+    ShiftSlot.objects.bulk_create(slots, batch_size=5000, ignore_conflicts=True)
+
+
+def is_covered(slots, start, end):
+    """Whether the slots in order cover [start, end] without gaps"""
+    return (
+        bool(slots)
+        and slots[0].start <= start
+        and slots[-1].end > end
+        and all(slot.end == next_slot.start for slot, next_slot in zip(slots, slots[1:], strict=False))
+    )
+
+
+def get_shift_slots(start, end, fields=None):
+    """
+    Returns the slots overlapping [start, end] in order, the missing ones are generated first.
+    fields limits the loaded fields of the slots.
+    """
+
+    def load():
+        # the slot of start begins less than a shift before it
+        slots = ShiftSlot.objects.filter(start__gt=start - MAX_SHIFT_DURATION, start__lte=end).order_by("start")
+        if fields is not None:
+            slots = slots.only(*fields)
+        return [slot for slot in slots if slot.end > start]
+
+    slots = load()
+    if not is_covered(slots, start, end):
+        generate_shift_slots(get_utc_day(start - MAX_SHIFT_DURATION), get_utc_day(end))
+        slots = load()
+        if not is_covered(slots, start, end):
+            # slots of old templates next to the new ones
+            raise ImproperlyConfigured("The shift calendar has gaps or overlaps, run rebuild_shift_calendar")
+    return slots
+
+
+def cover_shift_slots(start, end):
+    """Generates the missing slots of [start, end], ShiftStart needs the slots of the dates it looks up"""
+    get_shift_slots(start, end, fields=("start", "end"))
+
+
+def get_shift(timestamp):
+    """Returns the start of the shift of an aware timestamp"""
+    return get_shift_slots(timestamp, timestamp, fields=("start", "end"))[0].start
+
+
+def get_shifts(timestamps):
+    """Returns the starts of the shifts of a list of aware timestamps, computed on the whole list"""
+    # numpy is only needed by the bulk computations
+    import numpy as np
+
+    if not timestamps:
+        return []
+    slots = get_shift_slots(min(timestamps), max(timestamps), fields=("start", "end"))
+    starts = np.fromiter((slot.start.timestamp() for slot in slots), float, count=len(slots))
+    seconds = np.fromiter((timestamp.timestamp() for timestamp in timestamps), float, count=len(timestamps))
+    positions = np.searchsorted(starts, seconds, side="right") - 1
+    return [slots[position].start for position in positions.tolist()]
+
+
+def get_shift_ends(shifts):
+    """Returns {shift: end} of the shifts"""
+    if not shifts:
+        return {}
+    return {slot.start: slot.end for slot in get_shift_slots(min(shifts), max(shifts), fields=("start", "end"))}
+
+
+def get_shift_range(first, count):
+    """Returns the slots of count consecutive shifts from the shift of first"""
+    # a day has one shift at least
+    return get_shift_slots(first, first + datetime.timedelta(days=count))[:count]
+
+
+def get_window_slots(start, end):
+    """Returns the slots of the shifts from the shift of start to the last one starting before end"""
+    return [slot for slot in get_shift_slots(start, end) if slot.start < end]
+
+
+def move_shift(shift, count):
+    """Returns the shift count shifts after the shift of a timestamp, before it if count is negative"""
+    days = datetime.timedelta(days=abs(count) + 1)
+    slots = get_shift_slots(shift - days, shift + days, fields=("start", "end"))
+    position = next(i for i, slot in enumerate(slots) if slot.start <= shift < slot.end)
+    return slots[position + count].start
+
+
+def refresh_shift_slots_working(days):
+    """Updates the working flag of the slots of the days from their exceptions"""
+    days = {day for day in days if day is not None}
+    if not days:
+        return
+    holidays = get_holidays(days)
+    slots = list(ShiftSlot.objects.filter(day__in=days).only("day", "template_id", "is_working"))
+    for slot in slots:
+        slot.is_working = is_working(holidays, slot.day, slot.template_id)
+    ShiftSlot.objects.bulk_update(slots, ["is_working"], batch_size=1000)
+
+
+def schedule_shift_slots_refresh(days):
+    schedule_refresh(refresh_shift_slots_working, {day for day in days if day is not None})
+
+
+def rebuild_shift_calendar(first_day, last_day):
+    """Generates the slots of the UTC days from first_day to last_day from the current templates"""
+    with transaction.atomic():
+        ShiftSlot.objects.all().delete()
+        generate_shift_slots(first_day, last_day)
+
+
+class ShiftStart(Subquery):
+    """
+    Start of the shift of a datetime field, the latest slot starting before it found by an indexed range lookup
+    in the database, e.g. ReportEntry.objects.values(shift=ShiftStart("report__date")).annotate(Sum("quantity"))
+    sums per shift. The slots of the dates must exist, see cover_shift_slots.
+    """
+
+    def __init__(self, field):
+        slots = ShiftSlot.objects.filter(start__lte=OuterRef(field)).order_by("-start").values("start")[:1]
+        super().__init__(slots, output_field=DateTimeField())
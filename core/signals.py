@@ -0,0 +1,234 @@
+"""
+Receivers keeping the data derived from reports and plans up to date: the order ledger (core.ledger), the cached
+shifts table cells (core.cell_cache), the throughput (core.throughput) and the production rollup (core.rollup).
+
+pre_* receivers load the state before the change once per instance, post_* receivers schedule the refreshes
+of the old and the new state. Refreshes run once per transaction after commit, see core.refreshes.
+"""
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from .cell_cache import invalidate_cells, invalidate_table_cells
+from .ledger import get_order_cells_order_ids, schedule_order_ledger_refresh, schedule_report_entries_ledger_refresh
+from .models import (
+    Detail,
+    Machine,
+    Order,
+    OrderEntry,
+    Plan,
+    PlanEntry,
+    Report,
+    ReportEntry,
+    ShiftException,
+    Step,
+    Table,
+    User,
+)
+from .rollup import get_report_partition, invalidate_production_rollup, schedule_production_rollup_refresh
+from .shifts import get_shift, schedule_shift_slots_refresh
+from .table_state import invalidate_table_defaults
+from .throughput import schedule_throughput_refresh
+
+# report entries
+
+
+def schedule_report_entries_refresh(report_entries):
+    """Schedules the refreshes of (order_id, step_id, machine_id, date, detail_id) report entries"""
+    schedule_report_entries_ledger_refresh(
+        {(order_id, step_id, machine_id, date) for order_id, step_id, machine_id, date, _ in report_entries}
+    )
+    invalidate_cells({(step_id, machine_id, date) for _, step_id, machine_id, date, _ in report_entries})
+    schedule_throughput_refresh(
+        {(machine_id, detail_id, step_id) for _, step_id, machine_id, _, detail_id in report_entries}
+    )
+    schedule_production_rollup_refresh(
+        {get_report_partition(date, step_id) for _, step_id, _, date, _ in report_entries}
+    )
+
+
+def get_report_entry_state(instance):
+    report = instance.report
+    if report is None:
+        return set()
+    return {(report.order_id, report.step_id, instance.machine_id, report.date, instance.detail_id)}
+
+
+@receiver(pre_save, sender=ReportEntry)
+def remember_report_entry(sender, instance, **kwargs):
+    instance._old_state = set()
+    if instance.pk is not None:
+        instance._old_state = set(
+            ReportEntry.objects.filter(pk=instance.pk, report__isnull=False).values_list(
+                "report__order_id", "report__step_id", "machine_id", "report__date", "detail_id"
+            )
+        )
+
+
+@receiver(pre_delete, sender=ReportEntry)
+def remember_deleted_report_entry(sender, instance, **kwargs):
+    instance._old_state = get_report_entry_state(instance)
+
+
+@receiver(post_save, sender=ReportEntry)
+def refresh_report_entry(sender, instance, **kwargs):
+    schedule_report_entries_refresh(getattr(instance, "_old_state", set()) | get_report_entry_state(instance))
+
+
+@receiver(post_delete, sender=ReportEntry)
+def refresh_deleted_report_entry(sender, instance, **kwargs):
+    schedule_report_entries_refresh(getattr(instance, "_old_state", set()))
+
+
+# reports, their entries are moved along with them and a report without entries is still counted for its user
+
+
+@receiver(pre_save, sender=Report)
+def remember_report(sender, instance, **kwargs):
+    instance._old_state = []
+    if instance.pk is not None:
+        instance._old_state = list(
+            Report.objects.filter(pk=instance.pk).values_list(
+                "order_id", "step_id", "date", "reportentry__machine_id", "reportentry__detail_id"
+            )
+        )
+
+
+@receiver(post_save, sender=Report)
+def refresh_report(sender, instance, created, **kwargs):
+    old_state = getattr(instance, "_old_state", [])
+    partitions = {get_report_partition(instance.date, instance.step_id)}
+    partitions |= {get_report_partition(date, step_id) for _, step_id, date, _, _ in old_state}
+    schedule_production_rollup_refresh(partitions)
+    if created:
+        # a new report has no entries yet
+        return
+    entries = {(machine_id, detail_id) for _, _, _, machine_id, detail_id in old_state if machine_id or detail_id}
+    report_entries = {
+        (order_id, step_id, machine_id, date, detail_id)
+        for order_id, step_id, date, _, _ in old_state
+        for machine_id, detail_id in entries
+    }
+    report_entries |= {
+        (instance.order_id, instance.step_id, machine_id, instance.date, detail_id) for machine_id, detail_id in entries
+    }
+    schedule_report_entries_refresh(report_entries)
+
+
+@receiver(post_delete, sender=Report)
+def refresh_deleted_report(sender, instance, **kwargs):
+    # the entries are deleted with their own receivers
+    schedule_production_rollup_refresh({get_report_partition(instance.date, instance.step_id)})
+
+
+@receiver(post_delete, sender=User)
+def invalidate_user_rollup(sender, **kwargs):
+    # reports and rollup rows of the user are set to no user by the database, without signals
+    transaction.on_commit(invalidate_production_rollup)
+
+
+# plans and plan entries
+
+
+def get_plan_cells(plan_ids):
+    return set(Plan.objects.filter(pk__in=plan_ids).values_list("step_id", "machine_id", "date"))
+
+
+@receiver(pre_save, sender=PlanEntry)
+def remember_plan_entry(sender, instance, **kwargs):
+    instance._old_order_ids = set()
+    instance._old_cells = set()
+    if instance.pk is not None:
+        for order_id, *cell in PlanEntry.objects.filter(pk=instance.pk).values_list(
+            "order_id", "plan__step_id", "plan__machine_id", "plan__date"
+        ):
+            instance._old_order_ids.add(order_id)
+            instance._old_cells.add(tuple(cell))
+
+
+@receiver(post_save, sender=PlanEntry)
+@receiver(post_delete, sender=PlanEntry)
+def refresh_plan_entry(sender, instance, **kwargs):
+    schedule_order_ledger_refresh({instance.order_id} | getattr(instance, "_old_order_ids", set()))
+    # a plan deleted together with its entries invalidates its cell itself
+    invalidate_cells(get_plan_cells({instance.plan_id}) | getattr(instance, "_old_cells", set()))
+
+
+@receiver(pre_save, sender=Plan)
+def remember_plan(sender, instance, **kwargs):
+    # a plan is dated at the start of its shift, see Plan
+    instance.date = get_shift(instance.date)
+    instance._old_cells = get_plan_cells({instance.pk}) if instance.pk is not None else set()
+
+
+@receiver(post_save, sender=Plan)
+@receiver(post_delete, sender=Plan)
+def refresh_plan(sender, instance, created=False, **kwargs):
+    invalidate_cells({(instance.step_id, instance.machine_id, instance.date)} | getattr(instance, "_old_cells", set()))
+    if kwargs["signal"] is post_save and not created:
+        schedule_order_ledger_refresh(set(instance.planentry_set.values_list("order_id", flat=True)))
+
+
+# orders
+
+
+@receiver(post_save, sender=OrderEntry)
+def refresh_order_entry_order(sender, instance, **kwargs):
+    schedule_order_ledger_refresh({instance.order_id})
+
+
+@receiver(post_save, sender=Order)
+def refresh_order_cells_orders(sender, instance, created, **kwargs):
+    # plans on the cells reported by the order depend on its activity
+    if not created:
+        schedule_order_ledger_refresh(get_order_cells_order_ids(instance.pk))
+
+
+@receiver(pre_delete, sender=Order)
+def remember_order_cells_orders(sender, instance, **kwargs):
+    instance._ledger_order_ids = get_order_cells_order_ids(instance.pk) - {instance.pk}
+
+
+@receiver(post_delete, sender=Order)
+def refresh_deleted_order_cells_orders(sender, instance, **kwargs):
+    schedule_order_ledger_refresh(getattr(instance, "_ledger_order_ids", set()))
+
+
+# shifts table defaults, a deleted step is unset in Table without a Table signal
+
+
+@receiver(post_save, sender=Table)
+@receiver(post_delete, sender=Table)
+@receiver(post_delete, sender=Step)
+def invalidate_table(sender, **kwargs):
+    invalidate_table_defaults()
+
+
+# details, orders and machines are shown in every cell
+
+
+@receiver(post_save, sender=Detail)
+@receiver(post_delete, sender=Detail)
+@receiver(post_save, sender=Order)
+@receiver(post_delete, sender=Order)
+@receiver(post_save, sender=Machine)
+@receiver(post_delete, sender=Machine)
+def invalidate_all_cells(sender, **kwargs):
+    invalidate_table_cells()
+
+
+# shift calendar, see core.shifts
+
+
+@receiver(pre_save, sender=ShiftException)
+def remember_shift_exception_day(sender, instance, **kwargs):
+    instance._shift_days = set()
+    if instance.pk is not None:
+        instance._shift_days = set(ShiftException.objects.filter(pk=instance.pk).values_list("day", flat=True))
+
+
+@receiver(post_save, sender=ShiftException)
+@receiver(post_delete, sender=ShiftException)
+def refresh_shift_exception_days(sender, instance, **kwargs):
+    schedule_shift_slots_refresh({instance.day} | getattr(instance, "_shift_days", set()))
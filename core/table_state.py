@@ -0,0 +1,136 @@
+"""
+Viewport of the shifts table (first shift, step and number of shifts) and the window of the shift grid of
+several steps.
+
+Requests carry the viewport they show in the query string, the session remembers the last one of the user.
+
+The Table row only holds the defaults: the step of a session that has not picked one yet and the time of day
+the window opens at. They are kept in the default cache, core.signals drops them after commit when Table or Step
+rows are saved or deleted.
+"""
+
+import datetime
+from urllib.parse import urlencode
+
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.timezone import is_naive, localtime, make_aware, now
+
+from .models import Step, Table
+from .scripts import get_month_range
+from .shifts import get_shift, move_shift
+
+TABLE_DEFAULTS_CACHE_KEY = "table_defaults"
+# bounds how long a reader that loaded the defaults before a change can keep them
+TABLE_DEFAULTS_TIMEOUT = 60 * 5
+SESSION_DATE_KEY = "table_date"
+SESSION_STEP_KEY = "table_step_id"
+
+# the window opens this many days before today
+DEFAULT_WINDOW_OFFSET = datetime.timedelta(days=5)
+DEFAULT_SHIFTS_COUNT = 28
+MAX_SHIFTS_COUNT = 120
+# the shift grid of several steps shows a month at most
+MAX_GRID_WINDOW = datetime.timedelta(days=31)
+
+
+def get_table_defaults():
+    defaults = cache.get(TABLE_DEFAULTS_CACHE_KEY)
+    if defaults is None:
+        defaults = Table.objects.values("current_date", "current_step_id").first() or {
+            "current_date": now(),
+            "current_step_id": None,
+        }
+        cache.set(TABLE_DEFAULTS_CACHE_KEY, defaults, timeout=TABLE_DEFAULTS_TIMEOUT)
+    return defaults
+
+
+def invalidate_table_defaults():
+    transaction.on_commit(lambda: cache.delete(TABLE_DEFAULTS_CACHE_KEY))
+
+
+def get_default_table_date():
+    current_date = get_table_defaults()["current_date"]
+    return (now() - DEFAULT_WINDOW_OFFSET).replace(
+        hour=current_date.hour,
+        minute=current_date.minute,
+        second=current_date.second,
+        microsecond=current_date.microsecond,
+    )
+
+
+def get_table_step_id(request):
+    return request.session.get(SESSION_STEP_KEY) or get_table_defaults()["current_step_id"]
+
+
+class TableViewport:
+    def __init__(self, start, step_id, shifts_count=DEFAULT_SHIFTS_COUNT):
+        # aligned to the shift, so every viewer of the same shifts gets the same viewport
+        self.start = get_shift(start)
+        self.step_id = step_id
+        self.shifts_count = min(max(shifts_count, 1), MAX_SHIFTS_COUNT)
+
+    def moved(self, shifts):
+        return TableViewport(move_shift(self.start, shifts), self.step_id, self.shifts_count)
+
+    def with_step(self, step_id):
+        return TableViewport(self.start, step_id, self.shifts_count)
+
+    @property
+    def query_string(self):
+        return urlencode({"start": self.start.isoformat(), "step": self.step_id or "", "shifts": self.shifts_count})
+
+
+def get_table_viewport(request, default_start=False):
+    """
+    Returns the viewport of the request's query string, missing parts come from the session.
+    The default window is used instead of the session's start if default_start is set.
+    Raises ValueError on a malformed query string.
+    """
+    start = request.GET.get("start")
+    if start:
+        start = parse_datetime(start)
+    elif not default_start and request.session.get(SESSION_DATE_KEY):
+        start = datetime.datetime.fromisoformat(request.session[SESSION_DATE_KEY])
+    else:
+        start = get_default_table_date()
+    step_id = request.GET.get("step")
+    step_id = int(step_id) if step_id else get_table_step_id(request)
+    shifts_count = int(request.GET.get("shifts") or DEFAULT_SHIFTS_COUNT)
+    return TableViewport(start, step_id, shifts_count)
+
+
+def parse_datetime(value):
+    value = datetime.datetime.fromisoformat(value)
+    return make_aware(value) if is_naive(value) else value
+
+
+def get_grid_window(request):
+    """
+    Returns (start, end, steps) of the shift grid of the request's query string: a "YYYY-MM" month or a range
+    from and to, the current month by default, and the steps, all of them by default.
+    Raises ValueError on a malformed query string or a window longer than MAX_GRID_WINDOW.
+    """
+    # the start parameter is the viewport's
+    if request.GET.get("from"):
+        start = parse_datetime(request.GET["from"])
+        end = parse_datetime(request.GET["to"]) if request.GET.get("to") else start + MAX_GRID_WINDOW
+    else:
+        start, end = get_month_range(request.GET.get("month") or localtime().strftime("%Y-%m"))
+    if not start < end <= start + MAX_GRID_WINDOW:
+        raise ValueError(f"Invalid window {start} - {end}")
+
+    # steps=1,2 or steps=1&steps=2
+    step_ids = [int(step_id) for value in request.GET.getlist("steps") for step_id in value.split(",") if step_id]
+    steps = Step.objects.order_by("id")
+    if step_ids:
+        steps = steps.filter(pk__in=step_ids)
+    return start, end, list(steps)
+
+
+def remember_table_viewport(request, viewport):
+    # the session is only saved when it is modified
+    remembered = {SESSION_DATE_KEY: viewport.start.isoformat(), SESSION_STEP_KEY: viewport.step_id}
+    for key, value in remembered.items():
+        if request.session.get(key) != value:
+            request.session[key] = value
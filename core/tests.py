@@ -1 +1,413 @@
-# Create your tests here.
+import datetime
+from contextlib import ExitStack
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import (
+    Detail,
+    Machine,
+    Order,
+    OrderEntry,
+    Plan,
+    PlanEntry,
+    ProductionRollup,
+    Report,
+    ReportEntry,
+    ShiftException,
+    ShiftSlot,
+    ShiftTemplate,
+    Step,
+    Throughput,
+    User,
+)
+from .planning import align_plan_dates, apply_plan_operations
+from .rollup import get_rollup_month_versions
+from .scripts import TableCell, get_orders_display, get_orders_totals, get_reports_view, get_shifts_table
+from .shifts import ShiftStart, get_shift, get_shift_range, get_shifts, move_shift
+from .views import render_order_cards
+
+UTC = datetime.timezone.utc
+
+
+class ProductionTestCase(TestCase):
+    """A step with two machines, an active order of two details and a user, the shifts of migration 0012"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username="worker")
+        cls.step = Step.objects.create(name="Сборка")
+        cls.machines = Machine.objects.bulk_create([Machine(name=f"Станок {i}", step=cls.step) for i in range(2)])
+        cls.details = Detail.objects.bulk_create([Detail(name=f"Деталь {i}") for i in range(2)])
+        cls.order = Order.objects.create(name="Заказ", number=1, date=timezone.now())
+        cls.order_entries = OrderEntry.objects.bulk_create(
+            [OrderEntry(order=cls.order, detail=detail, quantity=1000) for detail in cls.details]
+        )
+        # a shift of the next days, plans older than a day no longer count
+        cls.shift = get_shift(timezone.now() + datetime.timedelta(days=2))
+
+    def create_report(self, date, quantities):
+        """Creates a report of the order with an entry per (machine, detail, quantity), receivers run on commit"""
+        with self.captureOnCommitCallbacks(execute=True):
+            report = Report.objects.create(user=self.user, order=self.order, step=self.step, date=date)
+            for machine, detail, quantity in quantities:
+                ReportEntry.objects.create(report=report, machine=machine, detail=detail, quantity=quantity)
+        return report
+
+    def create_plan(self, date, machine, quantities):
+        """Creates a plan of the order with an entry per (detail, quantity), receivers run on commit"""
+        with self.captureOnCommitCallbacks(execute=True):
+            plan = Plan.objects.create(date=date, machine=machine, step=self.step)
+            for detail, quantity in quantities:
+                PlanEntry.objects.create(plan=plan, order=self.order, detail=detail, quantity=quantity)
+        return plan
+
+    def get_totals(self):
+        return get_orders_totals([self.order])
+
+    def assert_ledger_verified(self):
+        call_command("rebuild_order_ledger", verify_only=True, stdout=StringIO())
+
+    def assert_rollup_verified(self):
+        call_command("rebuild_production_rollup", verify_only=True, stdout=StringIO())
+
+
+class ShiftCalendarTests(ProductionTestCase):
+    day = datetime.datetime(2024, 12, 2, tzinfo=UTC)
+
+    def test_shift_of_timestamp(self):
+        self.assertEqual(get_shift(self.day.replace(hour=3)), self.day.replace(hour=3))
+        self.assertEqual(get_shift(self.day.replace(hour=14, minute=59)), self.day.replace(hour=3))
+        self.assertEqual(get_shift(self.day.replace(hour=15)), self.day.replace(hour=15))
+        # the night shift of the day before
+        self.assertEqual(get_shift(self.day.replace(hour=2)), self.day - datetime.timedelta(hours=9))
+
+    def test_bulk_shifts_match_single_and_database_shifts(self):
+        timestamps = [self.day + datetime.timedelta(hours=hours, minutes=17) for hours in range(0, 72, 5)]
+        self.assertEqual(get_shifts(timestamps), [get_shift(timestamp) for timestamp in timestamps])
+
+        for timestamp in timestamps:
+            Report.objects.create(user=self.user, order=self.order, step=self.step, date=timestamp)
+        shifts = Report.objects.order_by("date").values_list(ShiftStart("date"), flat=True)
+        self.assertEqual(list(shifts), get_shifts(timestamps))
+
+    def test_move_shift(self):
+        shift = self.day.replace(hour=3)
+        self.assertEqual(move_shift(shift, 1), self.day.replace(hour=15))
+        self.assertEqual(move_shift(shift, -1), self.day - datetime.timedelta(hours=9))
+        self.assertEqual(move_shift(shift, 4), shift + datetime.timedelta(days=2))
+
+    def test_holiday_marks_the_day_not_working(self):
+        slots = get_shift_range(self.day.replace(hour=3), 4)
+        self.assertTrue(all(slot.is_working for slot in slots))
+        with self.captureOnCommitCallbacks(execute=True):
+            ShiftException.objects.create(day=self.day.date())
+        working = dict(
+            ShiftSlot.objects.filter(start__in=[slot.start for slot in slots]).values_list("start", "is_working")
+        )
+        self.assertEqual([working[slot.start] for slot in slots], [False, False, True, True])
+
+    def test_rebuild_moves_plans_to_the_new_shifts(self):
+        plan = self.create_plan(self.shift, self.machines[0], [(self.details[0], 10)])
+        ShiftTemplate.objects.filter(start=datetime.time(3)).update(start=datetime.time(4))
+        call_command("rebuild_shift_calendar", stdout=StringIO())
+
+        plan.refresh_from_db()
+        self.assertEqual(plan.date, get_shift(self.shift))
+        self.assertIn(plan.date.hour, [4, 15])
+        self.assert_ledger_verified()
+
+    def test_template_saved_in_the_admin_rebuilds_the_calendar(self):
+        self.client.force_login(User.objects.create_superuser(username="admin"))
+        template = ShiftTemplate.objects.get(start=datetime.time(3))
+        response = self.client.post(
+            reverse("admin:core_shifttemplate_change", args=[template.pk]),
+            {"name": template.name, "start": "04:00:00", "is_night": ""},
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(get_shift(self.day.replace(hour=5)), self.day.replace(hour=4))
+        self.assertEqual(get_shift(self.day.replace(hour=3, minute=30)), self.day - datetime.timedelta(hours=9))
+
+        # the calendar keeps a template
+        other = ShiftTemplate.objects.exclude(pk=template.pk).get()
+        self.client.post(reverse("admin:core_shifttemplate_delete", args=[other.pk]), {"post": "yes"})
+        response = self.client.post(reverse("admin:core_shifttemplate_delete", args=[template.pk]), {"post": "yes"})
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(list(ShiftTemplate.objects.all()), [template])
+
+
+class OrderLedgerTests(ProductionTestCase):
+    def test_reports_and_plans_update_the_ledger(self):
+        self.create_report(
+            timezone.now(), [(self.machines[0], self.details[0], 30), (self.machines[1], self.details[0], 12)]
+        )
+        self.create_plan(self.shift, self.machines[0], [(self.details[1], 50)])
+
+        totals = self.get_totals()
+        self.assertEqual(totals[(self.order_entries[0].pk, self.step.pk)], (42, 0))
+        self.assertEqual(totals[(self.order_entries[1].pk, self.step.pk)], (0, 50))
+        self.assert_ledger_verified()
+
+    def test_report_entry_edit_and_delete_refresh_the_ledger(self):
+        report = self.create_report(timezone.now(), [(self.machines[0], self.details[0], 30)])
+        entry = report.reportentry_set.get()
+        with self.captureOnCommitCallbacks(execute=True):
+            entry.quantity = 20
+            entry.detail = self.details[1]
+            entry.save()
+        self.assertEqual(self.get_totals(), {(self.order_entries[1].pk, self.step.pk): (20, 0)})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            report.delete()
+        self.assertEqual(self.get_totals(), {})
+        self.assert_ledger_verified()
+
+    def test_report_supersedes_the_plan_of_its_cell(self):
+        self.create_plan(self.shift, self.machines[0], [(self.details[0], 50)])
+        # any time of the shift is the cell of the plan
+        self.create_report(self.shift + datetime.timedelta(hours=2), [(self.machines[0], self.details[0], 10)])
+        self.assertEqual(self.get_totals(), {(self.order_entries[0].pk, self.step.pk): (10, 0)})
+        self.assert_ledger_verified()
+
+    def test_ledger_is_refreshed_once_per_transaction(self):
+        with mock.patch("core.ledger.refresh_order_ledger") as refresh, self.captureOnCommitCallbacks(execute=True):
+            report = Report.objects.create(user=self.user, order=self.order, step=self.step, date=timezone.now())
+            for machine in self.machines:
+                for detail in self.details:
+                    ReportEntry.objects.create(report=report, machine=machine, detail=detail, quantity=5)
+        refresh.assert_called_once()
+
+
+class ReportViewsTests(TransactionTestCase):
+    """The views commit a report with its entries at once, outside of a test transaction"""
+
+    # the shifts of migration 0012
+    serialized_rollback = True
+
+    def test_report_post_refreshes_once(self):
+        step = Step.objects.create(name="Сборка")
+        machine = Machine.objects.create(name="Станок", step=step)
+        details = Detail.objects.bulk_create([Detail(name=f"Деталь {i}") for i in range(5)])
+        order = Order.objects.create(name="Заказ", number=1, date=timezone.now())
+        admin = User.objects.create(username="admin", role="ADMIN")
+        self.client.force_login(admin)
+        data = {
+            "user": admin.pk,
+            "date": timezone.localtime().strftime("%Y-%m-%dT%H:%M"),
+            "order": order.pk,
+            "step": step.pk,
+            "reportentry_set-TOTAL_FORMS": len(details),
+            "reportentry_set-INITIAL_FORMS": 0,
+        }
+        for i, detail in enumerate(details):
+            data.update({f"reportentry_set-{i}-machine": machine.pk, f"reportentry_set-{i}-detail": detail.pk})
+            data[f"reportentry_set-{i}-quantity"] = 10
+
+        refreshes = [
+            "core.ledger.refresh_report_entries_ledger",
+            "core.rollup.refresh_production_rollup",
+            "core.throughput.refresh_throughput",
+            "core.cell_cache.replace_row_versions",
+        ]
+        with ExitStack() as stack:
+            mocks = {name: stack.enter_context(mock.patch(name)) for name in refreshes}
+            self.client.post(reverse("reports_add"), data)
+        self.assertEqual(ReportEntry.objects.count(), len(details))
+        for name, refresh in mocks.items():
+            with self.subTest(refresh=name):
+                refresh.assert_called_once()
+
+
+class ProductionRollupTests(ProductionTestCase):
+    def test_reports_update_the_rollup(self):
+        date = timezone.now() - datetime.timedelta(days=3)
+        report = self.create_report(
+            date, [(self.machines[0], self.details[0], 30), (self.machines[0], self.details[0], 5)]
+        )
+        self.create_report(date, [(self.machines[1], self.details[1], 7)])
+        self.assertEqual(ProductionRollup.objects.get(machine=self.machines[0]).quantity, 35)
+        self.assert_rollup_verified()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            report.date = date - datetime.timedelta(days=40)
+            report.save()
+        self.assertEqual(ProductionRollup.objects.filter(day=timezone.localdate(report.date)).count(), 1)
+        self.assert_rollup_verified()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            report.delete()
+        self.assertFalse(ProductionRollup.objects.filter(machine=self.machines[0]).exists())
+        self.assert_rollup_verified()
+
+    def test_refresh_replaces_the_version_of_the_month_only(self):
+        date = timezone.localtime().replace(day=15)
+        month = date.strftime("%Y-%m")
+        other_month = (date - datetime.timedelta(days=31)).strftime("%Y-%m")
+        versions = get_rollup_month_versions([month, other_month])
+
+        self.create_report(date, [(self.machines[0], self.details[0], 30)])
+        new_versions = get_rollup_month_versions([month, other_month])
+        self.assertNotEqual(new_versions[month], versions[month])
+        self.assertEqual(new_versions[other_month], versions[other_month])
+
+
+class PlanOperationsTests(ProductionTestCase):
+    def get_cell_key(self, date, machine):
+        return {"plan_id": "", "date": date.isoformat(), "machine_id": machine.pk, "step_id": self.step.pk}
+
+    def create_operation(self, date, machine, detail, quantity):
+        cell = self.get_cell_key(date, machine)
+        return {"op": "create", "cell": cell, "order_id": self.order.pk, "detail_id": detail.pk, "quantity": quantity}
+
+    def apply(self, operations):
+        with self.captureOnCommitCallbacks(execute=True):
+            return apply_plan_operations(operations)
+
+    def test_create_move_and_update(self):
+        cells, order_ids = self.apply(
+            [
+                self.create_operation(self.shift, self.machines[0], self.details[0], 10),
+                # another time of the same shift is the same cell
+                self.create_operation(self.shift + datetime.timedelta(hours=3), self.machines[0], self.details[1], 20),
+            ]
+        )
+        plan = Plan.objects.get()
+        self.assertEqual(plan.date, self.shift)
+        self.assertEqual(plan.planentry_set.count(), 2)
+        self.assertEqual(order_ids, {self.order.pk})
+        self.assertEqual(len(cells), 1)
+
+        entry = plan.planentry_set.get(detail=self.details[0])
+        self.apply(
+            [
+                {"op": "move", "plan_entry_id": entry.pk, "cell": self.get_cell_key(self.shift, self.machines[1])},
+                {"op": "update", "plan_entry_id": entry.pk, "quantity": 15},
+            ]
+        )
+        entry.refresh_from_db()
+        self.assertEqual((entry.plan.machine, entry.quantity), (self.machines[1], 15))
+        self.assert_ledger_verified()
+
+    def test_moving_the_last_entry_deletes_the_plan(self):
+        self.apply([self.create_operation(self.shift, self.machines[0], self.details[0], 10)])
+        entry = PlanEntry.objects.get()
+        self.apply([{"op": "move", "plan_entry_id": entry.pk, "cell": self.get_cell_key(self.shift, self.machines[1])}])
+        self.assertEqual(list(Plan.objects.values_list("machine", flat=True)), [self.machines[1].pk])
+
+    def test_invalid_operations_write_nothing(self):
+        valid = self.create_operation(self.shift, self.machines[0], self.details[0], 10)
+        invalid = [
+            {},
+            [{**valid, "order_id": 10**6}],
+            [{**valid, "detail_id": 10**6}],
+            [{**valid, "cell": {**valid["cell"], "machine_id": 10**6}}],
+            [{**valid, "quantity": -1}],
+            [{"op": "update", "plan_entry_id": 10**6, "quantity": 1}],
+        ]
+        for operations in invalid:
+            with self.subTest(operations=operations), self.assertRaises(ValueError):
+                apply_plan_operations(operations)
+        self.assertFalse(Plan.objects.exists())
+
+    def test_batch_only_accepts_post(self):
+        self.client.force_login(User.objects.create(username="admin", role="ADMIN"))
+        response = self.client.get(reverse("plan_batch"))
+        self.assertEqual((response.status_code, response["Allow"]), (405, "POST"))
+
+    def test_align_plan_dates_merges_the_plans_of_a_shift(self):
+        self.apply([self.create_operation(self.shift, self.machines[0], self.details[0], 10)])
+        # a plan created before plans were dated at the start of their shift
+        with self.captureOnCommitCallbacks(execute=True):
+            late = Plan.objects.bulk_create(
+                [Plan(date=self.shift + datetime.timedelta(hours=1), machine=self.machines[0], step=self.step)]
+            )[0]
+            PlanEntry.objects.create(plan=late, order=self.order, detail=self.details[1], quantity=5)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(align_plan_dates(), 1)
+        plan = Plan.objects.get()
+        self.assertEqual((plan.date, plan.planentry_set.count()), (self.shift, 2))
+        self.assert_ledger_verified()
+
+    def test_quantity_update_rerenders_the_cell(self):
+        Throughput.objects.create(
+            machine=self.machines[0], detail=self.details[0], step=self.step, median=80, p90=100, shifts=10
+        )
+        plan = self.create_plan(self.shift, self.machines[0], [(self.details[0], 10)])
+        entry = plan.planentry_set.get()
+        # the order cards show the progress of two steps
+        Step.objects.create(name="Покраска")
+        self.client.force_login(User.objects.create(username="admin", role="ADMIN"))
+
+        for quantity, overloaded in [(500, True), (50, False)]:
+            with self.subTest(quantity=quantity), self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post(
+                    reverse("update_plan_entry_quantity"), {"plan_entry_id": entry.pk, "quantity": quantity}
+                )
+            html = response.content.decode()
+            self.assertIn('hx-swap-oob="true"', html)
+            self.assertIn(f'id="{TableCell(plan=plan).id}-inner"', html)
+            self.assertEqual("over-capacity" in html, overloaded)
+
+    def test_entries_without_an_order_render_no_card(self):
+        with (
+            mock.patch("core.views.get_orders_display", wraps=get_orders_display) as orders_display,
+            mock.patch("core.views.render_to_string", return_value="card") as render,
+        ):
+            html = render_order_cards(None, {None, self.order.pk})
+        orders_display.assert_called_once_with(order_id=self.order.pk)
+        self.assertEqual((html, render.call_args.args[1]["order"]), ("card", self.order))
+
+
+class ReportsViewTests(ProductionTestCase):
+    def test_pages_follow_the_cursor(self):
+        start = timezone.now().replace(hour=12) - datetime.timedelta(days=10)
+        reports = [
+            self.create_report(start + datetime.timedelta(days=days, hours=hours), [])
+            for days in range(3)
+            for hours in range(2)
+        ]
+
+        pages, cursor = [], None
+        while True:
+            cursor, reports_by_day = get_reports_view(cursor=cursor, days=1)
+            pages.append([report.pk for day_reports in reports_by_day.values() for report in day_reports])
+            if cursor is None:
+                break
+        # a page per day, the newest first
+        pk = [report.pk for report in reports]
+        self.assertEqual(pages, [[pk[5], pk[4]], [pk[3], pk[2]], [pk[1], pk[0]]])
+
+
+class ShiftsTableTests(ProductionTestCase):
+    shifts_count = 28
+
+    def setUp(self):
+        self.start = get_shift_range(self.shift - datetime.timedelta(days=7), self.shifts_count)[0].start
+        for days in range(0, 14, 2):
+            date = self.start + datetime.timedelta(days=days)
+            self.create_plan(date, self.machines[days % 2], [(self.details[0], 10), (self.details[1], 20)])
+            self.create_report(date + datetime.timedelta(hours=1), [(self.machines[1], self.details[0], 5)])
+
+    def test_query_count(self):
+        # slots, machines, row versions, plans with entries, orders and details, report entries, throughput
+        with self.assertNumQueries(9):
+            step_id, machines, rows = get_shifts_table(self.start, self.step.pk, self.shifts_count)
+        self.assertEqual(len(rows), self.shifts_count)
+        self.assertEqual(sum(cell.plan is not None for row in rows for cell in row[1:]), 7)
+        self.assertEqual(sum(bool(cell.report_entries) for row in rows for cell in row[1:]), 7)
+
+    def test_cached_rows_follow_plan_changes(self):
+        get_shifts_table(self.start, self.step.pk, self.shifts_count)
+        entry = PlanEntry.objects.filter(plan__date=self.start).first()
+        with self.captureOnCommitCallbacks(execute=True):
+            entry.quantity = 987
+            entry.save()
+
+        _, _, rows = get_shifts_table(self.start, self.step.pk, self.shifts_count)
+        cell = next(cell for row in rows for cell in row[1:] if cell.plan is not None and cell.plan.pk == entry.plan_id)
+        self.assertIn("987", cell.html)
@@ -0,0 +1,136 @@
+"""
+Throughput of the machines: the quantity of a detail a machine makes at a step per shift (Throughput).
+
+The samples of a (machine_id, detail_id, step_id) key are the quantities reported per shift over
+THROUGHPUT_HISTORY, a row keeps their median and 90th percentile. The receivers in core.signals refresh the keys
+touched by a report save or delete, rebuild_throughput rebuilds the table from the whole history.
+
+Plans are measured in shifts: an entry takes quantity / median of its shift, so default quantities and the
+scheduler fill a cell up to one median shift, and a cell is overloaded when its entries take more than one shift
+even at the 90th percentile. Keys without a row fall back to the machine's shift_capacity.
+"""
+
+import datetime
+import math
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Q, Sum
+from django.utils.timezone import now
+
+from .models import ReportEntry, Throughput
+from .refreshes import schedule_refresh
+from .shifts import ShiftStart, cover_shift_slots
+
+THROUGHPUT_HISTORY = datetime.timedelta(days=180)
+
+
+def get_percentile(samples, percent):
+    """Nearest-rank percentile of the sorted samples"""
+    return samples[max(math.ceil(len(samples) * percent / 100) - 1, 0)]
+
+
+def compute_throughput(keys=None):
+    """Returns unsaved Throughput rows of the given (machine_id, detail_id, step_id) keys, of all keys if None"""
+    end = now()
+    cover_shift_slots(end - THROUGHPUT_HISTORY, end)
+    report_entries = ReportEntry.objects.filter(
+        report__date__gt=end - THROUGHPUT_HISTORY,
+        report__step__isnull=False,
+        machine__isnull=False,
+        detail__isnull=False,
+    )
+    if keys is not None:
+        report_entries = report_entries.filter(
+            machine_id__in={machine_id for machine_id, _, _ in keys},
+            detail_id__in={detail_id for _, detail_id, _ in keys},
+            report__step_id__in={step_id for _, _, step_id in keys},
+        )
+
+    # the quantities are summed per shift in the database
+    per_shift = report_entries.values(
+        "machine_id", "detail_id", "report__step_id", shift=ShiftStart("report__date")
+    ).annotate(total=Sum("quantity"))
+    samples = defaultdict(list)
+    for row in per_shift.order_by().iterator(chunk_size=5000):
+        key = (row["machine_id"], row["detail_id"], row["report__step_id"])
+        if keys is None or key in keys:
+            samples[key].append(row["total"])
+
+    throughput = []
+    for (machine_id, detail_id, step_id), quantities in samples.items():
+        quantities.sort()
+        throughput.append(
+            Throughput(
+                machine_id=machine_id,
+                detail_id=detail_id,
+                step_id=step_id,
+                median=get_percentile(quantities, 50),
+                p90=get_percentile(quantities, 90),
+                shifts=len(quantities),
+            )
+        )
+    return throughput
+
+
+def refresh_throughput(keys):
+    keys = {key for key in keys if None not in key}
+    if not keys:
+        return
+    query = Q()
+    for machine_id, detail_id, step_id in keys:
+        query |= Q(machine_id=machine_id, detail_id=detail_id, step_id=step_id)
+    with transaction.atomic():
+        Throughput.objects.filter(query).delete()
+        Throughput.objects.bulk_create(compute_throughput(keys))
+
+
+def schedule_throughput_refresh(keys):
+    schedule_refresh(refresh_throughput, {key for key in keys if None not in key})
+
+
+def rebuild_throughput():
+    with transaction.atomic():
+        Throughput.objects.all().delete()
+        Throughput.objects.bulk_create(compute_throughput(), batch_size=1000)
+
+
+def get_throughput(machine_ids, step_id):
+    """Returns {(machine_id, detail_id): (median, p90)} of the machines at the step"""
+    return {
+        (machine_id, detail_id): (median, p90)
+        for machine_id, detail_id, median, p90 in Throughput.objects.filter(
+            machine_id__in=machine_ids, step_id=step_id
+        ).values_list("machine_id", "detail_id", "median", "p90")
+    }
+
+
+def get_shift_rate(throughput, machine, detail_id, p90=False):
+    """Quantity of the detail the machine makes per shift, the median or the 90th percentile"""
+    median, p90_rate = throughput.get((machine.pk, detail_id), (None, None))
+    return max((p90_rate if p90 else median) or machine.shift_capacity, 1)
+
+
+def get_shift_load(throughput, machine, plan_entries, p90=False):
+    """Shifts the plan entries take on the machine"""
+    return sum(
+        (plan_entry.quantity or 0) / get_shift_rate(throughput, machine, plan_entry.detail_id, p90)
+        for plan_entry in plan_entries
+    )
+
+
+def mark_overloaded_cells(cells):
+    """Sets overloaded on the TableCells whose plan takes more than a shift even at the 90th percentile"""
+    planned_cells = [cell for cell in cells if cell.plan is not None]
+    if not planned_cells:
+        return
+    # the throughput of the cells of all steps in one query
+    throughputs = defaultdict(dict)
+    for step_id, machine_id, detail_id, median, p90 in Throughput.objects.filter(
+        machine_id__in={cell.machine.pk for cell in planned_cells},
+        step_id__in={cell.step_id for cell in planned_cells},
+    ).values_list("step_id", "machine_id", "detail_id", "median", "p90"):
+        throughputs[step_id][(machine_id, detail_id)] = (median, p90)
+    for cell in planned_cells:
+        load = get_shift_load(throughputs[cell.step_id], cell.machine, cell.plan.planentry_set.all(), p90=True)
+        cell.overloaded = load > 1
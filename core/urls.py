@@ -11,7 +11,6 @@ urlpatterns = [
     path("htmx/report_confirmation", views.report_confirmation, name="report_confirmation"),
     path("report_success/<int:pk>", views.report_success, name="report_success"),
     path("reports", views.reports_view, name="reports_view"),
-    path("reports/<int:page>", views.reports_view, name="reports_view"),
     path("reports/add", views.reports_add, name="reports_add"),
     path("reports/<int:pk>/edit", views.reports_edit, name="reports_edit"),
     path("reports/<int:pk>/delete", views.reports_delete, name="reports_delete"),
@@ -22,8 +21,11 @@ urlpatterns = [
     path("htmx/plan_modal", views.plan_modal, name="plan_modal"),
     path("stats/shift_table/<slug:value>", views.shift_table, name="shift_table"),
     path("stats/switch_step/<int:step>", views.switch_step, name="switch_step"),
+    path("stats/shift_grid", views.shift_grid, name="shift_grid"),
     path("stats/order_to_plan_drop", views.order_to_plan_drop, name="order_to_plan_drop"),
     path("stats/plan_to_plan_drop", views.plan_to_plan_drop, name="plan_to_plan_drop"),
+    path("stats/plan_batch", views.plan_batch, name="plan_batch"),
+    path("stats/plan_schedule", views.plan_schedule, name="plan_schedule"),
     path("orders", views.orders_view, name="orders_view"),
     path("orders/active", views.orders_view_active, name="orders_view_active"),
     path("orders/inactive", views.orders_view_inactive, name="orders_view_inactive"),
@@ -54,4 +56,5 @@ urlpatterns = [
     path("reports_results", views.reports_results, name="reports_results"),
     path("reports/results/download", views.reports_results_download, name="reports_results_download"),
     path("surplus", views.surplus, name="surplus"),
+    path("analytics", views.analytics, name="analytics"),
 ]
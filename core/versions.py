@@ -0,0 +1,36 @@
+"""
+Versions of cached data.
+
+Data is cached under the versions of what it is computed from. A change replaces the versions it touches with new
+unique ones, the data cached under the old ones is not read anymore and expires. Readers read the versions before
+the data, so a change committed in between gets a newer version than the one they cache under.
+
+Versions are kept in the database, CacheVersion, and only written by changes, never on read. They are never
+evicted, so a missing version is one that no change has written yet and reads as 0. Any process can cache data
+under them in its own memory: a change in one process replaces the versions every process reads.
+"""
+
+import time
+
+from .models import CacheVersion
+
+
+def get_new_version():
+    return time.time_ns()
+
+
+def replace_versions(keys):
+    version = get_new_version()
+    CacheVersion.objects.bulk_create(
+        [CacheVersion(key=key, version=version) for key in set(keys)],
+        update_conflicts=True,
+        unique_fields=["key"],
+        update_fields=["version"],
+    )
+
+
+def get_versions(groups):
+    """Returns {name: version} of {name: [version key]} groups, the version of a group combines its keys' versions"""
+    keys = {key for keys in groups.values() for key in keys}
+    versions = dict(CacheVersion.objects.filter(key__in=keys).values_list("key", "version")) if keys else {}
+    return {name: ":".join(str(versions.get(key, 0)) for key in keys) for name, keys in groups.items()}
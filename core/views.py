@@ -1,14 +1,17 @@
 import datetime
+import itertools
+import json
 import logging
 
-import pandas as pd
 from django.contrib import messages
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
+from django.db import transaction
 from django.http import HttpResponse, HttpResponseBadRequest, HttpResponseNotAllowed
 from django.shortcuts import get_object_or_404, redirect, render
 from django.template.loader import render_to_string
-from django.utils.timezone import make_naive, now
+from django.urls import reverse
+from django.utils.timezone import localtime, make_naive, now
 
 from core.forms import (
     DetailForm,
@@ -27,23 +30,29 @@ from .models import (
     Detail,
     Machine,
     Order,
-    Plan,
     PlanEntry,
     Report,
     ReportEntry,
     Step,
-    Table,
     User,
 )
+from .planning import apply_plan_operations
+from .scheduler import get_schedule, get_schedule_operations
 from .scripts import (
     TableCell,
+    delete_plan_if_empty,
+    get_cell_plan,
     get_orders_display,
     get_reports_results,
     get_reports_summary,
     get_reports_view,
+    get_shifts_grids,
     get_shifts_table,
     get_surplus_data,
 )
+from .shifts import get_window_slots
+from .table_state import get_grid_window, get_table_viewport, remember_table_viewport
+from .throughput import get_shift_rate, get_throughput, mark_overloaded_cells
 
 logger = logging.getLogger(__name__)
 
@@ -58,17 +67,13 @@ def home(request):
 def stats(request):
     steps, orders, leftovers, orders_stats = get_orders_display(is_active=True)
 
-    current_date = Table.objects.all().first().current_date
-    today = now()
-    today = today - datetime.timedelta(days=5)
-    today = today.replace(
-        hour=current_date.hour % 12,
-        minute=current_date.minute,
-        second=current_date.second,
-        microsecond=current_date.microsecond,
-    )
-    Table.objects.all().update(current_date=today)
-    active_step_pk, machines, table = get_shifts_table()
+    # the page opens at the default window unless the url carries a viewport, the session keeps its step
+    try:
+        viewport = get_table_viewport(request, default_start=True)
+    except ValueError:
+        return HttpResponseBadRequest("Invalid viewport")
+    remember_table_viewport(request, viewport)
+    active_step_pk, machines, table = get_shifts_table(viewport.start, viewport.step_id, viewport.shifts_count)
     context = {
         "orders": orders,
         "leftovers": leftovers,
@@ -77,6 +82,7 @@ def stats(request):
         "active_step_pk": active_step_pk,
         "machines": machines,
         "table": table,
+        "viewport": viewport,
     }
     return render(request, "core/stats.html", context)
 
@@ -113,91 +119,179 @@ def stats_orders_view_inactive(request):
     )
 
 
+def render_shifts_table(request, viewport):
+    remember_table_viewport(request, viewport)
+    active_step_pk, machines, table = get_shifts_table(viewport.start, viewport.step_id, viewport.shifts_count)
+    context = {
+        "steps": Step.objects.all(),
+        "active_step_pk": active_step_pk,
+        "machines": machines,
+        "table": table,
+        "viewport": viewport,
+    }
+    response = render(request, "core/stats.html#table", context)
+    # a reload or a shared link opens the same viewport
+    response["HX-Replace-Url"] = f"{reverse('stats')}?{viewport.query_string}"
+    return response
+
+
 @login_required(login_url="login_user")
 @allowed_user_roles(["ADMIN", "MODERATOR"])
 def shift_table(request, value):
-    current_date = Table.objects.all()[0].current_date
-    new_date = current_date + int(value) * datetime.timedelta(hours=12)
-    Table.objects.all().update(current_date=new_date)
-
-    active_step_pk, machines, table = get_shifts_table()
-    context = {"steps": Step.objects.all(), "active_step_pk": active_step_pk, "machines": machines, "table": table}
-    return render(request, "core/stats.html#table", context)
+    try:
+        viewport = get_table_viewport(request).moved(int(value))
+    except ValueError:
+        return HttpResponseBadRequest("Invalid viewport")
+    return render_shifts_table(request, viewport)
 
 
 @login_required(login_url="login_user")
 @allowed_user_roles(["ADMIN", "MODERATOR"])
 def switch_step(request, step):
-    Table.objects.all().update(current_step=step)
-
-    active_step_pk, machines, table = get_shifts_table()
-    context = {"steps": Step.objects.all(), "active_step_pk": active_step_pk, "machines": machines, "table": table}
-    response = render(request, "core/stats.html#table", context)
+    try:
+        viewport = get_table_viewport(request).with_step(step)
+    except ValueError:
+        return HttpResponseBadRequest("Invalid viewport")
+    response = render_shifts_table(request, viewport)
     response["HX-Trigger-After-Settle"] = "scroll-table"
     return response
 
 
+@login_required(login_url="login_user")
+@allowed_user_roles(["ADMIN", "MODERATOR"])
+def shift_grid(request):
+    """Shifts tables of several steps over a window, a month of every step by default"""
+    try:
+        viewport = get_table_viewport(request)
+        start, end, grid_steps = get_grid_window(request)
+    except ValueError:
+        return HttpResponseBadRequest("Invalid window")
+    grids = get_shifts_grids(get_window_slots(start, end), [step.pk for step in grid_steps]) if grid_steps else {}
+    context = {
+        "steps": Step.objects.all(),
+        "grids": [(step, grids[step.pk].machines, grids[step.pk].get_rows()) for step in grid_steps],
+        "grid_step_ids": [step.pk for step in grid_steps],
+        "grid_month": localtime(start).strftime("%Y-%m"),
+        "viewport": viewport,
+    }
+    return render(request, "core/stats.html#shift_grid", context)
+
+
+def render_order_cards(request, order_ids):
+    """Renders out-of-band swaps of the order cards whose leftovers changed, instead of the whole orders list"""
+    html = ""
+    # entries without an order have no card
+    for order_id in order_ids - {None}:
+        steps, order, leftovers, orders_stats = get_orders_display(order_id=order_id)
+        if order is None:
+            continue
+        order_context = {
+            "steps": steps,
+            "order": order,
+            "leftovers": leftovers,
+            "orders_stats": orders_stats,
+            "hx_swap_oob": True,
+        }
+        html += render_to_string("core/partials/orders_list.html#order_card", order_context, request)
+    return html
+
+
 @login_required(login_url="login_user")
 @allowed_user_roles(["ADMIN", "MODERATOR"])
 def order_to_plan_drop(request):
     detail_id = request.POST.get("detail_id")
     order_id = request.POST.get("order_id")
-    plan_id = request.POST.get("plan_id")
     leftover = int(request.POST.get("leftover", 0))  # Get leftover from the request
 
-    plan = Plan.objects.get(id=plan_id)
+    with transaction.atomic():
+        plan = get_cell_plan(request.POST, create=True)
 
-    # Set the quantity as the minimum of leftover and 400
-    leftover = max(-leftover, 0)
-    quantity = min(leftover, 400)
+        # Set the quantity as the minimum of leftover and what the machine makes of the detail in a shift
+        leftover = max(-leftover, 0)
+        throughput = get_throughput({plan.machine_id}, plan.step_id)
+        quantity = min(leftover, get_shift_rate(throughput, plan.machine, int(detail_id)))
 
-    plan_entry = PlanEntry(plan=plan, order_id=order_id, detail_id=detail_id, quantity=quantity)
-    plan_entry.save()
+        plan_entry = PlanEntry(plan=plan, order_id=order_id, detail_id=detail_id, quantity=quantity)
+        plan_entry.save()
 
-    cell = TableCell()
-    cell.plan = plan
+    cell = TableCell(plan=plan)
+    mark_overloaded_cells([cell])
     context = {
         "cell": cell.get_display(),
         "new_plan_entry_id": plan_entry.id,
     }
-    steps, order, leftovers, orders_stats = get_orders_display(order_id=order_id)
-    order_context = {
-        "steps": steps,
-        "order": order,
-        "leftovers": leftovers,
-        "orders_stats": orders_stats,
-        "hx_swap_oob": True,
-    }
     response = HttpResponse(
         render_to_string("core/stats.html#plan_cell_inner", context, request)
-        + render_to_string("core/partials/orders_list.html#order_card", order_context, request)
+        + render_order_cards(request, {plan_entry.order_id})
     )
     return response
 
 
+@login_required(login_url="login_user")
+@allowed_user_roles(["ADMIN", "MODERATOR"])
+def plan_batch(request):
+    """Applies the JSON list of plan operations in "operations" (see core.planning), returns the touched cells"""
+    if request.method == "POST":
+        try:
+            cells, order_ids = apply_plan_operations(json.loads(request.POST.get("operations", "")))
+        except (KeyError, TypeError, ValueError) as e:
+            return HttpResponseBadRequest(f"Invalid operations: {e}")
+        return HttpResponse(
+            "".join(
+                render_to_string(
+                    "core/stats.html#plan_cell_inner", {"cell": cell.get_display(), "hx_swap_oob": True}, request
+                )
+                for cell in cells
+            )
+            + render_order_cards(request, order_ids)
+        )
+
+    return HttpResponseNotAllowed(["POST"])
+
+
+@login_required(login_url="login_user")
+@allowed_user_roles(["ADMIN", "MODERATOR"])
+def plan_schedule(request):
+    """Previews the automatic plan of the shown window, accepting it posts the operations to plan_batch"""
+    try:
+        viewport = get_table_viewport(request)
+    except ValueError:
+        return HttpResponseBadRequest("Invalid table viewport")
+    entries = get_schedule(viewport.step_id, viewport.start, viewport.shifts_count)
+    context = {
+        "entries": entries,
+        "total_quantity": sum(entry["quantity"] for entry in entries),
+        "hx_vals": json.dumps({"operations": json.dumps(get_schedule_operations(entries))}),
+    }
+    return render(request, "core/partials/schedule_modal.html", context)
+
+
 @login_required(login_url="login_user")
 @allowed_user_roles(["ADMIN", "MODERATOR"])
 def plan_to_plan_drop(request):
     plan_entry_id = request.POST.get("plan_entry_id")
-    plan_id = request.POST.get("plan_id")
-    plan = Plan.objects.get(id=plan_id)
-    plan_entry = PlanEntry.objects.get(id=plan_entry_id)
-    old_plan_id = plan_entry.plan_id
-    plan_entry.plan_id = plan_id
-    plan_entry.save()
+    with transaction.atomic():
+        plan = get_cell_plan(request.POST, create=True)
+        plan_entry = PlanEntry.objects.select_related("plan").get(id=plan_entry_id)
+        old_plan = plan_entry.plan
+        plan_entry.plan = plan
+        plan_entry.save()
+        delete_plan_if_empty(old_plan)
     cell = TableCell(plan=plan)
+    old_cell = TableCell(plan=old_plan)
+    mark_overloaded_cells([cell, old_cell])
     context = {
         "cell": cell.get_display(),
     }
-    old_plan = Plan.objects.get(id=old_plan_id)
-    old_cell = TableCell(plan=old_plan)
     old_context = {
         "cell": old_cell.get_display(),
         "hx_swap_oob": True,
     }
+    # the plan may be superseded by a report in one of the cells
     response = HttpResponse(
         render_to_string("core/stats.html#plan_cell_inner", context, request)
         + render_to_string("core/stats.html#plan_cell_inner", old_context, request)
+        + render_order_cards(request, {plan_entry.order_id})
     )
     return response
 
@@ -263,14 +357,15 @@ def orders_add(request):
     if request.method == "POST":
         form = OrderForm(request.POST)
         if form.is_valid():
-            report_instance = form.save(commit=False)
-            report_instance.save()
-
-            entry_formset = OrderEntryFormset(request.POST, request.FILES, instance=report_instance)
-            if entry_formset.is_valid():
-                for entry_form in entry_formset:
-                    if entry_form.cleaned_data["DELETE"] is not True:
-                        entry_form.save()
+            with transaction.atomic():
+                report_instance = form.save(commit=False)
+                report_instance.save()
+
+                entry_formset = OrderEntryFormset(request.POST, request.FILES, instance=report_instance)
+                if entry_formset.is_valid():
+                    for entry_form in entry_formset:
+                        if entry_form.cleaned_data["DELETE"] is not True:
+                            entry_form.save()
         return redirect("stats")
 
 
@@ -309,20 +404,21 @@ def orders_edit(request, pk):
         form = OrderForm(request.POST, instance=order)
         # print(form.is_valid())
         if form.is_valid():
-            order_instance = form.save(commit=False)
-            order_instance.save()
-
-            entry_formset = OrderEntryFormset(request.POST, request.FILES, instance=order_instance)
-            # print(entry_formset.is_valid())
-            # print(entry_formset.errors)
-            if entry_formset.is_valid():
-                for entry_form in entry_formset:
-                    if entry_form.cleaned_data["DELETE"] is not True:
-                        entry_form.save()
-                    else:
-                        # print(entry_form.cleaned_data)
-                        if entry_form.cleaned_data["id"] is not None:
-                            entry_form.cleaned_data["id"].delete()
+            with transaction.atomic():
+                order_instance = form.save(commit=False)
+                order_instance.save()
+
+                entry_formset = OrderEntryFormset(request.POST, request.FILES, instance=order_instance)
+                # print(entry_formset.is_valid())
+                # print(entry_formset.errors)
+                if entry_formset.is_valid():
+                    for entry_form in entry_formset:
+                        if entry_form.cleaned_data["DELETE"] is not True:
+                            entry_form.save()
+                        else:
+                            # print(entry_form.cleaned_data)
+                            if entry_form.cleaned_data["id"] is not None:
+                                entry_form.cleaned_data["id"].delete()
         return redirect("stats")
 
 
@@ -399,15 +495,16 @@ def report_form(request):
         POST["date"] = now()
         form = ReportForm(POST)
         if form.is_valid():
-            report_instance = form.save(commit=False)
-            report_instance.save()
-
-            entry_formset = ReportEntryFormset(request.POST, request.FILES, instance=report_instance)
-            if entry_formset.is_valid():
-                for entry_form in entry_formset:
-                    if "DELETE" in entry_form.cleaned_data and entry_form.cleaned_data["DELETE"] is not True:
-                        entry_form.save()
-                messages.success(request, "Отчет успешно отправлен!")
+            with transaction.atomic():
+                report_instance = form.save(commit=False)
+                report_instance.save()
+
+                entry_formset = ReportEntryFormset(request.POST, request.FILES, instance=report_instance)
+                if entry_formset.is_valid():
+                    for entry_form in entry_formset:
+                        if "DELETE" in entry_form.cleaned_data and entry_form.cleaned_data["DELETE"] is not True:
+                            entry_form.save()
+                    messages.success(request, "Отчет успешно отправлен!")
             logout(request)
             return redirect("login_user")
         return redirect("report_form")
@@ -517,32 +614,33 @@ def reports_view(request):
     user_pk = request.GET.get("user_pk")
     month = request.GET.get("month")
     step_pk = request.GET.get("step_pk")
+    cursor = request.GET.get("cursor")
 
     # If no month is selected, default to current month
     if not month:
         month = datetime.datetime.now().strftime("%Y-%m")
 
-    _, reports_by_day = get_reports_view(user_pk=user_pk, month=month, step_pk=step_pk)
+    try:
+        next_cursor, reports_by_day = get_reports_view(user_pk=user_pk, month=month, step_pk=step_pk, cursor=cursor)
+    except ValueError:
+        return HttpResponseBadRequest("Invalid cursor")
 
+    context = {
+        "reports_by_day": reports_by_day,
+        "next_cursor": next_cursor,
+        "current_month": month,
+        "user_pk": user_pk,
+        "step_pk": step_pk,
+    }
     if request.htmx:
-        context = {
-            "reports_by_day": reports_by_day,
-            "user_pk": user_pk,
-            "step_pk": step_pk,
-        }
+        if cursor:
+            # next days requested by the infinite scroll
+            return render(request, "core/reports.html#reports_days", context)
         return render(request, "core/reports.html#reports_shifts", context)
     else:
         # initial page load
-        users = User.objects.all().order_by("username")
-        all_steps = Step.objects.all()
-        context = {
-            "reports_by_day": reports_by_day,
-            "users": users,
-            "all_steps": all_steps,
-            "current_month": month,
-            "user_pk": user_pk,
-            "step_pk": step_pk,
-        }
+        context["users"] = User.objects.all().order_by("username")
+        context["all_steps"] = Step.objects.all()
         return render(request, "core/reports.html", context)
 
 
@@ -560,15 +658,16 @@ def reports_add(request):
     if request.method == "POST":
         form = ReportForm(request.POST)
         if form.is_valid():
-            report_instance = form.save(commit=False)
-            report_instance.save()
-
-            entry_formset = ReportEntryFormset(request.POST, request.FILES, instance=report_instance)
-            if entry_formset.is_valid():
-                for entry_form in entry_formset:
-                    if entry_form.cleaned_data["DELETE"] is not True:
-                        entry_form.save()
-                messages.success(request, "Отчет успешно отправлен!")
+            with transaction.atomic():
+                report_instance = form.save(commit=False)
+                report_instance.save()
+
+                entry_formset = ReportEntryFormset(request.POST, request.FILES, instance=report_instance)
+                if entry_formset.is_valid():
+                    for entry_form in entry_formset:
+                        if entry_form.cleaned_data["DELETE"] is not True:
+                            entry_form.save()
+                    messages.success(request, "Отчет успешно отправлен!")
         return redirect("reports_view")
 
 
@@ -589,21 +688,22 @@ def reports_edit(request, pk):
         form = ReportForm(request.POST, instance=report)
         # print(form.is_valid())
         if form.is_valid():
-            report_instance = form.save(commit=False)
-            report_instance.save()
-
-            entry_formset = ReportEntryFormset(request.POST, request.FILES, instance=report_instance)
-            # print(entry_formset.is_valid())
-            # print(entry_formset.errors)
-            if entry_formset.is_valid():
-                for entry_form in entry_formset:
-                    if entry_form.cleaned_data["DELETE"] is not True:
-                        entry_form.save()
-                    else:
-                        # print(entry_form.cleaned_data)
-                        if entry_form.cleaned_data["id"] is not None:
-                            entry_form.cleaned_data["id"].delete()
-                messages.success(request, "Отчет успешно изменен!")
+            with transaction.atomic():
+                report_instance = form.save(commit=False)
+                report_instance.save()
+
+                entry_formset = ReportEntryFormset(request.POST, request.FILES, instance=report_instance)
+                # print(entry_formset.is_valid())
+                # print(entry_formset.errors)
+                if entry_formset.is_valid():
+                    for entry_form in entry_formset:
+                        if entry_form.cleaned_data["DELETE"] is not True:
+                            entry_form.save()
+                        else:
+                            # print(entry_form.cleaned_data)
+                            if entry_form.cleaned_data["id"] is not None:
+                                entry_form.cleaned_data["id"].delete()
+                    messages.success(request, "Отчет успешно изменен!")
         return redirect("reports_view")
 
 
@@ -808,52 +908,58 @@ def add_plan_entry_form(request):
 # @toast_message(success_message="План успешно обновлен", error_message="Ошибка при обновлении плана")
 def plan_modal(request):
     if request.method == "GET":
-        pk = int(str(request.GET.get("pk")))
-        plan = Plan.objects.get(pk=pk)
-        hx_target = "#" + TableCell(plan=plan).get_display()["id"]
+        plan = get_cell_plan(request.GET)
+        cell = TableCell(plan=plan).get_display()
         form = PlanForm(instance=plan)
         formset = PlanEntryFormset(instance=plan)
         context = {
             "plan": plan,
+            "plan_key": cell["plan_key"],
             "form": form,
             "formset": formset,
-            "hx_target": hx_target,
+            "hx_target": "#" + cell["id"],
         }
         return render(request, "core/partials/plan_modal.html", context)
     if request.method == "POST":
-        pk = int(str(request.POST.get("pk")))
-        plan = Plan.objects.get(pk=pk)
+        plan = get_cell_plan(request.POST)
+        # orders of the entries before and after the edit
+        order_ids = set(plan.planentry_set.values_list("order_id", flat=True)) if plan.pk is not None else set()
         form = PlanForm(request.POST, instance=plan)
         if form.is_valid():
             plan_instance = form.save(commit=False)
-            plan_instance.save()
 
             entry_formset = PlanEntryFormset(request.POST, request.FILES, instance=plan_instance)
             # print(entry_formset.is_valid())
             # print(entry_formset.errors)
             if entry_formset.is_valid():
-                for entry_form in entry_formset:
-                    if entry_form.cleaned_data["DELETE"] is not True:
-                        entry_form.save()
-                    else:
-                        # print(entry_form.cleaned_data)
-                        if entry_form.cleaned_data["id"] is not None:
-                            entry_form.cleaned_data["id"].delete()
+                with transaction.atomic():
+                    entry_forms = [
+                        entry_form for entry_form in entry_formset if entry_form.cleaned_data["DELETE"] is not True
+                    ]
+                    # virtual cells get their plan only when there is something to plan
+                    if plan.pk is None and entry_forms:
+                        plan = get_cell_plan(request.POST, create=True)
+                    elif plan.pk is not None:
+                        plan_instance.save()
+                    for entry_form in entry_formset:
+                        if entry_form in entry_forms:
+                            plan_entry = entry_form.save(commit=False)
+                            plan_entry.plan = plan
+                            plan_entry.save()
+                            order_ids.add(plan_entry.order_id)
+                        else:
+                            # print(entry_form.cleaned_data)
+                            if entry_form.cleaned_data["id"] is not None:
+                                entry_form.cleaned_data["id"].delete()
+                    delete_plan_if_empty(plan)
         cell = TableCell(plan=plan)
+        mark_overloaded_cells([cell])
         context = {
             "cell": cell.get_display(),
         }
-        steps, orders, leftovers, orders_stats = get_orders_display()
-        orders_context = {
-            "steps": steps,
-            "orders": orders,
-            "leftovers": leftovers,
-            "orders_stats": orders_stats,
-            "hx_swap_oob": True,
-        }
         return HttpResponse(
             render_to_string("core/stats.html#plan_cell_inner", context=context, request=request)
-            + render_to_string("core/partials/orders_list.html#order_list", context=orders_context, request=request)
+            + render_order_cards(request, order_ids)
         )
 
 
@@ -868,21 +974,22 @@ def update_plan_entry_quantity(request):
         plan_entry_id = request.POST.get("plan_entry_id")
         new_quantity = request.POST.get("quantity")
 
-        plan_entry = get_object_or_404(PlanEntry, id=plan_entry_id)
+        plan_entry = get_object_or_404(PlanEntry.objects.select_related("plan", "detail"), id=plan_entry_id)
         old_quantity = plan_entry.quantity
         plan_entry.quantity = new_quantity
         plan_entry.save()
 
-        steps, orders, leftovers, orders_stats = get_orders_display()
-        orders_context = {
-            "steps": steps,
-            "orders": orders,
-            "leftovers": leftovers,
-            "orders_stats": orders_stats,
+        # the over-capacity warning of the cell follows the quantity, the editor swaps nothing itself
+        cell = TableCell(plan=plan_entry.plan)
+        mark_overloaded_cells([cell])
+        context = {
+            "cell": cell.get_display(),
             "hx_swap_oob": True,
         }
-
-        response = HttpResponse(render_to_string("core/partials/orders_list.html#order_list", orders_context, request))
+        response = HttpResponse(
+            render_to_string("core/stats.html#plan_cell_inner", context, request)
+            + render_order_cards(request, {plan_entry.order_id})
+        )
         response.toast_data = {
             "detail_name": plan_entry.detail.name,
             "old_quantity": old_quantity,
@@ -943,54 +1050,36 @@ def reports_summary(request):
 @login_required(login_url="login_user")
 @allowed_user_roles(["ADMIN", "MODERATOR"])
 def reports_summary_download(request):
+    # openpyxl is only loaded by the workers serving downloads
+    from .exports import export_response
+
     user_pk = request.GET.get("user_pk")
     month = request.GET.get("month")
     step_pk = request.GET.get("step_pk")
 
     summary_list = get_reports_summary(user_pk=user_pk, month=month, step_pk=step_pk)
-
-    # Convert summary data to pandas DataFrame
-    data = []
-    for item in summary_list:
-        data.append(
-            {
-                "Пользователь": item["user"].username if item["user"] else "Без пользователя",
-                "Этап": item["step"].name,
-                "Деталь": item["detail"].name,
-                "Количество": item["total_quantity"],
-            }
-        )
-
-    df = pd.DataFrame(data)
-
-    # Add total row
     total_quantity = sum(item["total_quantity"] for item in summary_list)
-    total_row = pd.DataFrame([{"Пользователь": "ИТОГО", "Этап": "", "Деталь": "", "Количество": total_quantity}])
-    df = pd.concat([total_row, df], ignore_index=True)
-
-    # Create response
-    response = HttpResponse(content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
-    response["Content-Disposition"] = f"attachment; filename=reports_summary_{month}.xlsx"
-
-    # Write to excel
-    with pd.ExcelWriter(response, engine="openpyxl") as writer:
-        df.to_excel(writer, index=False, sheet_name="Сводка")
-        worksheet = writer.sheets["Сводка"]
-
-        # Adjust column widths
-        for column in worksheet.columns:
-            max_length = 0
-            column = [cell for cell in column]
-            for cell in column:
-                try:
-                    if len(str(cell.value)) > max_length:
-                        max_length = len(str(cell.value))
-                except Exception as e:
-                    logger.error(e)
-            adjusted_width = max_length + 2
-            worksheet.column_dimensions[column[0].column_letter].width = adjusted_width
 
-    return response
+    # total row first, then the summary
+    rows = itertools.chain(
+        [("ИТОГО", "", "", total_quantity)],
+        (
+            (
+                item["user"].username if item["user"] else "Без пользователя",
+                item["step"].name,
+                item["detail"].name,
+                item["total_quantity"],
+            )
+            for item in summary_list
+        ),
+    )
+    return export_response(
+        request.GET.get("format"),
+        f"reports_summary_{month}",
+        "Сводка",
+        ("Пользователь", "Этап", "Деталь", "Количество"),
+        rows,
+    )
 
 
 @login_required(login_url="login_user")
@@ -1038,126 +1127,81 @@ def reports_results(request):
 @login_required(login_url="login_user")
 @allowed_user_roles(["ADMIN", "MODERATOR"])
 def reports_results_download(request):
+    # openpyxl is only loaded by the workers serving downloads
+    from .exports import export_response
+
     user_pk = request.GET.get("user_pk")
     month = request.GET.get("month")
 
     results_list, total_quantity, avg_per_user, active_users_count = get_reports_results(user_pk=user_pk, month=month)
 
-    # Convert to pandas DataFrame
-    data = []
-    for item in results_list:
-        data.append(
-            {
-                "Пользователь": item["username"] if item["username"] else "Без пользователя",
-                "Общее количество": item["total_quantity"],
-                "% от общего": f"{item['percentage']:.1f}%",
-            }
-        )
-
-    df = pd.DataFrame(data)
-
-    # Add statistics rows
-    stats_data = pd.DataFrame(
+    # statistics rows first, then the results
+    rows = itertools.chain(
         [
-            {"Пользователь": "ИТОГО", "Общее количество": total_quantity, "% от общего": "100%"},
-            {"Пользователь": "Среднее на пользователя", "Общее количество": avg_per_user, "% от общего": ""},
-            {"Пользователь": "Активных пользователей", "Общее количество": active_users_count, "% от общего": ""},
-        ]
+            ("ИТОГО", total_quantity, "100%"),
+            ("Среднее на пользователя", avg_per_user, ""),
+            ("Активных пользователей", active_users_count, ""),
+        ],
+        (
+            (
+                item["username"] if item["username"] else "Без пользователя",
+                item["total_quantity"],
+                f"{item['percentage']:.1f}%",
+            )
+            for item in results_list
+        ),
+    )
+    return export_response(
+        request.GET.get("format"),
+        f"reports_results_{month}",
+        "Результаты",
+        ("Пользователь", "Общее количество", "% от общего"),
+        rows,
     )
-    df = pd.concat([stats_data, df], ignore_index=True)
-
-    # Create response
-    response = HttpResponse(content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
-    response["Content-Disposition"] = f"attachment; filename=reports_results_{month}.xlsx"
-
-    # Write to excel
-    with pd.ExcelWriter(response, engine="openpyxl") as writer:
-        df.to_excel(writer, index=False, sheet_name="Результаты")
-        worksheet = writer.sheets["Результаты"]
-
-        # Adjust column widths
-        for column in worksheet.columns:
-            max_length = 0
-            column = [cell for cell in column]
-            for cell in column:
-                try:
-                    if len(str(cell.value)) > max_length:
-                        max_length = len(str(cell.value))
-                except Exception as e:
-                    logger.error(e)
-            adjusted_width = max_length + 2
-            worksheet.column_dimensions[column[0].column_letter].width = adjusted_width
-
-    return response
 
 
 @login_required(login_url="login_user")
 @allowed_user_roles(["ADMIN", "MODERATOR"])
-def surplus(request):
-    # Get surplus data for active orders
-    steps, surplus_data, detail_names, detail_orders = get_surplus_data()
-
-    # Group details by step pair, then by order
-    step_pair_orders = {}
-
-    # For each step pair, organize details by order
-    for i in range(len(steps) - 1):
-        prev_step = steps[i]
-        next_step = steps[i + 1]
-        step_pair = (prev_step, next_step)
-
-        # Create structure for this step pair if it doesn't exist
-        if step_pair not in step_pair_orders:
-            step_pair_orders[step_pair] = {}
-
-        for detail_id, surplus in surplus_data[step_pair].items():
-            if surplus != 0:  # Only include non-zero surplus
-                for order_info in detail_orders.get(detail_id, set()):
-                    # Create list for this order if it doesn't exist
-                    if order_info not in step_pair_orders[step_pair]:
-                        step_pair_orders[step_pair][order_info] = []
-
-                    # Add detail to this order for this step pair
-                    step_pair_orders[step_pair][order_info].append(
-                        {
-                            "detail_id": detail_id,  # Include detail_id for sorting
-                            "name": detail_names[detail_id],
-                            "surplus": surplus,
-                            "status": "positive" if surplus > 0 else "negative",
-                        }
-                    )
-
-    # Final data structure for template
-    step_pairs_data = []
-
-    # Process each step pair in order
-    for i in range(len(steps) - 1):
-        prev_step = steps[i]
-        next_step = steps[i + 1]
-        step_pair = (prev_step, next_step)
-
-        if step_pair not in step_pair_orders:
-            continue  # Skip if no data for this step pair
-
-        # Sort orders by number (descending)
-        orders = sorted(
-            step_pair_orders[step_pair].keys(),
-            key=lambda x: int(x.split("№")[1].strip()) if "№" in x else 0,
-            reverse=True,
-        )
+def analytics(request):
+    """Production of a range of months per user, step or detail with its deltas, see core.analytics"""
+    # pandas is only loaded by the workers serving analytics
+    from .analytics import ANALYTICS_GROUPS, get_analytics_range_start, get_production_analytics
 
-        # Process orders for this step pair
-        orders_data = []
-        for order_info in orders:
-            # Sort details by detail_id to match order entry sequence
-            details = step_pair_orders[step_pair][order_info]
-            details.sort(key=lambda x: x["detail_id"])
+    user_pk = request.GET.get("user_pk")
+    step_pk = request.GET.get("step_pk")
+    group = request.GET.get("group") or "user"
+    # the last twelve months by default
+    month_to = request.GET.get("month_to") or datetime.datetime.now().strftime("%Y-%m")
+    try:
+        month_from = request.GET.get("month_from") or get_analytics_range_start(month_to)
+        production = get_production_analytics(month_from, month_to, group, user_pk=user_pk, step_pk=step_pk)
+    except (KeyError, ValueError) as e:
+        return HttpResponseBadRequest(f"Invalid analytics range: {e}")
 
-            orders_data.append({"order_info": order_info, "details": details})
+    context = {
+        "analytics": production,
+        "group_title": ANALYTICS_GROUPS[group][1],
+        "group": group,
+        "user_pk": user_pk,
+        "step_pk": step_pk,
+    }
+    if request.htmx:
+        return render(request, "core/analytics.html#analytics", context)
+    context.update(
+        {
+            "users": User.objects.all().order_by("username"),
+            "all_steps": Step.objects.all(),
+            "month_from": month_from,
+            "month_to": month_to,
+        }
+    )
+    return render(request, "core/analytics.html", context)
 
-        # Add step pair with its orders
-        step_pairs_data.append({"prev_step": prev_step, "next_step": next_step, "orders": orders_data})
 
-    context = {"step_pairs_data": step_pairs_data}
+@login_required(login_url="login_user")
+@allowed_user_roles(["ADMIN", "MODERATOR"])
+def surplus(request):
+    # Get surplus data for active orders
+    context = {"step_pairs_data": get_surplus_data()}
 
     return render(request, "core/surplus.html", context)
@@ -1,4 +1,5 @@
 import os
+import tempfile
 from pathlib import Path
 
 import sentry_sdk
@@ -85,6 +86,20 @@ DATABASES = {
     }
 }
 
+# file based by default, so the workers of a container share it without another service
+CACHES = {
+    "default": {
+        "BACKEND": os.getenv("CACHE_BACKEND", "django.core.cache.backends.filebased.FileBasedCache"),
+        "LOCATION": os.getenv("CACHE_LOCATION", str(Path(tempfile.gettempdir()) / "django_cache")),
+    },
+    # rendered shifts table rows, see core.cell_cache. Each worker keeps its own, their versions are in the database
+    "fragments": {
+        "BACKEND": os.getenv("FRAGMENT_CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"),
+        "LOCATION": os.getenv("FRAGMENT_CACHE_LOCATION", "fragments"),
+        "OPTIONS": {"MAX_ENTRIES": int(os.getenv("FRAGMENT_CACHE_MAX_ENTRIES", "2000"))},
+    },
+}
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         "NAME": "django.contrib.auth.password_validation.MinimumLengthValidator",
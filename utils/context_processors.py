@@ -1,6 +1,6 @@
 from django.conf import settings
 
-from core.models import Table
+from core.table_state import get_table_step_id
 
 
 def debug_context_processor(request):
@@ -8,4 +8,5 @@ def debug_context_processor(request):
 
 
 def active_step_pk_context_processor(request):
-    return {"active_step_pk": Table.objects.first().current_step.pk}
+    # session or cached defaults, never a query
+    return {"active_step_pk": get_table_step_id(request)}